@@ -4,16 +4,13 @@ from flask_migrate import Migrate
 from config import Config
 import os
 from PIL import Image
-import tensorflow as tf
-import logging
 
 # Disable GPU
 os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
 
-# Disable TensorFlow logging
+# Disable TensorFlow logging. TensorFlow itself is imported lazily by the
+# background warm-up (app/warmup.py), which also applies the rest of its setup.
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # 0=all, 1=no INFO, 2=no INFO/WARN, 3=no INFO/WARN/ERROR
-tf.get_logger().setLevel(logging.ERROR)
-tf.config.set_visible_devices([], 'GPU')
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -22,7 +19,7 @@ Config.init_app(app)  # Create necessary directories
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
-from app import routes, models
+from app import routes, models, commands
 
 # Create necessary directories
 static_img_dir = os.path.join(app.static_folder, 'img')
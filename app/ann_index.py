@@ -0,0 +1,287 @@
+import os
+import numpy as np
+
+
+def _sq_distances(queries, vectors, vector_sq_norms=None):
+    """Squared Euclidean distances between two sets of rows, via one matmul"""
+    if vector_sq_norms is None:
+        vector_sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+    q_norms = np.einsum('ij,ij->i', queries, queries)
+    sq = q_norms[:, None] - 2.0 * (queries @ vectors.T) + vector_sq_norms[None, :]
+    np.maximum(sq, 0.0, out=sq)
+    return sq
+
+
+def kmeans(vectors, n_clusters, n_iter=20, seed=0):
+    """Plain Lloyd's k-means with k-means++ seeding; returns float32 centroids"""
+    rng = np.random.default_rng(seed)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    n_clusters = min(n_clusters, n)
+
+    centroids = np.empty((n_clusters, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(n)]
+    closest = _sq_distances(vectors, centroids[:1])[:, 0]
+    for i in range(1, n_clusters):
+        total = closest.sum()
+        if total <= 0:
+            centroids[i] = vectors[rng.integers(n)]
+        else:
+            centroids[i] = vectors[rng.choice(n, p=closest / total)]
+        np.minimum(closest, _sq_distances(vectors, centroids[i:i + 1])[:, 0], out=closest)
+
+    for _ in range(n_iter):
+        assignment = _sq_distances(vectors, centroids).argmin(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        empty = counts == 0
+        counts[empty] = 1
+        updated = sums / counts[:, None].astype(np.float32)
+        # Re-seed empty clusters from random points rather than letting them die
+        if empty.any():
+            updated[empty] = vectors[rng.integers(n, size=int(empty.sum()))]
+        if np.allclose(updated, centroids, atol=1e-6):
+            centroids = updated
+            break
+        centroids = updated
+    return np.ascontiguousarray(centroids, dtype=np.float32)
+
+
+class IVFIndex:
+    """Approximate nearest-neighbour index using an inverted file (IVF).
+
+    Vectors are partitioned into n_lists cells by a k-means coarse quantizer;
+    a query only scans the nprobe cells whose centroids are closest to it.
+    Inserts are incremental, deletes are tombstones that compact() reclaims,
+    and the whole index round-trips through a single .npz file.
+
+    Until enough vectors have been added to train the quantizer
+    (min_train_size) the index keeps everything in one cell, which makes
+    search exact.
+    """
+
+    def __init__(self, dim, n_lists=256, nprobe=8, metric='cosine', min_train_size=None,
+                 compact_threshold=0.2):
+        if metric not in ('euclidean', 'cosine'):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.metric = metric
+        self.min_train_size = min_train_size or 39 * n_lists
+        self.compact_threshold = compact_threshold
+
+        self.centroids = None
+        self._size = 0
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._labels = np.empty(0, dtype=np.int64)
+        self._cells = np.empty(0, dtype=np.int32)
+        self._alive = np.empty(0, dtype=bool)
+        self._row_of = {}
+        self._lists = None
+        self._n_deleted = 0
+
+    def __len__(self):
+        return self._size - self._n_deleted
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _prepare(self, vectors):
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+        if self.metric == 'cosine':
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def _reserve(self, extra):
+        """Grow the backing arrays geometrically so inserts stay amortised O(1)"""
+        needed = self._size + extra
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 1024)
+
+        def grow(array, shape, dtype):
+            grown = np.zeros(shape, dtype=dtype)
+            grown[:self._size] = array[:self._size]
+            return grown
+
+        self._vectors = grow(self._vectors, (capacity, self.dim), np.float32)
+        self._sq_norms = grow(self._sq_norms, capacity, np.float32)
+        self._ids = grow(self._ids, capacity, np.int64)
+        self._labels = grow(self._labels, capacity, np.int64)
+        self._cells = grow(self._cells, capacity, np.int32)
+        self._alive = grow(self._alive, capacity, bool)
+
+    def _assign(self, vectors):
+        if not self.is_trained:
+            return np.zeros(len(vectors), dtype=np.int32)
+        return _sq_distances(vectors, self.centroids).argmin(axis=1).astype(np.int32)
+
+    def train(self, vectors=None, seed=0):
+        """(Re)train the coarse quantizer and reassign every live vector"""
+        if vectors is None:
+            vectors = self._vectors[:self._size][self._alive[:self._size]]
+        else:
+            vectors = self._prepare(vectors)
+        if len(vectors) == 0:
+            return
+        sample_size = min(len(vectors), 256 * self.n_lists)
+        sample = vectors[np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)]
+        self.centroids = kmeans(sample, self.n_lists, seed=seed)
+        self._cells[:self._size] = self._assign(self._vectors[:self._size])
+        self._lists = None
+
+    def add(self, vectors, ids, labels):
+        """Insert vectors under external ids; re-adding an id replaces it"""
+        vectors = self._prepare(vectors)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        labels = np.asarray(labels, dtype=np.int64).reshape(-1)
+        if not (len(vectors) == len(ids) == len(labels)):
+            raise ValueError("vectors, ids and labels must have the same length")
+
+        self.remove([i for i in ids.tolist() if i in self._row_of])
+        self._reserve(len(ids))
+        start, end = self._size, self._size + len(ids)
+        self._vectors[start:end] = vectors
+        self._sq_norms[start:end] = np.einsum('ij,ij->i', vectors, vectors)
+        self._ids[start:end] = ids
+        self._labels[start:end] = labels
+        self._cells[start:end] = self._assign(vectors)
+        self._alive[start:end] = True
+        for row, vector_id in enumerate(ids.tolist(), start):
+            self._row_of[vector_id] = row
+        self._size = end
+        self._lists = None
+
+        if not self.is_trained and len(self) >= self.min_train_size:
+            self.train()
+
+    def remove(self, ids):
+        """Tombstone vectors by external id; compacts once enough are dead"""
+        for vector_id in ids:
+            row = self._row_of.pop(int(vector_id), None)
+            if row is not None:
+                self._alive[row] = False
+                self._n_deleted += 1
+        if self._size and self._n_deleted / self._size > self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Physically drop tombstoned rows and rebuild the inverted lists"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._vectors = np.ascontiguousarray(self._vectors[keep])
+        self._sq_norms = self._sq_norms[keep]
+        self._ids = self._ids[keep]
+        self._labels = self._labels[keep]
+        self._cells = self._cells[keep]
+        self._alive = self._alive[keep]
+        self._size = len(keep)
+        self._n_deleted = 0
+        self._row_of = {int(vector_id): row for row, vector_id in enumerate(self._ids.tolist())}
+        self._lists = None
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            cells = self._cells[:self._size]
+            order = np.argsort(cells, kind='stable').astype(np.int64)
+            n_cells = self.n_lists if self.is_trained else 1
+            bounds = np.searchsorted(cells[order], np.arange(n_cells + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(n_cells)]
+        return self._lists
+
+    def _distances(self, query, rows):
+        vectors = self._vectors[rows]
+        if self.metric == 'cosine':
+            return 1.0 - vectors @ query
+        return np.sqrt(_sq_distances(query[None, :], vectors, self._sq_norms[rows])[0])
+
+    def search(self, queries, k=1, aggregate=None, nprobe=None):
+        """Return approximate k nearest neighbours for each query.
+
+        Results use the same shape as GalleryMatcher.search: lists of
+        {'label', 'distance', 'id'} dicts sorted by distance. aggregate='min'
+        collapses results to one entry per label.
+        """
+        if aggregate not in (None, 'min'):
+            raise ValueError(f"Unsupported aggregate for IVFIndex: {aggregate}")
+        single = np.asarray(queries).ndim == 1
+        queries = self._prepare(queries)
+        lists = self._inverted_lists()
+        nprobe = min(nprobe or self.nprobe, len(lists))
+
+        if self.is_trained:
+            probes = np.argpartition(_sq_distances(queries, self.centroids), nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.zeros((len(queries), 1), dtype=np.int64)
+
+        results = []
+        for query, cells in zip(queries, probes):
+            rows = np.concatenate([lists[cell] for cell in cells])
+            rows = rows[self._alive[rows]]
+            if len(rows) == 0:
+                results.append([])
+                continue
+            dist = self._distances(query, rows)
+            order = np.argsort(dist)
+            hits = []
+            seen = set()
+            for i in order:
+                label = int(self._labels[rows[i]])
+                if aggregate == 'min':
+                    if label in seen:
+                        continue
+                    seen.add(label)
+                hits.append({'label': label, 'distance': float(dist[i]), 'id': int(self._ids[rows[i]])})
+                if len(hits) == k:
+                    break
+            results.append(hits)
+        return results[0] if single else results
+
+    def save(self, path):
+        """Persist the index atomically to a .npz file"""
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path,
+            meta=np.array([self.dim, self.n_lists, self.nprobe, self.min_train_size], dtype=np.int64),
+            metric=np.array(self.metric),
+            compact_threshold=np.array(self.compact_threshold),
+            centroids=self.centroids if self.is_trained else np.empty((0, self.dim), dtype=np.float32),
+            vectors=self._vectors[:self._size],
+            ids=self._ids[:self._size],
+            labels=self._labels[:self._size],
+            cells=self._cells[:self._size],
+            alive=self._alive[:self._size]
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            dim, n_lists, nprobe, min_train_size = (int(v) for v in data['meta'])
+            index = cls(dim, n_lists=n_lists, nprobe=nprobe, metric=str(data['metric']),
+                        min_train_size=min_train_size,
+                        compact_threshold=float(data['compact_threshold']))
+            if len(data['centroids']):
+                index.centroids = np.ascontiguousarray(data['centroids'], dtype=np.float32)
+            index._vectors = np.ascontiguousarray(data['vectors'], dtype=np.float32)
+            index._ids = data['ids'].astype(np.int64)
+            index._labels = data['labels'].astype(np.int64)
+            index._cells = data['cells'].astype(np.int32)
+            index._alive = data['alive'].astype(bool)
+        index._size = len(index._ids)
+        index._sq_norms = np.einsum('ij,ij->i', index._vectors, index._vectors)
+        index._n_deleted = int((~index._alive).sum())
+        index._row_of = {int(vector_id): row for row, vector_id in enumerate(index._ids.tolist())
+                         if index._alive[row]}
+        return index
+
+    def ids(self):
+        """Return the external ids of all live vectors"""
+        return set(self._row_of)
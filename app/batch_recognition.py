@@ -0,0 +1,152 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from facecore.batch_recognition import init_worker, recognize_files
+
+
+def iter_image_files(root, extensions):
+    """Yield image paths under root depth-first in a stable order, one directory at a time"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            print(f"Could not read directory {directory}: {str(e)}")
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif '.' in entry.name and entry.name.rsplit('.', 1)[1].lower() in extensions:
+                yield entry.path
+        stack.extend(reversed(subdirs))
+
+
+def read_completed(output_path):
+    """Return the paths already recorded in a JSONL results file.
+
+    A line torn by an interrupted run is cut off, so the file can be
+    appended to again.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    good_size = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            good_size += len(line)
+            try:
+                completed.add(json.loads(line)['path'])
+            except (ValueError, KeyError):
+                continue
+    if good_size < os.path.getsize(output_path):
+        with open(output_path, 'r+b') as f:
+            f.truncate(good_size)
+    return completed
+
+
+class DirectoryRecognizer:
+    """Recognizes every image under a directory with a pool of worker processes.
+
+    The directory is walked lazily and files are handed out in chunks of
+    chunk_size, with at most two chunks per worker in flight, so the walk
+    never has to finish before recognition starts. Each worker is a
+    spawned process that loads TensorFlow and the current model version
+    once, with threads_per_worker TensorFlow threads, so N workers keep
+    N x threads cores busy without oversubscribing them. Results are appended to a
+    JSONL file, one record per image, which doubles as the resume
+    checkpoint: with resume=True, images already in it are skipped.
+    """
+
+    def __init__(self, root, output_path, extensions, workers=None, threads_per_worker=None, chunk_size=16,
+                 resume=False, progress_interval=5, log=print):
+        self.root = root
+        self.output_path = output_path
+        self.extensions = set(extensions)
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.chunk_size = chunk_size
+        self.resume = resume
+        self.progress_interval = progress_interval
+        self.log = log
+        self.stats = {'images': 0, 'faces': 0, 'errors': 0, 'skipped': 0}
+
+    def _chunks(self, completed):
+        chunk = []
+        for path in iter_image_files(self.root, self.extensions):
+            if os.path.relpath(path, self.root) in completed:
+                self.stats['skipped'] += 1
+                continue
+            chunk.append(path)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _write(self, output, records):
+        for record in records:
+            output.write(json.dumps(record) + '\n')
+            self.stats['images'] += 1
+            if 'error' in record:
+                self.stats['errors'] += 1
+            else:
+                self.stats['faces'] += len(record['faces'])
+        output.flush()
+
+    def _report(self, started, final=False):
+        elapsed = time.monotonic() - started
+        rate = self.stats['images'] / elapsed if elapsed else 0.0
+        self.log(f"{'Done: ' if final else ''}{self.stats['images']} images "
+                 f"({rate:.1f} images/s), {self.stats['faces']} faces, {self.stats['errors']} errors"
+                 + (f", {self.stats['skipped']} already done" if self.stats['skipped'] else ''))
+
+    def run(self):
+        completed = read_completed(self.output_path) if self.resume else set()
+        if completed:
+            self.log(f"Resuming: {len(completed)} images already in {self.output_path}")
+
+        from app.model_registry import model_registry
+        from app.models import Person
+        model = model_registry.current_files()
+        if model is None:
+            raise Exception("Model not loaded. Please train the model first.")
+        # Classifier labels are person ids; face_recognition_tf labels are names
+        names = {str(person.id): person.name for person in Person.query.all()}
+
+        # Workers are spawned and never import the app; they get the model
+        # files and names from here
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=init_worker, initargs=(self.threads_per_worker, model, names))
+        self.log(f"Recognizing {self.root} with {self.workers} workers x {self.threads_per_worker} threads")
+        started = time.monotonic()
+        last_report = started
+        pending = set()
+        try:
+            with open(self.output_path, 'a' if self.resume else 'w') as output:
+                for chunk in self._chunks(completed):
+                    pending.add(pool.submit(recognize_files, chunk, self.root))
+                    if len(pending) >= self.workers * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._write(output, future.result())
+                        if time.monotonic() - last_report >= self.progress_interval:
+                            self._report(started)
+                            last_report = time.monotonic()
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._write(output, future.result())
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+        self._report(started, final=True)
+        return self.stats
@@ -0,0 +1,135 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError
+import numpy as np
+
+
+class BatcherOverloaded(Exception):
+    """Raised when the batcher's request queue is full"""
+
+
+class MicroBatcher:
+    """Dynamic micro-batching for concurrent single-sample inference.
+
+    Callers submit one sample each; a worker thread collects pending samples
+    until it has max_batch_size of them or max_wait_ms has passed since the
+    first one arrived, runs predict_fn once on the stacked batch and hands
+    each caller its own row of the output.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5, max_queue_size=256,
+                 stats_window=1000):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._waits = deque(maxlen=stats_window)
+        self._batch_sizes = deque(maxlen=stats_window)
+        self._counters = {'requests': 0, 'batches': 0, 'rejected': 0, 'errors': 0, 'timed_out': 0}
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+
+    def submit(self, sample):
+        """Queue one sample and return a Future for its prediction"""
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((np.asarray(sample), future, time.perf_counter()))
+        except queue.Full:
+            with self._stats_lock:
+                self._counters['rejected'] += 1
+            raise BatcherOverloaded(f"Inference queue is full ({self.max_queue_size} pending requests)")
+        return future
+
+    def predict(self, sample, timeout=None):
+        """Submit one sample and block until its prediction is ready.
+
+        Raises TimeoutError after timeout seconds; a sample still queued by
+        then is dropped instead of being run for nobody.
+        """
+        future = self.submit(sample)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            with self._stats_lock:
+                self._counters['timed_out'] += 1
+            raise
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [item for item in self._collect() if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            with self._stats_lock:
+                self._counters['requests'] += len(batch)
+                self._counters['batches'] += 1
+                self._batch_sizes.append(len(batch))
+                self._waits.extend(started - enqueued for _, _, enqueued in batch)
+
+            try:
+                outputs = self.predict_fn(np.stack([sample for sample, _, _ in batch]))
+            except Exception as e:
+                with self._stats_lock:
+                    self._counters['errors'] += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), output in zip(batch, outputs):
+                future.set_result(output)
+
+    def stats(self):
+        """Return counters plus queue-wait and batch-size distributions over the recent window"""
+        with self._stats_lock:
+            waits = np.array(self._waits) * 1000.0
+            sizes = np.array(self._batch_sizes)
+            stats = dict(self._counters)
+
+        stats.update({
+            'queue_depth': self._queue.qsize(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'max_queue_size': self.max_queue_size
+        })
+        if len(waits):
+            stats['queue_wait_ms'] = {
+                'mean': float(waits.mean()),
+                'p50': float(np.percentile(waits, 50)),
+                'p95': float(np.percentile(waits, 95)),
+                'max': float(waits.max())
+            }
+        if len(sizes):
+            stats['batch_size'] = {
+                'mean': float(sizes.mean()),
+                'max': int(sizes.max()),
+                'histogram': {int(size): int(count) for size, count in zip(*np.unique(sizes, return_counts=True))}
+            }
+        return stats
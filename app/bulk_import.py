@@ -0,0 +1,300 @@
+import importlib.util
+import multiprocessing
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from app import db
+from app.models import Person, PersonImage
+from app.face_crop_store import face_crop_store
+from app.encoding_cache import encoding_cache
+from app.dataset_fingerprint import content_hashes
+from facecore.bulk_import import init_worker, prepare_image
+
+
+def _entry_person(name):
+    """Split an archive or directory entry 'person/file.jpg' into (person, filename).
+
+    The person is the entry's parent directory, so archives with an extra
+    top-level folder ('faces/alice/1.jpg') work too. Returns None for
+    entries that are not inside a person directory or are hidden.
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part]
+    if len(parts) < 2 or any(part.startswith('.') or part == '__MACOSX' for part in parts):
+        return None
+    return parts[-2], parts[-1]
+
+
+def iter_directory(root):
+    """Yield (person, filename, path) for root/<person>/<file>, walking lazily"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            entry = _entry_person(os.path.relpath(path, root))
+            if entry is not None:
+                yield entry[0], entry[1], path
+
+
+class _LimitedReader:
+    """Read-only file wrapper that fails once more than max_bytes have been read.
+
+    Content-Length is absent from a chunked upload, so the size of a
+    request body is only known while it is read.
+    """
+
+    def __init__(self, fileobj, max_bytes):
+        self.fileobj = fileobj
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise Exception('Archive too large')
+        return data
+
+
+def iter_tar(fileobj, max_file_bytes):
+    """Yield (person, filename, bytes) from a tar stream, optionally compressed, without seeking"""
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            entry = _entry_person(member.name)
+            if entry is None:
+                continue
+            if member.size > max_file_bytes:
+                yield entry[0], entry[1], None
+                continue
+            yield entry[0], entry[1], archive.extractfile(member).read()
+
+
+def iter_zip(fileobj, max_file_bytes):
+    """Yield (person, filename, bytes) from a zip archive.
+
+    Zip archives keep their index at the end, so a stream that cannot seek
+    is spooled to a temporary file first; members are then read one at a time.
+    """
+    if not (hasattr(fileobj, 'seekable') and fileobj.seekable()):
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(fileobj, spool, 1 << 20)
+        spool.seek(0)
+        fileobj = spool
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            entry = _entry_person(info.filename)
+            if entry is None:
+                continue
+            if info.file_size > max_file_bytes:
+                yield entry[0], entry[1], None
+                continue
+            yield entry[0], entry[1], archive.read(info)
+
+
+def iter_archive(fileobj, filename='', max_file_bytes=16 * 1024 * 1024, max_bytes=None):
+    """Yield entries of a zip or tar(.gz/.bz2/.xz) archive, picked by file name.
+
+    With max_bytes, reading more than that many bytes of the archive fails.
+    """
+    if max_bytes is not None:
+        fileobj = _LimitedReader(fileobj, max_bytes)
+    if filename.lower().endswith('.zip'):
+        return iter_zip(fileobj, max_file_bytes)
+    return iter_tar(fileobj, max_file_bytes)
+
+
+class BulkImporter:
+    """Enrolls a stream of (person, filename, bytes or path) entries in bulk.
+
+    Entries are decoded, face-checked and saved by a pool of worker
+    processes, with at most max_in_flight entries held in memory, so an
+    archive is never extracted as a whole. Prepared images are inserted in
+    chunks of chunk_size rows per transaction. The face crops and
+    face_recognition encodings the workers already computed go into the
+    face crop store and the encoding cache every store_every images, and
+    on_chunk is then called with those PersonImage rows. encode_faces
+    defaults to whether the face_recognition package is installed. Images
+    go to the existing person with the same name, or to a new one. run()
+    is a generator yielding progress after every chunk; the caller needs
+    an app context.
+    """
+
+    def __init__(self, app, extensions, workers=None, chunk_size=500, max_in_flight=None,
+                 require_face=True, encode_faces=None, store_every=2000, on_chunk=None):
+        self.app = app
+        self.extensions = set(extensions)
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_in_flight = max_in_flight or self.workers * 4
+        self.require_face = require_face
+        if encode_faces is None:
+            encode_faces = importlib.util.find_spec('face_recognition') is not None
+        self.encode_faces = encode_faces
+        self.store_every = store_every
+        self.on_chunk = on_chunk
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self._ready = []
+        self._unstored = []
+        self._person_ids = None
+        self.stats = {
+            'seen': 0,
+            'imported': 0,
+            'duplicates': 0,
+            'skipped': 0,
+            'invalid': 0,
+            'no_face': 0,
+            'too_large': 0,
+            'persons_created': 0,
+            'errors': []
+        }
+
+    def _reject(self, reason, person, filename, error=None):
+        self.stats[reason] += 1
+        if len(self.stats['errors']) < 20:
+            self.stats['errors'].append({'person': person, 'file': filename, 'reason': error or reason})
+
+    def _collect(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.stats['invalid'] += 1
+            if len(self.stats['errors']) < 20:
+                self.stats['errors'].append({'reason': str(e)})
+            return
+        if result['status'] == 'ok':
+            self._ready.append(result)
+        else:
+            self._reject(result['status'], result['person'], result['filename'])
+
+    def _resolve_persons(self, names):
+        """Return {name: person_id}, creating persons that do not exist yet"""
+        if self._person_ids is None:
+            self._person_ids = {}
+            for person_id, name in db.session.query(Person.id, Person.name).order_by(Person.id):
+                self._person_ids.setdefault(name, person_id)
+        new_persons = [Person(name=name) for name in sorted(set(names) - set(self._person_ids))]
+        if new_persons:
+            db.session.add_all(new_persons)
+            db.session.flush()
+            for person in new_persons:
+                self._person_ids[person.name] = person.id
+            self.stats['persons_created'] += len(new_persons)
+        return self._person_ids
+
+    def _flush(self, rows):
+        """Insert one chunk of prepared images as one transaction"""
+        paths = [row['image_path'] for row in rows]
+        existing = {path for (path,) in db.session.query(PersonImage.image_path)
+                    .filter(PersonImage.image_path.in_(paths))}
+        fresh = {}
+        for row in rows:
+            if row['image_path'] in existing or row['image_path'] in fresh:
+                self.stats['duplicates'] += 1
+            else:
+                fresh[row['image_path']] = row
+        if not fresh:
+            return
+
+        try:
+            person_ids = self._resolve_persons(row['person'] for row in fresh.values())
+            now = datetime.utcnow()
+            db.session.bulk_insert_mappings(PersonImage, [
+                {'image_path': path, 'person_id': person_ids[row['person']], 'created_at': now}
+                for path, row in fresh.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._person_ids = None
+            raise
+
+        images = PersonImage.query.filter(PersonImage.image_path.in_(list(fresh))).all()
+        for image in images:
+            # Held until _store; detached, the next commit does not expire them
+            db.session.expunge(image)
+            self._unstored.append((image, fresh[image.image_path]))
+        self.stats['imported'] += len(images)
+        if len(self._unstored) >= self.store_every:
+            self._store()
+
+    def _store(self):
+        """Write the crops and encodings of inserted images to their stores, then report the images.
+
+        Each store rewrites its whole index, so this runs every store_every
+        images rather than every chunk.
+        """
+        stored, self._unstored = self._unstored, []
+        if not stored:
+            return
+        face_crop_store.put_crops([
+            (image.id, row['crop'], row['face_found'], row['signature']) for image, row in stored
+        ])
+        encoding_cache.put_encodings([
+            (image.image_path, image.person_id, row['sha1'], row['signature'], row['encoding'])
+            for image, row in stored if 'encoding' in row
+        ])
+        # The dataset fingerprint of the next /retrain need not hash these files again
+        hashes = content_hashes(self.app)
+        hashes.put([(os.path.join(self.upload_folder, image.image_path), row['signature'], row['sha1'])
+                    for image, row in stored])
+        hashes.save()
+        if self.on_chunk is not None:
+            self.on_chunk([image for image, _ in stored])
+
+    def _progress(self, started):
+        elapsed = time.monotonic() - started
+        return dict(self.stats, elapsed_seconds=round(elapsed, 1),
+                    images_per_second=round(self.stats['imported'] / elapsed, 1) if elapsed else 0.0)
+
+    def run(self, entries):
+        os.makedirs(os.path.join(self.upload_folder, 'faceimages'), exist_ok=True)
+        started = time.monotonic()
+        # Forking the threaded web process can copy a lock some other thread
+        # holds, so workers are spawned; their tasks never import the app
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=init_worker)
+        pending = set()
+        try:
+            for person, filename, source in entries:
+                self.stats['seen'] += 1
+                if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in self.extensions:
+                    self._reject('skipped', person, filename, 'unsupported file type')
+                    continue
+                if source is None:
+                    self._reject('too_large', person, filename)
+                    continue
+                pending.add(pool.submit(prepare_image, person, filename, source,
+                                        self.upload_folder, self.require_face, self.encode_faces))
+                if len(pending) >= self.max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._collect(future)
+                    while len(self._ready) >= self.chunk_size:
+                        rows, self._ready = self._ready[:self.chunk_size], self._ready[self.chunk_size:]
+                        self._flush(rows)
+                        yield self._progress(started)
+            for future in pending:
+                self._collect(future)
+            pending = set()
+            while self._ready:
+                rows, self._ready = self._ready[:self.chunk_size], self._ready[self.chunk_size:]
+                self._flush(rows)
+            self._store()
+            yield dict(self._progress(started), done=True)
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+            # Images already inserted keep their crops and encodings when the import stops early
+            try:
+                self._store()
+            except Exception as e:
+                print(f"Error storing face crops of imported images: {str(e)}")
@@ -0,0 +1,139 @@
+import os
+import sys
+from contextlib import ExitStack
+import click
+from app import app
+from app.resource_scheduler import apply_cpu_budget
+
+
+@app.cli.command('inference-server')
+def inference_server():
+    """Run the shared inference process web workers send recognition batches to.
+
+    Start it once per machine, e.g. WARMUP_ON_START=0 flask inference-server,
+    and point the web workers at the same INFERENCE_SERVER_SOCKET.
+    """
+    socket_path = app.config.get('INFERENCE_SERVER_SOCKET')
+    if not socket_path:
+        raise Exception("Set INFERENCE_SERVER_SOCKET to the Unix socket path to listen on")
+
+    apply_cpu_budget(app, 'inference')
+    from app.inference_server import InferenceServer
+    from app.model_registry import model_registry
+
+    with app.app_context():
+        model_registry.current()
+    InferenceServer(
+        socket_path,
+        model_registry,
+        max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+        max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS'],
+        max_queue_size=app.config['INFERENCE_MAX_QUEUE_SIZE'],
+        timeout=app.config['INFERENCE_TIMEOUT']
+    ).serve_forever()
+
+
+@app.cli.command('training-worker')
+@click.option('--exit-when-idle', is_flag=True, help='Exit after TRAINING_WORKER_IDLE_TIMEOUT seconds without jobs.')
+def training_worker(exit_when_idle):
+    """Run queued training jobs in this process, one at a time."""
+    from app.training_jobs import TrainingJobRunner
+    TrainingJobRunner(
+        app,
+        poll_interval=app.config['TRAINING_POLL_INTERVAL'],
+        idle_timeout=app.config['TRAINING_WORKER_IDLE_TIMEOUT'] if exit_when_idle else None
+    ).run_forever()
+
+
+@app.cli.command('import-faces')
+@click.argument('source')
+@click.option('--workers', type=int, help='Worker processes (default: BULK_IMPORT_WORKERS or one per CPU).')
+@click.option('--chunk-size', type=int, help='Images inserted per transaction (default: BULK_IMPORT_CHUNK_SIZE).')
+@click.option('--allow-no-face', is_flag=True, help='Also enroll images in which no face is detected.')
+def import_faces(source, workers, chunk_size, allow_no_face):
+    """Bulk-enroll labelled faces from SOURCE.
+
+    SOURCE is a directory or a zip/tar(.gz) archive laid out as
+    <name>/<image>, or '-' to read a tar stream from stdin.
+    """
+    from app.bulk_import import BulkImporter, iter_archive, iter_directory
+    from app.routes import ALLOWED_EXTENSIONS
+
+    importer = BulkImporter(
+        app,
+        ALLOWED_EXTENSIONS,
+        workers=workers or app.config['BULK_IMPORT_WORKERS'],
+        chunk_size=chunk_size or app.config['BULK_IMPORT_CHUNK_SIZE'],
+        store_every=app.config['BULK_IMPORT_STORE_EVERY'],
+        require_face=not allow_no_face
+    )
+    max_file_bytes = app.config['BULK_IMPORT_MAX_FILE_BYTES']
+    with app.app_context(), ExitStack() as stack:
+        if source == '-':
+            entries = iter_archive(sys.stdin.buffer, '', max_file_bytes)
+        elif os.path.isdir(source):
+            entries = iter_directory(source)
+        else:
+            entries = iter_archive(stack.enter_context(open(source, 'rb')), source, max_file_bytes)
+        for progress in importer.run(entries):
+            click.echo(f"{progress['imported']} imported, {progress['duplicates']} duplicates, "
+                       f"{progress['invalid'] + progress['no_face'] + progress['too_large'] + progress['skipped']} "
+                       f"rejected of {progress['seen']} seen ({progress['images_per_second']} images/s)")
+    for error in importer.stats['errors']:
+        click.echo(f"  {error.get('person', '')}/{error.get('file', '')}: {error['reason']}")
+    click.echo(f"Created {importer.stats['persons_created']} persons; "
+               f"{importer.stats['no_face']} images without a face, {importer.stats['invalid']} unreadable")
+
+
+@app.cli.command('recognize-dir')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--output', '-o', required=True, type=click.Path(dir_okay=False), help='JSONL file to write results to.')
+@click.option('--workers', type=int, help='Worker processes (default: one per CPU).')
+@click.option('--threads-per-worker', type=int, help='TensorFlow threads per worker (default: CPUs / workers).')
+@click.option('--chunk-size', default=16, show_default=True, help='Images per task and forward pass.')
+@click.option('--resume', is_flag=True, help='Skip images already recorded in the output file and append to it.')
+@click.option('--progress-interval', default=5.0, show_default=True, help='Seconds between progress reports.')
+def recognize_dir(directory, output, workers, threads_per_worker, chunk_size, resume, progress_interval):
+    """Recognize every face in the images under DIRECTORY, offline.
+
+    Writes one JSON record per image, with the faces found and who they
+    are, to the output file. Run with WARMUP_ON_START=0 so this process
+    does not also load the model.
+    """
+    from app.batch_recognition import DirectoryRecognizer
+    from app.routes import ALLOWED_EXTENSIONS
+
+    DirectoryRecognizer(
+        directory,
+        output,
+        ALLOWED_EXTENSIONS,
+        workers=workers,
+        threads_per_worker=threads_per_worker,
+        chunk_size=chunk_size,
+        resume=resume,
+        progress_interval=progress_interval,
+        log=lambda message: click.echo(message, err=True)
+    ).run()
+
+
+@app.cli.command('recognize-video')
+@click.argument('video', type=click.Path(exists=True, dir_okay=False))
+@click.option('--detect-every', type=int, help='Run the face detector every N processed frames (default: VIDEO_DETECT_EVERY).')
+@click.option('--classify-per-track', type=int, help='Classifications per tracked face (default: VIDEO_CLASSIFY_PER_TRACK).')
+@click.option('--frame-stride', type=int, help='Process every Nth frame (default: VIDEO_FRAME_STRIDE).')
+def recognize_video(video, detect_every, classify_per_track, frame_stride):
+    """Identify the people in a video file and print the tracks as JSON."""
+    import json
+    apply_cpu_budget(app, 'inference')
+    from app.face_recognition_utils import FaceRecognitionSystem
+    from app.routes import video_options
+    from app.video_recognition import name_tracks
+
+    options = video_options()
+    for name, value in (('detect_every', detect_every), ('classify_per_track', classify_per_track),
+                        ('frame_stride', frame_stride)):
+        if value:
+            options[name] = value
+    with app.app_context():
+        result = name_tracks(FaceRecognitionSystem(app).recognize_video(video, **options))
+    click.echo(json.dumps(result, indent=2))
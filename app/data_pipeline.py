@@ -0,0 +1,187 @@
+import fcntl
+import glob
+import hashlib
+import os
+import numpy as np
+import tensorflow as tf
+from app.models import Person
+
+IMG_SIZE = (224, 224)
+AUTOTUNE = tf.data.AUTOTUNE
+
+# Open .inuse lock files of the dataset caches this process reads, by (cache_dir, tag)
+_cache_locks = {}
+
+
+def gallery_records(upload_folder):
+    """Collect training records straight from the PersonImage rows.
+
+    Returns (paths, labels, class_names) where labels index into
+    class_names, the string person ids in sorted order (the same order
+    flow_from_directory used for the per-person directories).
+    """
+    persons = sorted(Person.query.all(), key=lambda p: str(p.id))
+    paths = []
+    labels = []
+    class_names = []
+    for person in persons:
+        person_paths = [os.path.join(upload_folder, image.image_path) for image in person.images]
+        person_paths = [path for path in person_paths if os.path.exists(path)]
+        if not person_paths:
+            continue
+        paths.extend(person_paths)
+        labels.extend([len(class_names)] * len(person_paths))
+        class_names.append(str(person.id))
+    return paths, labels, class_names
+
+
+def split_records(paths, labels, validation_split=0.2, seed=0):
+    """Deterministic per-class train/validation split.
+
+    Every class keeps at least one training image; classes with a single
+    image contribute nothing to validation.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    train_idx = []
+    val_idx = []
+    for label in np.unique(labels):
+        idx = np.flatnonzero(labels == label)
+        rng.shuffle(idx)
+        n_val = min(int(len(idx) * validation_split), len(idx) - 1)
+        val_idx.extend(idx[:n_val])
+        train_idx.extend(idx[n_val:])
+    train_idx.sort()
+    val_idx.sort()
+    pick = lambda idx: ([paths[i] for i in idx], labels[idx].tolist())
+    return pick(train_idx), pick(val_idx)
+
+
+def decode_image(path, image_size=IMG_SIZE):
+    """Read, decode and resize one image file to a uint8 RGB tensor"""
+    data = tf.io.read_file(path)
+    img = tf.io.decode_image(data, channels=3, expand_animations=False)
+    img = tf.image.resize(img, image_size)
+    return tf.cast(tf.clip_by_value(tf.round(img), 0, 255), tf.uint8)
+
+
+def create_augmenter():
+    """Random flips, rotations, shifts and zooms equivalent to the old ImageDataGenerator setup"""
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip('horizontal'),
+        tf.keras.layers.RandomRotation(20 / 360, fill_mode='nearest'),
+        tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode='nearest'),
+        tf.keras.layers.RandomZoom(0.2, fill_mode='nearest')
+    ])
+
+
+def _try_exclusive(lock_file):
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _remove_cache(cache_path, keep_lock=False):
+    """Delete the files of one tf.data file cache, complete or not"""
+    for path in glob.glob(glob.escape(cache_path) + '.*') + glob.glob(glob.escape(cache_path) + '_*'):
+        if keep_lock and path == cache_path + '.inuse':
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def dataset_cache_path(cache_dir, paths, labels, tag):
+    """Return a tf.data cache file name unique to this exact list of records.
+
+    tf.data file caches are keyed only by name, so a changed gallery must get
+    a new name. The process holds a shared flock on <name>.inuse until it
+    asks for another cache with the same tag, and caches with the same tag
+    that no process holds are removed. A cache nobody holds that has no
+    index was left half-written by a crashed run; its files, including the
+    lockfile that would make tf.data refuse to write it again, are removed.
+    """
+    digest = hashlib.sha1()
+    for path, label in zip(paths, labels):
+        digest.update(f'{path}\0{label}\0{os.path.getmtime(path)}\n'.encode())
+    name = f'{tag}_{digest.hexdigest()[:16]}'
+    cache_path = os.path.join(cache_dir, name)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    held = _cache_locks.pop((cache_dir, tag), None)
+    if held is not None:
+        held.close()
+    lock_file = open(cache_path + '.inuse', 'a')
+    if _try_exclusive(lock_file) and not os.path.exists(cache_path + '.index'):
+        _remove_cache(cache_path, keep_lock=True)
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    _cache_locks[(cache_dir, tag)] = lock_file
+
+    names = {os.path.basename(path)[:len(name)] for path in glob.glob(os.path.join(cache_dir, f'{tag}_*'))}
+    for stale in sorted(names - {name}):
+        stale_path = os.path.join(cache_dir, stale)
+        with open(stale_path + '.inuse', 'a') as stale_lock:
+            if _try_exclusive(stale_lock):
+                _remove_cache(stale_path)
+    return cache_path
+
+
+def make_dataset(paths, labels, num_classes, preprocess=None, batch_size=32, training=False,
+                 augment=False, cache=None, shuffle_buffer=1024, seed=None):
+    """Build a parallel tf.data input pipeline from image paths and integer labels.
+
+    Decoding and resizing run in parallel map calls; the decoded uint8
+    images can be cached in memory (cache='') or in a file (cache=path) so
+    later epochs skip decoding entirely. Training datasets are reshuffled
+    every epoch and optionally augmented; everything is prefetched.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((list(paths), np.asarray(labels, dtype=np.int32)))
+    dataset = dataset.map(
+        lambda path, label: (decode_image(path), tf.one_hot(label, num_classes)),
+        num_parallel_calls=AUTOTUNE
+    )
+    if cache is not None:
+        dataset = dataset.cache(cache)
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return _batch_dataset(dataset, preprocess, batch_size, augment)
+
+
+def make_crop_dataset(crops, labels, num_classes, preprocess=None, batch_size=32, training=False,
+                      augment=False, seed=None):
+    """Build a tf.data input pipeline from stored uint8 crops (e.g. FaceCropStore rows).
+
+    crops is a sequence of (224, 224, 3) uint8 arrays, typically memmap
+    views, so nothing is decoded and only the rows of each batch are read.
+    Training datasets shuffle the full index every epoch.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((np.arange(len(crops)), np.asarray(labels, dtype=np.int32)))
+    if training:
+        dataset = dataset.shuffle(len(crops), seed=seed, reshuffle_each_iteration=True)
+
+    def read_crop(index, label):
+        img = tf.numpy_function(lambda i: np.asarray(crops[i]), [index], tf.uint8)
+        img.set_shape(IMG_SIZE + (3,))
+        return img, tf.one_hot(label, num_classes)
+
+    dataset = dataset.map(read_crop, num_parallel_calls=AUTOTUNE)
+    return _batch_dataset(dataset, preprocess, batch_size, augment)
+
+
+def _batch_dataset(dataset, preprocess, batch_size, augment):
+    """Batch uint8 (image, target) pairs, then cast, augment, preprocess and prefetch"""
+    dataset = dataset.batch(batch_size)
+
+    dataset = dataset.map(lambda images, targets: (tf.cast(images, tf.float32), targets),
+                          num_parallel_calls=AUTOTUNE)
+    if augment:
+        augmenter = create_augmenter()
+        dataset = dataset.map(lambda images, targets: (augmenter(images, training=True), targets),
+                              num_parallel_calls=AUTOTUNE)
+    if preprocess is not None:
+        dataset = dataset.map(lambda images, targets: (preprocess(images), targets),
+                              num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+from facecore.image_utils import file_sha1, file_signature
+from app.models import Person
+
+DATASET_FILE = 'dataset.json'
+
+
+class ContentHashes:
+    """Persistent path -> SHA-1 map that only re-reads files whose (mtime, size) changed.
+
+    Several processes (web workers, the training worker, the import CLI)
+    share the file; refresh() merges in what the others wrote since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self._dirty = False
+        self._file_signature = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Merge in entries written by other processes since the file was last read"""
+        signature = file_signature(self.path)
+        if signature is None or signature == self._file_signature:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = {p: (tuple(sig), sha1) for p, (sig, sha1) in json.load(f).items()}
+        except Exception as e:
+            print(f"Error reading content hashes: {str(e)}")
+            return
+        with self._lock:
+            for path, entry in stored.items():
+                self.entries.setdefault(path, entry)
+            self._file_signature = signature
+
+    def put(self, hashes):
+        """Record (path, file signature, sha1) triples computed elsewhere, e.g. by the bulk importer"""
+        with self._lock:
+            for path, signature, sha1 in hashes:
+                self.entries[path] = (tuple(signature), sha1)
+                self._dirty = True
+
+    def get(self, path):
+        signature = file_signature(path)
+        with self._lock:
+            known = self.entries.get(path)
+            if known is not None and known[0] == signature:
+                return known[1]
+        sha1 = file_sha1(path)
+        with self._lock:
+            self.entries[path] = (signature, sha1)
+            self._dirty = True
+        return sha1
+
+    def save(self, keep=None):
+        """Write the map atomically, dropping entries not in keep"""
+        self.refresh()
+        with self._lock:
+            if keep is not None:
+                keep = set(keep)
+                stale = [path for path in self.entries if path not in keep]
+                for path in stale:
+                    del self.entries[path]
+                self._dirty = self._dirty or bool(stale)
+            if not self._dirty:
+                return
+            # Per-process name: another process may be saving at the same time
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({p: [list(sig), sha1] for p, (sig, sha1) in self.entries.items()}, f)
+            os.replace(tmp_path, self.path)
+            self._file_signature = file_signature(self.path)
+            self._dirty = False
+
+
+_content_hashes = {}
+
+
+def content_hashes(app):
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'content_hashes.json')
+    if path not in _content_hashes:
+        _content_hashes[path] = ContentHashes(path)
+    return _content_hashes[path]
+
+
+def dataset_records(app, label='id'):
+    """Return sorted (label, sha1) pairs for every enrolled image that exists on disk.
+
+    label is 'id' (what the classifier trains on) or 'name' (what
+    face_recognition_tf trains on).
+    """
+    hashes = content_hashes(app)
+    hashes.refresh()
+    records = []
+    paths = []
+    for person in Person.query.all():
+        person_label = str(person.id) if label == 'id' else person.name
+        for image in person.images:
+            path = os.path.join(app.config['UPLOAD_FOLDER'], image.image_path)
+            if os.path.exists(path):
+                paths.append(path)
+                records.append((person_label, hashes.get(path)))
+    hashes.save(keep=paths)
+    return sorted(records)
+
+
+def dataset_fingerprint(app, label='id', **settings):
+    """Fingerprint the training data plus the settings that shape the trained model.
+
+    Returns (fingerprint, records). Any added, removed, relabelled or
+    modified image, or a change in settings, gives a new fingerprint.
+    """
+    records = dataset_records(app, label)
+    digest = hashlib.sha1()
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    for person_label, sha1 in records:
+        digest.update(f'{person_label}\t{sha1}\n'.encode('utf-8'))
+    return digest.hexdigest(), records
+
+
+def write_dataset(directory, fingerprint, records):
+    """Store the fingerprint and per-image records next to a trained model"""
+    with open(os.path.join(directory, DATASET_FILE), 'w') as f:
+        json.dump({'fingerprint': fingerprint, 'records': records}, f)
+
+
+def read_dataset(directory):
+    try:
+        with open(os.path.join(directory, DATASET_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def published_dataset(app):
+    """Dataset of the current model version, read without loading the model"""
+    versions_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'models')
+    try:
+        with open(os.path.join(versions_dir, 'CURRENT'), 'r') as f:
+            version = f.read().strip()
+    except OSError:
+        return {}
+    return read_dataset(os.path.join(versions_dir, version)) if version else {}
+
+
+def dataset_changes(previous_records, records):
+    """Count images added and removed between two record lists"""
+    previous = {tuple(record) for record in previous_records}
+    current = {tuple(record) for record in records}
+    return {'added': len(current - previous), 'removed': len(previous - current)}
@@ -0,0 +1,209 @@
+import os
+import threading
+import numpy as np
+import cv2
+from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+from app import app, db
+from app.models import Person, PersonImage, ImageEmbedding
+from app.matcher import GalleryMatcher
+from app.ann_index import IVFIndex
+from facecore.serving import serving_function
+from app.face_crop_store import face_crop_store
+from facecore.image_utils import crop_face
+from app.training_utils import create_feature_extractor, BACKBONE_NAME, FEATURE_DIM as EMBEDDING_DIM
+
+
+class EmbeddingGallery:
+    """Recognition by nearest-neighbour search over stored backbone embeddings.
+
+    Every PersonImage gets an embedding from the frozen MobileNetV2 backbone
+    when it is enrolled, so adding a person costs one forward pass per image
+    instead of a full retrain of the classification head. Small galleries are
+    searched exactly; from ANN_MIN_GALLERY_SIZE images on, search goes through
+    a persistent IVFIndex.
+    """
+
+    def __init__(self, app, batch_size=32):
+        self.app = app
+        self.batch_size = batch_size
+        self.extractor = None
+        self._serve = None
+        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        self.vectors = {}
+        self.loaded = False
+        self._matcher = None
+        self._index = None
+        self._index_changes = 0
+        self.index_path = os.path.join(app.config['UPLOAD_FOLDER'], 'embedding_index.npz')
+        self._lock = threading.RLock()
+
+    def _get_extractor(self):
+        with self._lock:
+            if self.extractor is None:
+                self.extractor = create_feature_extractor()
+                self._serve = serving_function(self.extractor)
+            return self.extractor
+
+    def face_crop(self, img):
+        """Return the largest detected face of a BGR image as a 224x224 RGB crop.
+
+        Falls back to the whole image when no face is found, so every gallery
+        image still contributes an embedding.
+        """
+        return crop_face(img, self.face_cascade)[0]
+
+    def embed(self, faces):
+        """Return L2-normalised embeddings for a stack of 224x224 RGB faces"""
+        batch = preprocess_input(np.asarray(faces, dtype=np.float32))
+        self._get_extractor()
+        features = np.concatenate([self._serve(batch[start:start + self.batch_size])
+                                   for start in range(0, len(batch), self.batch_size)]).astype(np.float32)
+        features /= np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-12)
+        return features
+
+    def _embed_images(self, images):
+        """Compute and store embeddings for PersonImage rows; return {image_id: (person_id, vector)}"""
+        # Crops were made at upload time; only images enrolled before the
+        # face crop store existed are decoded here
+        face_crop_store.ensure(images)
+        faces, found = face_crop_store.get([image.id for image in images])
+        valid = [image for image, ok in zip(images, found) if ok]
+        faces = faces[found]
+
+        embedded = {}
+        for start in range(0, len(faces), self.batch_size):
+            vectors = self.embed(faces[start:start + self.batch_size])
+            for image, vector in zip(valid[start:start + self.batch_size], vectors):
+                if image.embedding is not None:
+                    image.embedding.backbone = BACKBONE_NAME
+                    image.embedding.vector = vector.tobytes()
+                else:
+                    db.session.add(ImageEmbedding(image_id=image.id, backbone=BACKBONE_NAME,
+                                                  vector=vector.tobytes()))
+                embedded[image.id] = (image.person_id, vector)
+        db.session.commit()
+        return embedded
+
+    def load(self):
+        """Load stored embeddings, computing any that are missing or stale"""
+        with self._lock:
+            if self.loaded:
+                return
+            vectors = {}
+            missing = []
+            for image in PersonImage.query.all():
+                stored = image.embedding
+                if stored is not None and stored.backbone == BACKBONE_NAME:
+                    vectors[image.id] = (image.person_id, np.frombuffer(stored.vector, dtype=np.float32))
+                else:
+                    missing.append(image)
+            if missing:
+                print(f"Computing embeddings for {len(missing)} gallery images...")
+                vectors.update(self._embed_images(missing))
+            self.vectors = vectors
+            self._matcher = None
+            self.loaded = True
+
+    def _save_index(self, force=False):
+        """Persist the ANN index once enough changes have accumulated"""
+        if self._index is None:
+            return
+        if force or self._index_changes >= self.app.config['ANN_SAVE_EVERY']:
+            self._index.save(self.index_path)
+            self._index_changes = 0
+
+    def _build_index(self):
+        """Load the persisted ANN index and reconcile it with the stored embeddings"""
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                index = IVFIndex.load(self.index_path)
+            except Exception as e:
+                print(f"Error loading embedding index: {str(e)}")
+        if index is None:
+            index = IVFIndex(EMBEDDING_DIM, n_lists=self.app.config['ANN_N_LISTS'],
+                             nprobe=self.app.config['ANN_NPROBE'], metric='cosine')
+
+        indexed = index.ids()
+        stale = indexed - set(self.vectors)
+        missing = [image_id for image_id in self.vectors if image_id not in indexed]
+        index.remove(stale)
+        if missing:
+            person_ids, vectors = zip(*(self.vectors[image_id] for image_id in missing))
+            index.add(np.stack(vectors), missing, person_ids)
+        if not index.is_trained:
+            index.train()
+
+        self._index = index
+        self._save_index(force=bool(stale or missing))
+
+    def add_images(self, images):
+        """Embed newly enrolled images and add them to the live gallery"""
+        with self._lock:
+            embedded = self._embed_images(images)
+            if self.loaded:
+                self.vectors.update(embedded)
+                self._matcher = None
+            if self._index is not None and embedded:
+                person_ids, vectors = zip(*embedded.values())
+                self._index.add(np.stack(vectors), list(embedded), person_ids)
+                self._index_changes += len(embedded)
+                self._save_index()
+
+    def remove_images(self, image_ids):
+        """Drop deleted images from the live gallery"""
+        with self._lock:
+            for image_id in image_ids:
+                self.vectors.pop(image_id, None)
+            self._matcher = None
+            if self._index is not None:
+                self._index.remove(image_ids)
+                self._index_changes += len(image_ids)
+                self._save_index()
+
+    def matcher(self):
+        """Return the search structure for the gallery: exact or IVF depending on its size"""
+        self.load()
+        with self._lock:
+            if len(self.vectors) >= self.app.config['ANN_MIN_GALLERY_SIZE']:
+                if self._index is None:
+                    self._build_index()
+                return self._index
+            if self._matcher is None:
+                matcher = GalleryMatcher(EMBEDDING_DIM, metric='cosine')
+                if self.vectors:
+                    person_ids, vectors = zip(*self.vectors.values())
+                    matcher.add(np.stack(vectors), person_ids)
+                self._matcher = matcher
+            return self._matcher
+
+    def recognize(self, img, k=3):
+        """Recognize the face in a BGR image by nearest-neighbour search"""
+        return self.recognize_faces([self.face_crop(img)], k=k)[0]
+
+    def recognize_faces(self, faces, k=3):
+        """Recognize a list of 224x224 RGB face crops with one batched embedding pass"""
+        matcher = self.matcher()
+        if len(matcher) == 0:
+            raise Exception("Gallery is empty. Please add persons first.")
+
+        vectors = self.embed(faces)
+        all_matches = matcher.search(vectors, k=k, aggregate='min')
+        person_ids = {match['label'] for matches in all_matches for match in matches}
+        names = {person.id: person.name for person in Person.query.filter(Person.id.in_(person_ids))}
+
+        threshold = self.app.config['EMBEDDING_MATCH_THRESHOLD']
+        results = []
+        for matches in all_matches:
+            for match in matches:
+                match['name'] = names.get(match['label'], 'Unknown')
+            best = matches[0]
+            results.append({
+                'name': best['name'] if best['distance'] <= threshold else 'Unknown',
+                'confidence': max(0.0, 1.0 - best['distance']) * 100,
+                'matches': matches
+            })
+        return results
+
+
+embedding_gallery = EmbeddingGallery(app)
@@ -0,0 +1,187 @@
+import os
+import pickle
+import threading
+from app import app
+from facecore.image_utils import file_sha1, file_signature
+from app.matcher import GalleryMatcher
+
+
+class EncodingCache:
+    """Persistent face_recognition encodings for every gallery image.
+
+    Entries are keyed on the image path (relative to UPLOAD_FOLDER) and
+    remember the content hash and mtime the encoding was computed from, so a
+    file is only re-encoded when its bytes actually change. The cache is
+    loaded once per process and kept up to date by the enrollment routes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.cache_path = os.path.join(app.config['UPLOAD_FOLDER'], 'face_encodings.pkl')
+        self.entries = {}
+        self.loaded = False
+        self._matcher = None
+        self._lock = threading.RLock()
+
+    def _full_path(self, image_path):
+        return os.path.join(self.app.config['UPLOAD_FOLDER'], image_path)
+
+    def _encode(self, full_path):
+        """Return the first face encoding in an image, or None if there is no face"""
+        import face_recognition
+        image_data = face_recognition.load_image_file(full_path)
+        encodings = face_recognition.face_encodings(image_data)
+        return encodings[0] if encodings else None
+
+    def _read(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"Error reading encoding cache: {str(e)}")
+            return {}
+
+    def _write(self, entries):
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(entries, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def save(self):
+        """Write the cache to disk atomically"""
+        with self._lock:
+            self._matcher = None
+            self._write(self.entries)
+
+    def _refresh_entry(self, image_path, person_id):
+        """Bring one entry up to date; return True if it changed"""
+        full_path = self._full_path(image_path)
+        signature = file_signature(full_path)
+        if signature is None:
+            return self.entries.pop(image_path, None) is not None
+
+        entry = self.entries.get(image_path)
+        if entry is not None and entry['signature'] == signature:
+            if entry['person_id'] == person_id:
+                return False
+            entry['person_id'] = person_id
+            return True
+
+        sha1 = file_sha1(full_path)
+        if entry is not None and entry['sha1'] == sha1:
+            entry.update(signature=signature, person_id=person_id)
+            return True
+
+        try:
+            encoding = self._encode(full_path)
+        except Exception as e:
+            print(f"Error encoding image {full_path}: {str(e)}")
+            encoding = None
+
+        self.entries[image_path] = {
+            'sha1': sha1,
+            'signature': signature,
+            'person_id': person_id,
+            'encoding': encoding
+        }
+        return True
+
+    def load(self):
+        """Load the cache from disk and reconcile it with the database"""
+        from app.models import PersonImage
+
+        with self._lock:
+            if self.loaded:
+                return
+            self.entries = self._read()
+            changed = False
+            current = set()
+            for image in PersonImage.query.all():
+                current.add(image.image_path)
+                changed |= self._refresh_entry(image.image_path, image.person_id)
+            for image_path in list(self.entries):
+                if image_path not in current:
+                    del self.entries[image_path]
+                    changed = True
+            if changed:
+                self.save()
+            self.loaded = True
+
+    def add_images(self, images):
+        """Encode newly added PersonImage rows.
+
+        Does nothing until the cache has been loaded in this process; the
+        reconcile pass in load() picks up any images added before that.
+        """
+        with self._lock:
+            if not self.loaded:
+                return
+            changed = False
+            for image in images:
+                changed |= self._refresh_entry(image.image_path, image.person_id)
+            if changed:
+                self.save()
+
+    def put_encodings(self, rows):
+        """Store (image_path, person_id, sha1, signature, encoding) rows encoded elsewhere.
+
+        Used by the bulk importer, whose workers encode the images. Before
+        the cache is loaded in this process the rows are merged into the
+        file on disk, so load() finds them up to date instead of encoding
+        them again.
+        """
+        if not rows:
+            return
+        with self._lock:
+            entries = self.entries if self.loaded else self._read()
+            for image_path, person_id, sha1, signature, encoding in rows:
+                entries[image_path] = {
+                    'sha1': sha1,
+                    'signature': signature,
+                    'person_id': person_id,
+                    'encoding': encoding
+                }
+            if self.loaded:
+                self.save()
+            else:
+                self._write(entries)
+
+    def remove_images(self, image_paths):
+        """Drop cache entries for deleted images"""
+        with self._lock:
+            if not self.loaded:
+                return
+            changed = False
+            for image_path in image_paths:
+                changed |= self.entries.pop(image_path, None) is not None
+            if changed:
+                self.save()
+
+    def gallery(self):
+        """Return (encodings, person_ids) for every image with a detected face"""
+        self.load()
+        with self._lock:
+            encodings = []
+            person_ids = []
+            for entry in self.entries.values():
+                if entry['encoding'] is not None:
+                    encodings.append(entry['encoding'])
+                    person_ids.append(entry['person_id'])
+            return encodings, person_ids
+
+    def matcher(self):
+        """Return a GalleryMatcher over the cached encodings, rebuilt only after changes"""
+        self.load()
+        with self._lock:
+            if self._matcher is None:
+                encodings, person_ids = self.gallery()
+                if encodings:
+                    self._matcher = GalleryMatcher.from_arrays(encodings, person_ids)
+                else:
+                    self._matcher = GalleryMatcher(128)
+            return self._matcher
+
+
+encoding_cache = EncodingCache(app)
@@ -0,0 +1,194 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+import cv2
+import numpy as np
+from app import app
+from facecore.image_utils import file_signature, crop_face, CROP_SIZE
+
+
+class FaceCropStore:
+    """Packed store of preprocessed face crops indexed by PersonImage.id.
+
+    Each enrolled image is decoded, face-detected, cropped and resized once
+    at upload time; the uint8 224x224 RGB crop goes into a row of a
+    fixed-size memory-mapped .npy shard. index.json maps image ids to
+    (shard, row) plus the source file's signature, so consumers read crops
+    as contiguous arrays without touching the JPEGs. Rows of deleted images
+    are reused. Writers in different processes are serialised with a file
+    lock and readers reload the index when another process changed it.
+    """
+
+    def __init__(self, directory, shard_size=1024, size=CROP_SIZE):
+        self.directory = directory
+        self.shard_size = shard_size
+        self.size = size
+        self.index_path = os.path.join(directory, 'index.json')
+        self.lock_path = os.path.join(directory, 'store.lock')
+        self.entries = {}
+        self.free = []
+        self.rows_allocated = 0
+        self._shards = {}
+        self._index_signature = None
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+        self._reload()
+
+    def _shard_path(self, shard):
+        return os.path.join(self.directory, f'shard-{shard:05d}.npy')
+
+    def _reload(self):
+        """Re-read index.json if another process has rewritten it"""
+        signature = file_signature(self.index_path)
+        if signature == self._index_signature:
+            return
+        index = {}
+        if signature is not None:
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+            except Exception as e:
+                print(f"Error reading face crop index: {str(e)}")
+        if index.get('size') not in (None, self.size) or index.get('shard_size') not in (None, self.shard_size):
+            index = {}
+        self.entries = {int(image_id): tuple(entry) for image_id, entry in index.get('entries', {}).items()}
+        self.free = [tuple(slot) for slot in index.get('free', [])]
+        self.rows_allocated = index.get('rows_allocated', 0)
+        self._index_signature = signature
+
+    @property
+    def shard_count(self):
+        return -(-self.rows_allocated // self.shard_size)
+
+    def _save(self):
+        for shard in self._shards.values():
+            shard.flush()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'size': self.size,
+                'shard_size': self.shard_size,
+                'rows_allocated': self.rows_allocated,
+                'entries': {str(image_id): list(entry) for image_id, entry in self.entries.items()},
+                'free': [list(slot) for slot in self.free]
+            }, f)
+        os.replace(tmp_path, self.index_path)
+        self._index_signature = file_signature(self.index_path)
+
+    @contextmanager
+    def _writing(self):
+        """Exclusive access across threads and processes, with an up-to-date index"""
+        with self._lock:
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._reload()
+                    yield
+                    self._save()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _shard(self, shard):
+        if shard not in self._shards:
+            path = self._shard_path(shard)
+            if os.path.exists(path):
+                self._shards[shard] = np.load(path, mmap_mode='r+')
+            else:
+                self._shards[shard] = np.lib.format.open_memmap(
+                    path, mode='w+', dtype=np.uint8, shape=(self.shard_size, self.size, self.size, 3))
+        return self._shards[shard]
+
+    def _allocate(self):
+        """Return a free (shard, row), reusing rows of deleted images first"""
+        if self.free:
+            return self.free.pop()
+        slot = divmod(self.rows_allocated, self.shard_size)
+        self.rows_allocated += 1
+        return slot
+
+    def _put(self, image_id, crop, face_found, signature):
+        entry = self.entries.get(image_id)
+        shard, row = (entry[0], entry[1]) if entry else self._allocate()
+        self._shard(shard)[row] = crop
+        self.entries[image_id] = (shard, row, bool(face_found), list(signature) if signature else None)
+
+    def add_images(self, images, upload_folder=None):
+        """Crop and store PersonImage rows; returns the ids that could be read"""
+        upload_folder = upload_folder or app.config['UPLOAD_FOLDER']
+        stored = []
+        with self._writing():
+            for image in images:
+                path = os.path.join(upload_folder, image.image_path)
+                img = cv2.imread(path)
+                if img is None:
+                    print(f"Could not read gallery image {image.image_path}")
+                    continue
+                crop, face_found = crop_face(img, size=self.size)
+                self._put(image.id, crop, face_found, file_signature(path))
+                stored.append(image.id)
+        return stored
+
+    def put_crops(self, crops):
+        """Store crops computed elsewhere, as (image_id, crop, face_found, file signature) tuples"""
+        with self._writing():
+            for image_id, crop, face_found, signature in crops:
+                self._put(image_id, crop, face_found, signature)
+
+    def remove(self, image_ids):
+        with self._writing():
+            for image_id in image_ids:
+                entry = self.entries.pop(image_id, None)
+                if entry is not None:
+                    self.free.append((entry[0], entry[1]))
+
+    def ensure(self, images, upload_folder=None):
+        """Store crops for images that are missing or whose file changed since they were cropped"""
+        upload_folder = upload_folder or app.config['UPLOAD_FOLDER']
+        with self._lock:
+            self._reload()
+            stale = []
+            for image in images:
+                entry = self.entries.get(image.id)
+                signature = file_signature(os.path.join(upload_folder, image.image_path))
+                if entry is None or (signature is not None and entry[3] != list(signature)):
+                    stale.append(image)
+        if stale:
+            print(f"Cropping {len(stale)} gallery images into the face crop store...")
+            self.add_images(stale, upload_folder)
+
+    def get(self, image_ids):
+        """Return (crops, found) for image ids: an (n, size, size, 3) uint8 array and a bool mask"""
+        with self._lock:
+            self._reload()
+            crops = np.zeros((len(image_ids), self.size, self.size, 3), dtype=np.uint8)
+            found = np.zeros(len(image_ids), dtype=bool)
+            for i, image_id in enumerate(image_ids):
+                entry = self.entries.get(image_id)
+                if entry is not None:
+                    crops[i] = self._shard(entry[0])[entry[1]]
+                    found[i] = True
+        return crops, found
+
+    def row(self, image_id):
+        """Return a view of one stored crop without copying it, or None"""
+        with self._lock:
+            entry = self.entries.get(image_id)
+            if entry is None:
+                return None
+            return self._shard(entry[0])[entry[1]]
+
+    def stats(self):
+        with self._lock:
+            self._reload()
+            return {
+                'images': len(self.entries),
+                'faces_found': sum(1 for entry in self.entries.values() if entry[2]),
+                'shards': self.shard_count,
+                'free_rows': len(self.free),
+                'bytes': self.shard_count * self.shard_size * self.size * self.size * 3
+            }
+
+
+face_crop_store = FaceCropStore(os.path.join(app.config['UPLOAD_FOLDER'], 'face_crops'))
@@ -1,36 +1,42 @@
 import face_recognition
-import os
 from app.models import Person
-from app import app
+from app.encoding_cache import encoding_cache
+
+# Same threshold face_recognition.compare_faces uses by default
+TOLERANCE = 0.6
 
 def train_model():
-    known_faces = []
-    known_names = []
-    
-    for person in Person.query.all():
-        for image in person.images:
-            full_path = os.path.join(app.config['UPLOAD_FOLDER'], image.image_path)
-            image_data = face_recognition.load_image_file(full_path)
-            encoding = face_recognition.face_encodings(image_data)[0]
-            known_faces.append(encoding)
-            known_names.append(person.name)
-    
+    known_faces, person_ids = encoding_cache.gallery()
+    names = {person.id: person.name for person in Person.query.all()}
+    known_names = [names.get(person_id, 'Unknown') for person_id in person_ids]
+
     return known_faces, known_names
 
-def recognize_face(image_path):
-    known_faces, known_names = train_model()
-    
+def match_encoding(encoding, k=1, aggregate='min'):
+    """Return the k closest persons to an encoding as {person_id, name, distance} dicts"""
+    matches = encoding_cache.matcher().search(encoding, k=k, aggregate=aggregate)
+    results = []
+    for match in matches:
+        person = Person.query.get(match['label'])
+        results.append({
+            'person_id': match['label'],
+            'name': person.name if person else 'Unknown',
+            'distance': match['distance']
+        })
+    return results
+
+def recognize_face(image_path, tolerance=TOLERANCE):
     unknown_image = face_recognition.load_image_file(image_path)
     face_locations = face_recognition.face_locations(unknown_image)
-    
+
     if not face_locations:
         return "No face detected in the image"
-    
+
     unknown_encoding = face_recognition.face_encodings(unknown_image, face_locations)[0]
-    
-    results = face_recognition.compare_faces(known_faces, unknown_encoding)
-    
-    if True in results:
-        return known_names[results.index(True)]
+
+    matches = match_encoding(unknown_encoding, k=1)
+
+    if matches and matches[0]['distance'] <= tolerance:
+        return matches[0]['name']
     else:
         return "Unknown face detected"
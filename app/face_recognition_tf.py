@@ -1,4 +1,3 @@
-import tensorflow as tf
 from tensorflow.keras.applications import MobileNetV2
 from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout
 from tensorflow.keras.models import Model
@@ -12,10 +11,22 @@ from sklearn.preprocessing import LabelEncoder
 from app import app, db
 from app.models import Person, PersonImage
 import joblib
+import shutil
+from app.data_pipeline import make_dataset, split_records
+from app.model_registry import ModelRegistry, model_registry
+from app.dataset_fingerprint import dataset_fingerprint, read_dataset, write_dataset
 
 # Define the image size we'll use for our model
 IMG_SIZE = (224, 224)  # MobileNetV2 input size
 
+# These models take [0, 1] inputs and predict person names, so they are
+# versioned apart from the classifier models /recognize serves
+tf_model_registry = ModelRegistry(
+    app,
+    versions_dir=os.path.join(app.config['UPLOAD_FOLDER'], 'face_recognition_tf_models'),
+    legacy_fallback=False
+)
+
 def create_model(num_classes):
     base_model = MobileNetV2(weights='imagenet', include_top=False, input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3))
     
@@ -91,33 +102,33 @@ def train_model():
         print("Need at least 2 persons in the database to train the model.")
         return None, 0.0
 
-    X = []
-    y = []
+    image_paths = []
+    names = []
     
-    # Collect data
+    # Collect image paths; decoding happens inside the tf.data pipeline
     for person in persons:
-        print(f"Processing images for {person.name}")
         for image in person.images:
             img_path = os.path.join(app.config['UPLOAD_FOLDER'], image.image_path)
-            try:
-                img_array = preprocess_image(img_path)
-                if img_array is not None:
-                    X.append(img_array)
-                    y.append(person.name)
-            except Exception as e:
-                print(f"Error processing image {img_path}: {str(e)}")
-                continue
-
-    if len(X) == 0:
+            if os.path.exists(img_path):
+                image_paths.append(img_path)
+                names.append(person.name)
+            else:
+                print(f"Missing image file {img_path}")
+
+    if len(image_paths) == 0:
         print("No valid images found for training.")
         return None, 0.0
 
-    X = np.array(X)
-    
+    dataset = dataset_fingerprint(app, label='name', trainer='face_recognition_tf', epochs=20)
+
     # Convert labels
     le = LabelEncoder()
-    y = le.fit_transform(y)
-    y = tf.keras.utils.to_categorical(y, num_classes=num_classes)
+    y = le.fit_transform(names)
+    num_classes = len(le.classes_)
+
+    (train_paths, train_labels), (val_paths, val_labels) = split_records(image_paths, y)
+    train_dataset = create_dataset(train_paths, train_labels, num_classes=num_classes, training=True)
+    val_dataset = create_dataset(val_paths, val_labels, num_classes=num_classes) if val_paths else None
 
     # Create and compile model
     model = create_model(num_classes)
@@ -125,39 +136,51 @@ def train_model():
     # Train model
     print("Training model...")
     history = model.fit(
-        X, y,
+        train_dataset,
+        validation_data=val_dataset,
         epochs=20,
-        batch_size=32,
-        validation_split=0.2,
         verbose=1
     )
 
-    # Save model and label encoder
-    model_path = os.path.join(app.config['UPLOAD_FOLDER'], 'face_recognition_model')
-    le_path = os.path.join(app.config['UPLOAD_FOLDER'], 'label_encoder.joblib')
-    
-    model.save(model_path)
-    joblib.dump(le, le_path)
-    
+    # Publish as a new version; the live one is only replaced once this is complete
+    version, staging_path = tf_model_registry.create_version()
+    try:
+        model.save(staging_path)
+        write_dataset(staging_path, *dataset)
+        tf_model_registry.publish(version, staging_path, [str(name) for name in le.classes_], model=model,
+                                  manifest={'trainer': 'face_recognition_tf', 'epochs': 20,
+                                            'dataset_fingerprint': dataset[0]})
+    except Exception:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        raise
+
     # Get final accuracy
     final_accuracy = history.history['accuracy'][-1]
     
     print(f"Model trained with accuracy: {final_accuracy:.4f}")
     return model, final_accuracy
 
-def recognize_face(image_path):
+def _current_model():
+    """Return (LoadedModel, class names) of the live model, or (None, None)"""
+    loaded = tf_model_registry.current()
+    if loaded is not None:
+        return loaded, loaded.class_names
+
+    # Model trained in place before models were versioned
     model_path = os.path.join(app.config['UPLOAD_FOLDER'], 'face_recognition_model')
     le_path = os.path.join(app.config['UPLOAD_FOLDER'], 'label_encoder.joblib')
-    
-    # Check if model exists
-    if not os.path.exists(model_path) or not os.path.exists(le_path):
-        print("Model files not found. Please train the model first.")
-        return "Model not trained yet", 0.0
+    if os.path.exists(model_path) and os.path.exists(le_path):
+        le = model_registry.load_artifact(le_path, joblib.load)
+        return model_registry.load(model_path), list(le.classes_)
+    return None, None
 
+def recognize_face(image_path):
     try:
-        # Load model and label encoder
-        model = tf.keras.models.load_model(model_path)
-        le = joblib.load(le_path)
+        # Shared, loaded-once model and labels
+        loaded, class_names = _current_model()
+        if loaded is None:
+            print("Model files not found. Please train the model first.")
+            return "Model not trained yet", 0.0
 
         # Preprocess image
         img_array = preprocess_image(image_path)
@@ -165,11 +188,11 @@ def recognize_face(image_path):
             return "Error processing image", 0.0
 
         # Make prediction
-        prediction = model.predict(np.expand_dims(img_array, axis=0), verbose=0)
+        prediction = loaded.serve(np.expand_dims(img_array, axis=0))
         
         # Get highest confidence prediction
         max_confidence = np.max(prediction[0])
-        predicted_label = le.inverse_transform([np.argmax(prediction[0])])[0]
+        predicted_label = class_names[int(np.argmax(prediction[0]))]
 
         # Add confidence threshold
         if max_confidence < 0.6:
@@ -181,17 +204,25 @@ def recognize_face(image_path):
         print(f"Error during recognition: {str(e)}")
         return "Error during recognition", 0.0
 
-# Initialize the model when the app starts
-@app.before_first_request
-def initialize_model():
-    model_path = os.path.join(app.config['UPLOAD_FOLDER'], 'face_recognition_model')
-    if not os.path.exists(model_path):
-        print("Training initial model...")
-        train_model()
-    else:
-        print("Model already exists. Skipping initial training.")
-
-def create_dataset(image_paths, labels, batch_size=32):
-    dataset = tf.data.Dataset.from_tensor_slices((image_paths, labels))
-    dataset = dataset.map(preprocess_image).batch(batch_size).prefetch(tf.data.AUTOTUNE)
-    return dataset
\ No newline at end of file
+def initialize_model(force=False):
+    """Train the model unless one exists for exactly the current dataset (no longer run on the first request)"""
+    version = tf_model_registry.current_version()
+    if not force and version:
+        fingerprint, _ = dataset_fingerprint(app, label='name', trainer='face_recognition_tf', epochs=20)
+        if read_dataset(tf_model_registry.version_path(version)).get('fingerprint') == fingerprint:
+            print("Model is up to date with the dataset. Skipping training.")
+            return
+    print("Training model...")
+    train_model()
+
+def create_dataset(image_paths, labels, batch_size=32, num_classes=None, training=False):
+    """Parallel decode/resize pipeline producing the same [0, 1] inputs as preprocess_image"""
+    if num_classes is None:
+        num_classes = int(np.max(labels)) + 1
+    return make_dataset(
+        image_paths, labels, num_classes,
+        preprocess=lambda images: images / 255.0,
+        batch_size=batch_size,
+        training=training,
+        cache=''
+    )
@@ -1,30 +1,32 @@
 import os
 import numpy as np
-import tensorflow as tf
 from tensorflow.keras.preprocessing.image import load_img, img_to_array
 from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
 import cv2
-import pickle
+from app.model_registry import model_registry
 
 class FaceRecognitionSystem:
     def __init__(self, app):
         self.app = app
-        self.model = None
-        self.class_names = []
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         self.model_path = os.path.join(app.config['UPLOAD_FOLDER'], 'face_recognition_model')
         self.labels_path = os.path.join(app.config['UPLOAD_FOLDER'], 'class_names.pkl')
         self.load_model()
 
+    @property
+    def model(self):
+        loaded = model_registry.current()
+        return loaded.model if loaded else None
+
+    @property
+    def class_names(self):
+        loaded = model_registry.current()
+        return loaded.class_names if loaded else []
+
     def load_model(self):
-        """Load the trained model and class names"""
+        """Load the trained model and class names through the shared model registry"""
         try:
-            if os.path.exists(self.model_path):
-                self.model = tf.keras.models.load_model(self.model_path)
-            
-            if os.path.exists(self.labels_path):
-                with open(self.labels_path, 'rb') as f:
-                    self.class_names = pickle.load(f)
+            model_registry.current()
         except Exception as e:
             print(f"Error loading model: {str(e)}")
 
@@ -40,18 +42,32 @@ class FaceRecognitionSystem:
         except Exception as e:
             raise Exception(f"Error preprocessing image: {str(e)}")
 
-    def detect_faces(self, image_path):
-        """Detect faces in image"""
+    def detect_faces(self, image):
+        """Detect faces in an image path or an already decoded BGR array"""
         try:
-            img = cv2.imread(image_path)
+            img = cv2.imread(image) if isinstance(image, str) else image
+            if img is None:
+                raise Exception("Could not read image")
             gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
             faces = self.face_cascade.detectMultiScale(gray, 1.1, 4)
             return faces, img
         except Exception as e:
             raise Exception(f"Error detecting faces: {str(e)}")
 
-    def recognize_face(self, image_path):
-        """Recognize face in image"""
+    def preprocess_faces(self, img, faces):
+        """Crop every detected face and preprocess the crops into one model batch"""
+        batch = np.empty((len(faces), 224, 224, 3), dtype=np.float32)
+        for i, (x, y, w, h) in enumerate(faces):
+            face_img = cv2.resize(img[y:y+h, x:x+w], (224, 224))
+            batch[i] = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
+        return preprocess_input(batch)
+
+    def recognize_face(self, image):
+        """Recognize every face in an image path or BGR array with a single batched forward pass.
+
+        Returns a list of {'name', 'confidence', 'bbox'} dicts, one per
+        detected face.
+        """
         try:
             if not self.model:
                 raise Exception("Model not loaded. Please train the model first.")
@@ -60,52 +76,50 @@ class FaceRecognitionSystem:
                 raise Exception("No classes found. Please train the model first.")
 
             # Detect faces
-            faces, img = self.detect_faces(image_path)
+            faces, img = self.detect_faces(image)
             
             if len(faces) == 0:
                 raise Exception("No faces detected in image")
 
-            if len(faces) > 1:
-                raise Exception("Multiple faces detected. Please use an image with a single face")
+            # Classify all faces in one forward pass on a single model version
+            loaded = model_registry.current()
+            predictions = loaded.predict(self.preprocess_faces(img, faces))
 
-            # Process the detected face
-            x, y, w, h = faces[0]
-            face_img = img[y:y+h, x:x+w]
-            face_img = cv2.resize(face_img, (224, 224))
-            face_img = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-            
-            # Preprocess for model
-            face_array = img_to_array(face_img)
-            face_array = np.expand_dims(face_array, axis=0)
-            face_array = preprocess_input(face_array)
-
-            # Get prediction
-            predictions = self.model.predict(face_array)
-            predicted_class = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class])
-
-            return {
-                'name': self.class_names[predicted_class],
-                'confidence': confidence * 100,
-                'bbox': [int(x), int(y), int(w), int(h)]
-            }
+            results = []
+            for (x, y, w, h), prediction in zip(faces, predictions):
+                predicted_class = np.argmax(prediction)
+                results.append({
+                    'name': loaded.class_names[predicted_class],
+                    'confidence': float(prediction[predicted_class]) * 100,
+                    'bbox': [int(x), int(y), int(w), int(h)]
+                })
+            return results
 
         except Exception as e:
             raise Exception(f"Recognition failed: {str(e)}")
 
+    def recognize_video(self, video_path, **options):
+        """Identify the people in a video file; returns per-track identities with time ranges.
+
+        Detection, tracking and voting are done by VideoRecognizer, which
+        takes its options; faces are classified on the current model version.
+        """
+        from app.video_recognition import VideoRecognizer
+
+        def predict(batch):
+            loaded = model_registry.current()
+            if loaded is None:
+                raise Exception("Model not loaded. Please train the model first.")
+            return [(prediction, loaded.class_names) for prediction in loaded.predict(batch)]
+
+        return VideoRecognizer(self.face_cascade, predict, **options).recognize(video_path)
+
     def save_model_and_labels(self, model, class_names):
-        """Save the trained model and class names"""
+        """Save the trained model and class names as a new version and make it current"""
         try:
-            # Save model
-            model.save(self.model_path)
-            
-            # Save class names
-            with open(self.labels_path, 'wb') as f:
-                pickle.dump(class_names, f)
-            
-            # Update current model and class names
-            self.model = model
-            self.class_names = class_names
+            version, staging_path = model_registry.create_version()
+            model.save(staging_path)
+            model_registry.publish(version, staging_path, class_names, model=model)
             
         except Exception as e:
             raise Exception(f"Error saving model: {str(e)}") 
\ No newline at end of file
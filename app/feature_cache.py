@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import numpy as np
+from facecore.image_utils import file_sha1, file_signature
+
+
+class FeatureCache:
+    """On-disk cache of backbone features keyed by image content hash.
+
+    Features live in one memory-mapped float32 .npy file that grows
+    geometrically; index.json maps each content hash to its row. Images are
+    only pushed through the backbone the first time their bytes are seen, so
+    retraining the classification head only re-featurizes new or changed
+    images.
+    """
+
+    def __init__(self, cache_dir, dim, backbone):
+        self.cache_dir = cache_dir
+        self.dim = dim
+        self.backbone = backbone
+        self.features_path = os.path.join(cache_dir, 'features.npy')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.rows = {}
+        self.signatures = {}
+        self.features = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as f:
+                    index = json.load(f)
+            except Exception as e:
+                print(f"Error reading feature cache index: {str(e)}")
+
+        if index.get('backbone') == self.backbone and index.get('dim') == self.dim \
+                and os.path.exists(self.features_path):
+            self.rows = index.get('rows', {})
+            self.signatures = {path: (tuple(sig), sha1)
+                               for path, (sig, sha1) in index.get('signatures', {}).items()}
+            self.features = np.load(self.features_path, mmap_mode='r+')
+        else:
+            self.rows = {}
+            self.signatures = {}
+            self.features = np.lib.format.open_memmap(
+                self.features_path, mode='w+', dtype=np.float32, shape=(1024, self.dim))
+
+    def _save_index(self):
+        self.features.flush()
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'backbone': self.backbone,
+                'dim': self.dim,
+                'rows': self.rows,
+                'signatures': {path: [list(sig), sha1] for path, (sig, sha1) in self.signatures.items()}
+            }, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _reserve(self, needed):
+        """Grow the memmap so it can hold at least `needed` rows"""
+        if needed <= len(self.features):
+            return
+        capacity = max(needed, 2 * len(self.features))
+        tmp_path = self.features_path + '.tmp.npy'
+        grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(capacity, self.dim))
+        grown[:len(self.rows)] = self.features[:len(self.rows)]
+        grown.flush()
+        del grown
+        self.features = None
+        os.replace(tmp_path, self.features_path)
+        self.features = np.load(self.features_path, mmap_mode='r+')
+
+    def content_hash(self, path):
+        """SHA-1 of a file, skipping the read when its mtime and size are unchanged"""
+        signature = file_signature(path)
+        known = self.signatures.get(path)
+        if known is not None and known[0] == signature:
+            return known[1]
+        sha1 = file_sha1(path)
+        self.signatures[path] = (signature, sha1)
+        return sha1
+
+    def get(self, paths, featurize, batch_size=32):
+        """Return an (n, dim) feature array for image paths.
+
+        featurize(paths) must return an (len(paths), dim) array; it is only
+        called for images whose content hash is not cached yet.
+        """
+        with self._lock:
+            hashes = [self.content_hash(path) for path in paths]
+            missing = {}
+            for path, sha1 in zip(paths, hashes):
+                if sha1 not in self.rows and sha1 not in missing:
+                    missing[sha1] = path
+
+            if missing:
+                print(f"Featurizing {len(missing)} new images...")
+                pending = list(missing.items())
+                self._reserve(len(self.rows) + len(pending))
+                for start in range(0, len(pending), batch_size):
+                    chunk = pending[start:start + batch_size]
+                    features = np.asarray(featurize([path for _, path in chunk]), dtype=np.float32)
+                    row = len(self.rows)
+                    self.features[row:row + len(chunk)] = features
+                    for offset, (sha1, _) in enumerate(chunk):
+                        self.rows[sha1] = row + offset
+            self._save_index()
+
+            return np.asarray(self.features[[self.rows[sha1] for sha1 in hashes]])
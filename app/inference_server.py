@@ -0,0 +1,269 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from app.batching import MicroBatcher
+
+# Every message is a length-prefixed JSON header, optionally followed by
+# header['nbytes'] bytes of raw payload
+HEADER = struct.Struct('!I')
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Connection closed")
+        received += count
+    return buffer
+
+
+def send_message(sock, message, payload=b''):
+    if payload:
+        message = dict(message, nbytes=len(payload))
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(HEADER.pack(len(data)) + data)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock):
+    """Return (header, payload) of the next message"""
+    (size,) = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    message = json.loads(_recv_exact(sock, size).decode('utf-8'))
+    payload = _recv_exact(sock, message['nbytes']) if message.get('nbytes') else b''
+    return message, payload
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Serves one web worker thread's connection"""
+
+    def handle(self):
+        shm = None
+        try:
+            while True:
+                try:
+                    message, _ = recv_message(self.request)
+                except ConnectionError:
+                    return
+                op = message.get('op')
+                try:
+                    if op == 'attach':
+                        if shm is not None:
+                            shm.close()
+                        shm = shared_memory.SharedMemory(name=message['shm'])
+                        # The web worker owns the segment; don't let this
+                        # process's resource tracker unlink it on exit
+                        resource_tracker.unregister(shm._name, 'shared_memory')
+                        send_message(self.request, {'ok': True})
+                    elif op == 'predict':
+                        if shm is None:
+                            raise Exception("No shared memory attached")
+                        reply, output = self.server.inference.predict_shared(shm.buf, message['shape'])
+                        send_message(self.request, reply, output)
+                    elif op == 'classes':
+                        send_message(self.request, {'class_names': self.server.inference.class_names(message['version'])})
+                    elif op == 'ping':
+                        send_message(self.request, self.server.inference.ping())
+                    elif op == 'stats':
+                        send_message(self.request, self.server.inference.stats())
+                    else:
+                        raise Exception(f"Unknown operation: {op}")
+                except (ConnectionError, BrokenPipeError):
+                    return
+                except Exception as e:
+                    send_message(self.request, {'error': str(e)})
+        finally:
+            if shm is not None:
+                shm.close()
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class InferenceServer:
+    """Owns the model and its TensorFlow threads for every web worker on the box.
+
+    Web workers write preprocessed batches into a shared memory segment and
+    send a small request over a Unix socket; the server reads the batch in
+    place, runs it through a MicroBatcher shared by all workers and replies
+    with the predictions and, per row, the model version that produced
+    them. The model comes from the model registry, so newly published
+    versions are picked up as usual.
+    """
+
+    def __init__(self, socket_path, registry, max_batch_size=16, max_wait_ms=5, max_queue_size=256,
+                 timeout=30):
+        self.socket_path = socket_path
+        self.registry = registry
+        self.timeout = timeout
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms, max_queue_size=max_queue_size)
+        self._server = None
+
+    @staticmethod
+    def _version_key(loaded):
+        return loaded.version or loaded.path
+
+    def _predict_batch(self, batch):
+        loaded = self.registry.current()
+        if loaded is None:
+            raise Exception('Model not trained yet')
+        key = self._version_key(loaded)
+        with self._lock:
+            if key not in self._versions:
+                self._versions = {k: v for k, v in list(self._versions.items())[-3:]}
+                self._versions[key] = loaded.class_names
+        return [(prediction, key) for prediction in loaded.predict(batch)]
+
+    def predict_shared(self, buffer, shape):
+        """Predict a batch stored at the start of a shared buffer; returns (reply, output bytes)"""
+        # Copy the rows out of shared memory: queued rows must not see the
+        # client's next request, and no view may outlive the segment
+        batch = np.array(np.ndarray(tuple(shape), dtype=np.float32, buffer=buffer))
+        futures = [self.batcher.submit(sample) for sample in batch]
+        results = [future.result(timeout=self.timeout) for future in futures]
+        predictions = np.stack([prediction for prediction, _ in results]).astype(np.float32)
+        reply = {'versions': [key for _, key in results], 'shape': list(predictions.shape)}
+        return reply, predictions.tobytes()
+
+    def class_names(self, version):
+        with self._lock:
+            if version in self._versions:
+                return self._versions[version]
+        raise Exception(f"Unknown model version: {version}")
+
+    def ping(self):
+        loaded = self.registry.current()
+        return {'ok': True, 'pid': os.getpid(), 'model_version': self._version_key(loaded) if loaded else None,
+                'model_input': loaded.manifest.get('input') if loaded else None}
+
+    def stats(self):
+        return {'batcher': self.batcher.stats(), 'registry': self.registry.stats()}
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = _UnixServer(self.socket_path, _Handler)
+        self._server.inference = self
+        print(f"Inference server (pid {os.getpid()}) listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class InferenceClient:
+    """Web-worker side of the inference server.
+
+    Each thread keeps its own socket connection and a shared memory segment
+    large enough for max_batch_size inputs, so a request costs one memcpy
+    into shared memory and two small socket messages. predict() returns
+    (prediction, class_names) rows like routes.predict_batch.
+    """
+
+    def __init__(self, socket_path, max_batch_size=16, input_shape=(224, 224, 3), timeout=30):
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.input_shape = tuple(input_shape)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._class_names = {}
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        size = self.max_batch_size * int(np.prod(self.input_shape)) * 4
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        # Unlink right after the server attaches; the mapping stays valid
+        # for both processes and nothing leaks if either one dies
+        try:
+            send_message(sock, {'op': 'attach', 'shm': shm.name})
+            self._check(recv_message(sock)[0])
+        finally:
+            shm.unlink()
+        self._local.sock = sock
+        self._local.shm = shm
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.shm.close()
+            self._local.sock = None
+
+    @staticmethod
+    def _check(reply):
+        if 'error' in reply:
+            raise Exception(reply['error'])
+        return reply
+
+    def _call(self, message, fill=None):
+        """Send one request, reconnecting once if the server restarted"""
+        for attempt in range(2):
+            try:
+                if getattr(self._local, 'sock', None) is None:
+                    self._connect()
+                if fill is not None:
+                    fill(self._local.shm.buf)
+                send_message(self._local.sock, message)
+                reply, payload = recv_message(self._local.sock)
+                return self._check(reply), payload
+            except (ConnectionError, BrokenPipeError, FileNotFoundError, socket.timeout):
+                self.close()
+                if attempt:
+                    raise
+
+    def ping(self):
+        return self._call({'op': 'ping'})[0]
+
+    def stats(self):
+        return self._call({'op': 'stats'})[0]
+
+    def wait_until_ready(self, timeout=300, interval=0.5):
+        """Block until the server answers a ping"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.ping()
+            except (OSError, ConnectionError) as e:
+                if time.monotonic() > deadline:
+                    raise Exception(f"Inference server at {self.socket_path} is not available: {str(e)}")
+                time.sleep(interval)
+
+    def class_names(self, version):
+        if version not in self._class_names:
+            self._class_names[version] = self._call({'op': 'classes', 'version': version})[0]['class_names']
+        return self._class_names[version]
+
+    def predict(self, batch):
+        results = []
+        for start in range(0, len(batch), self.max_batch_size):
+            chunk = np.ascontiguousarray(batch[start:start + self.max_batch_size], dtype=np.float32)
+
+            def fill(buffer):
+                np.ndarray(chunk.shape, dtype=np.float32, buffer=buffer)[...] = chunk
+
+            reply, payload = self._call({'op': 'predict', 'shape': list(chunk.shape)}, fill)
+            predictions = np.frombuffer(payload, dtype=np.float32).reshape(reply['shape'])
+            results.extend((prediction, self.class_names(version))
+                           for prediction, version in zip(predictions, reply['versions']))
+        return results
@@ -0,0 +1,125 @@
+import numpy as np
+
+
+class GalleryMatcher:
+    """Exact nearest-neighbour search over a gallery of face vectors.
+
+    The gallery is kept as one contiguous float32 matrix with a parallel
+    label array, so distances from a query batch to every gallery vector
+    come out of a single matrix multiply instead of a Python loop.
+    """
+
+    def __init__(self, dim, metric='euclidean'):
+        if metric not in ('euclidean', 'cosine'):
+            raise ValueError(f"Unsupported metric: {metric}")
+        self.dim = dim
+        self.metric = metric
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.int64)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._centroids = None
+
+    @classmethod
+    def from_arrays(cls, vectors, labels, metric='euclidean'):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("Gallery vectors must be a 2-D array")
+        matcher = cls(vectors.shape[1], metric=metric)
+        matcher.add(vectors, labels)
+        return matcher
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _prepare(self, vectors):
+        vectors = np.ascontiguousarray(np.atleast_2d(vectors), dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+        if self.metric == 'cosine':
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        return vectors
+
+    def add(self, vectors, labels):
+        """Append vectors with their labels"""
+        vectors = self._prepare(vectors)
+        labels = np.asarray(labels, dtype=np.int64).reshape(-1)
+        if len(labels) != len(vectors):
+            raise ValueError("vectors and labels must have the same length")
+        self.vectors = np.ascontiguousarray(np.concatenate([self.vectors, vectors]))
+        self.labels = np.concatenate([self.labels, labels])
+        self._sq_norms = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        self._centroids = None
+
+    def remove_label(self, label):
+        """Drop every vector belonging to a label"""
+        keep = self.labels != label
+        self.vectors = np.ascontiguousarray(self.vectors[keep])
+        self.labels = self.labels[keep]
+        self._sq_norms = self._sq_norms[keep]
+        self._centroids = None
+
+    def _pairwise(self, queries, vectors, sq_norms):
+        """Distances between every query and every row of vectors"""
+        dots = queries @ vectors.T
+        if self.metric == 'cosine':
+            return 1.0 - dots
+        q_norms = np.einsum('ij,ij->i', queries, queries)
+        sq = q_norms[:, None] - 2.0 * dots + sq_norms[None, :]
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq)
+
+    def distances(self, queries):
+        """Return an (n_queries, n_gallery) distance matrix"""
+        return self._pairwise(self._prepare(queries), self.vectors, self._sq_norms)
+
+    def _label_centroids(self):
+        if self._centroids is None:
+            unique, inverse = np.unique(self.labels, return_inverse=True)
+            sums = np.zeros((len(unique), self.dim), dtype=np.float32)
+            np.add.at(sums, inverse, self.vectors)
+            centroids = sums / np.bincount(inverse)[:, None].astype(np.float32)
+            if self.metric == 'cosine':
+                centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+            self._centroids = (unique, centroids, np.einsum('ij,ij->i', centroids, centroids))
+        return self._centroids
+
+    def search(self, queries, k=1, aggregate=None):
+        """Return the k nearest gallery entries for each query.
+
+        aggregate=None ranks individual gallery vectors, 'min' ranks labels
+        by their closest vector and 'centroid' ranks labels by the distance to
+        their mean vector. Each result is a list of {'label', 'distance'}
+        dicts sorted by distance; a single 1-D query returns a single list.
+        """
+        single = np.asarray(queries).ndim == 1
+        if len(self) == 0:
+            return [] if single else [[] for _ in range(len(np.atleast_2d(queries)))]
+
+        queries = self._prepare(queries)
+        if aggregate is None:
+            labels = self.labels
+            dist = self._pairwise(queries, self.vectors, self._sq_norms)
+        elif aggregate == 'min':
+            labels, inverse = np.unique(self.labels, return_inverse=True)
+            pairwise = self._pairwise(queries, self.vectors, self._sq_norms)
+            dist = np.full((len(queries), len(labels)), np.inf, dtype=pairwise.dtype)
+            for row in range(len(queries)):
+                np.minimum.at(dist[row], inverse, pairwise[row])
+        elif aggregate == 'centroid':
+            labels, centroids, sq_norms = self._label_centroids()
+            dist = self._pairwise(queries, centroids, sq_norms)
+        else:
+            raise ValueError(f"Unsupported aggregate: {aggregate}")
+
+        k = min(k, dist.shape[1])
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            order = candidates[np.argsort(dist[row, candidates])]
+            results.append([
+                {'label': int(labels[i]), 'distance': float(dist[row, i])}
+                for i in order
+            ])
+        return results[0] if single else results
@@ -0,0 +1,323 @@
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from app import app
+from facecore.serving import serving_function, load_keras_model
+from facecore.tflite_engine import TFLiteEngine, TFLITE_FILES
+
+
+class LoadedModel:
+    """A loaded Keras model plus the metadata needed to serve it"""
+
+    def __init__(self, path, model, class_names, signature=None, version=None, manifest=None):
+        self.path = path
+        self.model = model
+        self.class_names = class_names
+        self.signature = signature
+        self.version = version
+        self.manifest = manifest or {}
+        self.engine = None
+        self.serve = serving_function(model)
+
+    @property
+    def backend(self):
+        return 'keras' if self.engine is None else f'tflite ({os.path.basename(self.engine.model_path)})'
+
+    def predict(self, batch):
+        """Run a preprocessed batch through the configured inference backend"""
+        if self.engine is not None:
+            return self.engine.predict(batch)
+        return self.serve(batch)
+
+    @property
+    def nbytes(self):
+        """Approximate resident size of the model's weights"""
+        return int(sum(np.prod(weight.shape) * weight.dtype.size for weight in self.model.weights))
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'version': self.version,
+            'classes': len(self.class_names),
+            'parameters': int(self.model.count_params()),
+            'bytes': self.nbytes,
+            'backend': self.backend
+        }
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models shared by every recognition code path.
+
+    Trained models are stored as immutable versions under uploads/models/,
+    each a directory with the SavedModel, class_names.json and a
+    manifest.json. The CURRENT file names the live version and is replaced
+    atomically, so a reader never sees a half-written model. Each version is
+    loaded once per process and the same read-only LoadedModel is handed to
+    routes, FaceRecognitionSystem, ModelTrainer and face_recognition_tf.
+
+    Callers should take one LoadedModel from current() per request and use
+    its model and class_names together: a swap replaces the registry's
+    reference, while requests already holding the old one finish on it.
+    """
+
+    # Staging dirs untouched for this long belong to runs that died mid-publish
+    STAGING_MAX_AGE = 3600
+
+    def __init__(self, app, versions_dir=None, legacy_fallback=True):
+        """versions_dir defaults to uploads/models; legacy_fallback serves the
+        unversioned uploads/face_recognition_model until a version is published"""
+        self.app = app
+        self.legacy_fallback = legacy_fallback
+        self.default_path = os.path.join(app.config['UPLOAD_FOLDER'], 'face_recognition_model')
+        self.versions_dir = versions_dir or os.path.join(app.config['UPLOAD_FOLDER'], 'models')
+        self.pointer_path = os.path.join(self.versions_dir, 'CURRENT')
+        self._models = {}
+        self._artifacts = {}
+        self._current = None
+        self._pointer_signature = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _signature(path):
+        target = os.path.join(path, 'saved_model.pb') if os.path.isdir(path) else path
+        try:
+            st = os.stat(target)
+        except OSError:
+            return None
+        return st.st_mtime, st.st_size
+
+    def _read_class_names(self, path):
+        class_names_path = os.path.join(path, 'class_names.json')
+        if os.path.exists(class_names_path):
+            with open(class_names_path, 'r') as f:
+                return json.load(f)
+        # Labels written by FaceRecognitionSystem.save_model_and_labels
+        legacy_path = os.path.join(self.app.config['UPLOAD_FOLDER'], 'class_names.pkl')
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'rb') as f:
+                return pickle.load(f)
+        return []
+
+    @staticmethod
+    def _read_manifest(path):
+        manifest_path = os.path.join(path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def _tflite_path(self, path):
+        """The TFLite export of a version INFERENCE_BACKEND asks for, or None to serve with Keras"""
+        backend = self.app.config.get('INFERENCE_BACKEND', 'keras')
+        if not backend.startswith('tflite_'):
+            return None
+        tflite_path = os.path.join(path, TFLITE_FILES.get(backend[len('tflite_'):], ''))
+        if os.path.isfile(tflite_path):
+            return tflite_path
+        print(f"No {backend} export in {path}; serving with Keras")
+        return None
+
+    def _attach_engine(self, loaded):
+        """Serve through a TFLite interpreter when INFERENCE_BACKEND asks for one and it was exported"""
+        tflite_path = self._tflite_path(loaded.path)
+        if tflite_path:
+            loaded.engine = TFLiteEngine(tflite_path, num_threads=self.app.config.get('TFLITE_NUM_THREADS') or self.app.config.get('INFERENCE_THREADS'))
+        return loaded
+
+    def load(self, path=None):
+        """Return the LoadedModel for a model directory, loading it at most once per version"""
+        path = os.path.abspath(path or self.default_path)
+        signature = self._signature(path)
+        if signature is None:
+            return None
+
+        with self._lock:
+            loaded = self._models.get(path)
+            if loaded is not None and loaded.signature == signature:
+                return loaded
+
+            print(f"Loading model from {path}...")
+            manifest = self._read_manifest(path)
+            loaded = LoadedModel(path, load_keras_model(path), self._read_class_names(path),
+                                 signature, manifest.get('version'), manifest)
+            self._attach_engine(loaded)
+            self._models[path] = loaded
+            print(f"Model loaded successfully with {len(loaded.class_names)} classes")
+            return loaded
+
+    def load_artifact(self, path, loader):
+        """Load an auxiliary file (e.g. a label encoder) once per on-disk version"""
+        signature = self._signature(path)
+        if signature is None:
+            return None
+        with self._lock:
+            cached = self._artifacts.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+            value = loader(path)
+            self._artifacts[path] = (signature, value)
+            return value
+
+    def current_version(self):
+        """Return the version name CURRENT points at, or None"""
+        try:
+            with open(self.pointer_path, 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def version_path(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def current(self):
+        """Return the model recognition should serve, or None if none is trained.
+
+        Costs one stat of the CURRENT pointer, so versions published by
+        another process are picked up on the next call.
+        """
+        with self._lock:
+            pointer_signature = self._signature(self.pointer_path)
+            if pointer_signature is not None:
+                if pointer_signature != self._pointer_signature:
+                    version = self.current_version()
+                    path = os.path.abspath(self.version_path(version)) if version else None
+                    if path and (self._current is None or self._current.path != path):
+                        try:
+                            self._current = self.load(path)
+                        except Exception as e:
+                            print(f"Error loading model version {version}: {str(e)}")
+                    self._pointer_signature = pointer_signature
+                return self._current
+
+            # No versioned models yet: serve a model from the legacy unversioned directory
+            if self.legacy_fallback and os.path.exists(os.path.join(self.default_path, 'class_names.json')):
+                signature = self._signature(self.default_path)
+                if signature is not None and (self._current is None or self._current.signature != signature):
+                    try:
+                        self._current = self.load(self.default_path)
+                    except Exception as e:
+                        print(f"Error loading model: {str(e)}")
+            return self._current
+
+    def current_files(self):
+        """Describe the model current() serves without loading it, for processes that load it themselves.
+
+        Returns {'path', 'version', 'class_names', 'tflite_path'} or None;
+        tflite_path is None when the model is served with Keras.
+        """
+        version = self.current_version()
+        if version:
+            path = os.path.abspath(self.version_path(version))
+        elif self.legacy_fallback and os.path.exists(os.path.join(self.default_path, 'class_names.json')):
+            path = os.path.abspath(self.default_path)
+        else:
+            return None
+        return {
+            'path': path,
+            'version': self._read_manifest(path).get('version'),
+            'class_names': self._read_class_names(path),
+            'tflite_path': self._tflite_path(path)
+        }
+
+    def create_version(self):
+        """Create a staging directory for a new model version; returns (version, staging_path)"""
+        version = datetime.now().strftime('v%Y%m%d_%H%M%S_%f')
+        staging_path = os.path.join(self.versions_dir, f'.staging-{version}')
+        os.makedirs(staging_path)
+        return version, staging_path
+
+    def _validate(self, staging_path, model, class_names):
+        """Reload the saved artifact and check it is complete and matches the trained model"""
+        saved = load_keras_model(staging_path)
+        output_size = saved.output_shape[-1]
+        if output_size != len(class_names):
+            raise Exception(f"Model has {output_size} outputs but {len(class_names)} class names")
+        if model is not None:
+            probe = np.random.default_rng(0).uniform(-1, 1, (1,) + tuple(saved.input_shape[1:])).astype(np.float32)
+            if not np.allclose(saved(probe, training=False).numpy(), model(probe, training=False).numpy(), atol=1e-4):
+                raise Exception("Saved model does not reproduce the trained model's outputs")
+        return saved
+
+    def publish(self, version, staging_path, class_names, model=None, manifest=None):
+        """Validate a staged version, move it into place and atomically make it current.
+
+        The staging directory must already contain the saved model. Requests
+        that already hold the previous LoadedModel keep using it; old
+        versions beyond MODEL_VERSIONS_TO_KEEP are then deleted.
+        """
+        class_names = list(class_names)
+        manifest = dict(manifest or {})
+        manifest.update({
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'class_names': class_names
+        })
+        with open(os.path.join(staging_path, 'class_names.json'), 'w') as f:
+            json.dump(class_names, f)
+        with open(os.path.join(staging_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        saved = self._validate(staging_path, model, class_names)
+
+        final_path = os.path.abspath(self.version_path(version))
+        os.rename(staging_path, final_path)
+        tmp_pointer = self.pointer_path + '.tmp'
+        with open(tmp_pointer, 'w') as f:
+            f.write(version)
+        os.replace(tmp_pointer, self.pointer_path)
+
+        loaded = LoadedModel(final_path, saved, class_names, self._signature(final_path), version, manifest)
+        self._attach_engine(loaded)
+        with self._lock:
+            previous = self._current
+            self._models[final_path] = loaded
+            self._current = loaded
+            # In-flight requests keep their own reference to the old version
+            if previous is not None and previous.path != final_path:
+                self._models.pop(previous.path, None)
+            self._pointer_signature = self._signature(self.pointer_path)
+
+        self.collect_garbage()
+        return loaded
+
+    def collect_garbage(self, keep=None):
+        """Delete all but the newest `keep` versions (never the current one) and stale staging dirs"""
+        keep = keep or self.app.config.get('MODEL_VERSIONS_TO_KEEP', 3)
+        current = self.current_version()
+        with self._lock:
+            entries = sorted(os.listdir(self.versions_dir)) if os.path.exists(self.versions_dir) else []
+            versions = [name for name in entries if name.startswith('v')]
+            doomed = [name for name in versions[:-keep] if name != current]
+            # A concurrent run may still be saving into a recent staging dir
+            now = time.time()
+            for name in entries:
+                if name.startswith('.staging-'):
+                    try:
+                        age = now - os.path.getmtime(os.path.join(self.versions_dir, name))
+                    except OSError:
+                        continue
+                    if age > self.STAGING_MAX_AGE:
+                        doomed.append(name)
+            for name in doomed:
+                path = os.path.abspath(os.path.join(self.versions_dir, name))
+                self._models.pop(path, None)
+                shutil.rmtree(path, ignore_errors=True)
+
+    def stats(self):
+        """Report every loaded model and the total weight memory they hold"""
+        with self._lock:
+            models = [loaded.to_dict() for loaded in self._models.values()]
+            current = (self._current.version or self._current.path) if self._current else None
+        return {
+            'current': current,
+            'models': models,
+            'total_bytes': sum(model['bytes'] for model in models)
+        }
+
+
+model_registry = ModelRegistry(app)
@@ -22,6 +22,7 @@ class PersonImage(db.Model):
     image_path = db.Column(db.String(255), nullable=False)
     person_id = db.Column(db.Integer, db.ForeignKey('person.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    embedding = db.relationship('ImageEmbedding', backref='image', uselist=False, cascade='all, delete-orphan')
 
     def to_dict(self):
         return {
@@ -30,9 +31,46 @@ class PersonImage(db.Model):
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S')
         }
 
+class ImageEmbedding(db.Model):
+    image_id = db.Column(db.Integer, db.ForeignKey('person_image.id'), primary_key=True)
+    backbone = db.Column(db.String(50), nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class ModelStats(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     last_trained = db.Column(db.DateTime, default=datetime.utcnow)
     accuracy = db.Column(db.Float)
     total_images = db.Column(db.Integer)
     training_time = db.Column(db.Float)
+
+class TrainingJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # queued -> running -> completed | failed | cancelled; cancelled and
+    # failed jobs can be queued again and resume from their last checkpoint
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    epochs = db.Column(db.Integer, nullable=False, default=20)
+    mode = db.Column(db.String(20))
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    checkpoint_epoch = db.Column(db.Integer, nullable=False, default=0)
+    progress = db.Column(db.Text)  # JSON snapshot of ModelTrainer.training_status
+    error = db.Column(db.Text)
+    worker_pid = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'epochs': self.epochs,
+            'mode': self.mode,
+            'cancel_requested': self.cancel_requested,
+            'checkpoint_epoch': self.checkpoint_epoch,
+            'error': self.error,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+
+def parse_cpu_list(spec):
+    """Parse a CPU list such as '0-3,6' into a sorted list of core ids; None if empty"""
+    if not spec:
+        return None
+    cpus = set()
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus) or None
+
+
+def pin_cpus(app, role):
+    """Pin every thread of this process to <ROLE>_CPUS; returns the CPU list or None.
+
+    Without a CPU list the process is allowed on all CPUs again, so a
+    process started by a pinned parent does not keep the parent's cores.
+    sched_setaffinity(0) only affects the calling thread on Linux, so each
+    thread in /proc/self/task is pinned. Threads started afterwards inherit
+    the mask of the thread that starts them.
+    """
+    try:
+        cpus = parse_cpu_list(app.config.get(f'{role.upper()}_CPUS'))
+    except ValueError as e:
+        print(f"Invalid {role.upper()}_CPUS: {str(e)}")
+        cpus = None
+    mask = cpus or range(os.cpu_count() or 1)
+    try:
+        thread_ids = [int(tid) for tid in os.listdir('/proc/self/task')]
+    except OSError:
+        thread_ids = [0]
+    for thread_id in thread_ids:
+        try:
+            os.sched_setaffinity(thread_id, mask)
+        except ProcessLookupError:
+            continue  # the thread exited meanwhile
+        except (AttributeError, OSError) as e:
+            print(f"Could not pin {role} to CPUs {cpus or 'all'}: {str(e)}")
+            return None
+    return cpus
+
+
+def apply_cpu_budget(app, role):
+    """Give this process the CPU budget configured for role ('inference' or 'training').
+
+    Pins the process to <ROLE>_CPUS (all CPUs if unset) and sizes TensorFlow's thread
+    pools to <ROLE>_THREADS (default: one per pinned core), so inference
+    and training stop oversubscribing the same cores. Must run before
+    TensorFlow executes its first op; returns the tensorflow module.
+    """
+    prefix = role.upper()
+    cpus = pin_cpus(app, role)
+    threads = app.config.get(f'{prefix}_THREADS') or (len(cpus) if cpus else None)
+    if role == 'training' and app.config.get('TRAINING_NICE'):
+        os.nice(app.config['TRAINING_NICE'])
+    print(f"CPU budget for {role}: cpus={cpus or 'all'} threads={threads or 'default'}")
+    from facecore.serving import configure_tensorflow
+    return configure_tensorflow(threads)
+
+
+class LatencyMonitor:
+    """Tracks recognition latency in a web process and publishes it for other processes.
+
+    Every process writes its recent p50/p95 to <directory>/<pid>.json at
+    most once per publish_interval, atomically, so the training worker can
+    read the latency of all web workers without any shared service.
+    """
+
+    def __init__(self, directory, window_seconds=10, publish_interval=1):
+        self.directory = directory
+        self.window_seconds = window_seconds
+        self.publish_interval = publish_interval
+        self.path = os.path.join(directory, f'{os.getpid()}.json')
+        self._samples = deque()
+        self._lock = threading.Lock()
+        self._last_publish = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _trim(self, now):
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+
+    def record(self, latency_ms):
+        now = time.time()
+        with self._lock:
+            self._samples.append((now, latency_ms))
+            self._trim(now)
+            publish = now - self._last_publish >= self.publish_interval
+            if publish:
+                self._last_publish = now
+        if publish:
+            self.publish()
+
+    def stats(self):
+        with self._lock:
+            self._trim(time.time())
+            latencies = np.array([latency for _, latency in self._samples])
+        if not len(latencies):
+            return {'count': 0}
+        return {
+            'count': int(len(latencies)),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'window_seconds': self.window_seconds
+        }
+
+    def publish(self):
+        stats = dict(self.stats(), pid=os.getpid(), updated_at=time.time())
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error publishing recognition latency: {str(e)}")
+
+
+def read_recognition_latency(directory, max_age=10):
+    """Return the worst recent p95 (ms) published by any web process, or None"""
+    worst = None
+    now = time.time()
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return None
+    for name in names:
+        if not name.endswith('.json'):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path, 'r') as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        age = now - stats.get('updated_at', 0)
+        if age > 3600:
+            # Left behind by a process that exited
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if age <= max_age and stats.get('count') and (worst is None or stats['p95_ms'] > worst):
+            worst = stats['p95_ms']
+    return worst
+
+
+class TrainingThrottle:
+    """Pauses training between batches while recognition latency breaks its SLO.
+
+    wait() is called after every training batch. It checks the published
+    recognition p95 at most every check_interval seconds; while it exceeds
+    slo_ms, training sleeps until latency drops below resume_ratio * slo_ms.
+    A pause lasts at most max_pause seconds before one more batch runs, so
+    training slows down under sustained load instead of stopping.
+    """
+
+    def __init__(self, latency_dir, slo_ms, resume_ratio=0.8, check_interval=0.5, max_pause=30):
+        self.latency_dir = latency_dir
+        self.slo_ms = slo_ms
+        self.resume_ratio = resume_ratio
+        self.check_interval = check_interval
+        self.max_pause = max_pause
+        self._last_check = 0
+        self.paused_seconds = 0.0
+        self.pauses = 0
+
+    def _latency(self):
+        return read_recognition_latency(self.latency_dir)
+
+    def wait(self, status=None, cancel_event=None):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        latency = self._latency()
+        if latency is None or latency <= self.slo_ms:
+            return
+
+        self.pauses += 1
+        started = time.monotonic()
+        message = status.get('message') if status is not None else None
+        while latency is not None and latency > self.slo_ms * self.resume_ratio:
+            if status is not None:
+                status['message'] = (f'Paused: recognition p95 {latency:.0f} ms is above '
+                                     f'the {self.slo_ms:.0f} ms SLO')
+            if time.monotonic() - started >= self.max_pause:
+                break
+            if cancel_event is not None:
+                if cancel_event.wait(self.check_interval):
+                    break
+            else:
+                time.sleep(self.check_interval)
+            latency = self._latency()
+        self.paused_seconds += time.monotonic() - started
+        if status is not None:
+            status['message'] = message
+            status['throttle'] = {'pauses': self.pauses, 'paused_seconds': round(self.paused_seconds, 1)}
+        self._last_check = time.monotonic()
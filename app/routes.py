@@ -1,21 +1,42 @@
 import os
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory
+from flask import render_template, request, redirect, url_for, flash, jsonify, send_from_directory, g, \
+    Response, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.datastructures import MultiDict
 from app import app, db
-from app.models import Person, PersonImage, ModelStats
-from app.face_recognition_tf import train_model, recognize_face
+from app.models import Person, PersonImage, ModelStats, TrainingJob
 import os
 from datetime import datetime
 import time
-from threading import Thread
-from app.training_utils import ModelTrainer
 import json
-from app.face_recognition_utils import FaceRecognitionSystem
+import tempfile
+import threading
+import zipfile
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from app.encoding_cache import encoding_cache
+from app.face_crop_store import face_crop_store
+from app.bulk_import import BulkImporter, iter_archive
+from app.video_recognition import VideoRecognizer, name_tracks
+from app.batching import MicroBatcher, BatcherOverloaded
+from facecore.image_utils import upload_buffer, decode_image_buffer, crop_face
+from app.temp_storage import TempStorage
+from app.warmup import Warmup, WarmupNotReady
+from app.resource_scheduler import LatencyMonitor, pin_cpus
+from app import training_jobs
+from app.dataset_fingerprint import dataset_fingerprint, published_dataset, dataset_changes
 import cv2
 import numpy as np
-import tensorflow as tf
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'webm'}
+VIDEO_MIMETYPES = {
+    'video/mp4': 'mp4',
+    'video/x-msvideo': 'avi',
+    'video/quicktime': 'mov',
+    'video/x-matroska': 'mkv',
+    'video/webm': 'webm'
+}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -28,32 +49,114 @@ training_status = {
     'error': None
 }
 
-# Initialize face recognition system and model trainer
-face_recognition = FaceRecognitionSystem(app)
-model_trainer = ModelTrainer(app)
+# TensorFlow, the face recognition system and the model trainer are loaded
+# in the background; routes that need them get them from warmup.services()
+warmup = Warmup(app)
+if app.config['WARMUP_ON_START']:
+    warmup.start()
 
-def cleanup_temp_files():
-    """Remove old temporary files"""
-    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
-    if os.path.exists(temp_dir):
-        for file in os.listdir(temp_dir):
-            file_path = os.path.join(temp_dir, file)
-            # Remove files older than 1 hour
-            if os.path.isfile(file_path) and time.time() - os.path.getmtime(file_path) > 3600:
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Error removing temporary file {file}: {str(e)}")
+@app.errorhandler(WarmupNotReady)
+def handle_warmup_not_ready(error):
+    return jsonify({'error': str(error), 'warmup': warmup.status()}), 503
+
+# Recognition latency is published for the training worker, which pauses
+# while it exceeds RECOGNITION_LATENCY_SLO_MS
+LATENCY_MONITORED_ENDPOINTS = {'recognize'}
+latency_monitor = LatencyMonitor(os.path.join(app.config['UPLOAD_FOLDER'], 'latency'))
+
+# Only a process that serves requests is pinned to INFERENCE_CPUS; the CLIs
+# and the training worker import the app too and keep their own budgets
+@app.before_first_request
+def pin_web_process():
+    pin_cpus(app, 'inference')
 
-# Add this to your routes
 @app.before_request
-def before_request():
-    cleanup_temp_files()
+def start_latency_timer():
+    if request.endpoint in LATENCY_MONITORED_ENDPOINTS:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        latency_monitor.record((time.perf_counter() - started) * 1000)
+    return response
+
+def predict_batch(batch):
+    """Run one forward pass on the current model version, here or on the inference server.
+
+    Each row is returned with the class names of the version that produced
+    it, so a hot-swap mid-request can never mismatch outputs and labels.
+    """
+    services = warmup.services()
+    if services.inference is not None:
+        return services.inference.predict(batch)
+    loaded = services.model_registry.current()
+    if loaded is None:
+        raise Exception('Model not trained yet')
+    predictions = loaded.predict(batch)
+    return [(prediction, loaded.class_names) for prediction in predictions]
+
+# Concurrent /recognize calls share forward passes through the micro-batcher
+inference_batcher = MicroBatcher(
+    predict_batch,
+    max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+    max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS'],
+    max_queue_size=app.config['INFERENCE_MAX_QUEUE_SIZE']
+)
+
+# Probe images kept for image_url live in uploads/temp, swept in the background
+temp_storage = TempStorage(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'temp'),
+    ttl=app.config['TEMP_TTL_SECONDS'],
+    max_bytes=app.config['TEMP_MAX_BYTES'],
+    sweep_interval=app.config['TEMP_SWEEP_INTERVAL']
+)
+temp_storage.start()
+
+def notify_gallery_changed(added=(), removed=(), crops_stored=False):
+    """Keep derived per-image state in sync after the gallery changes.
+
+    added is a list of committed PersonImage rows, removed a list of
+    (image_id, image_path) tuples captured before the rows were deleted.
+    crops_stored says the face crops of added images are already stored.
+    """
+    # Crop faces once at upload; training and embedding read the stored crops
+    try:
+        if not crops_stored:
+            face_crop_store.add_images(added)
+        face_crop_store.remove([image_id for image_id, _ in removed])
+    except Exception as e:
+        print(f"Error updating face crop store: {str(e)}")
+
+    try:
+        encoding_cache.add_images(added)
+        encoding_cache.remove_images([image_path for _, image_path in removed])
+    except Exception as e:
+        print(f"Error updating encoding cache: {str(e)}")
+
+    # Until warm-up is done the gallery is not loaded yet and will pick up
+    # these changes when it loads
+    if not warmup.is_ready:
+        return
+    try:
+        embedding_gallery = warmup.services().embedding_gallery
+        if app.config['RECOGNITION_MODE'] == 'embedding':
+            embedding_gallery.add_images(added)
+        embedding_gallery.remove_images([image_id for image_id, _ in removed])
+    except Exception as e:
+        print(f"Error updating embedding gallery: {str(e)}")
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once models are loaded, 503 while warming up"""
+    status = warmup.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
 @app.route('/persons')
 def get_persons():
     persons = Person.query.all()
@@ -87,6 +190,7 @@ def add_person():
         os.makedirs(upload_folder, exist_ok=True)
         
         # Process each uploaded file
+        new_images = []
         for file in files:
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
@@ -95,8 +199,10 @@ def add_person():
                 
                 new_image = PersonImage(image_path=f'faceimages/{filename}', person_id=new_person.id)
                 db.session.add(new_image)
+                new_images.append(new_image)
         
         db.session.commit()
+        notify_gallery_changed(added=new_images)
         flash(f'Person {name} added successfully with {len(files)} images', 'success')
         
     except Exception as e:
@@ -105,6 +211,42 @@ def add_person():
     
     return redirect(url_for('index'))
 
+@app.route('/persons/import', methods=['POST'])
+def import_persons():
+    """Bulk-enroll a zip or tar archive of <name>/<image> files sent as the raw request body.
+
+    The archive is read as it arrives (tar) or spooled once (zip), so it is
+    not bound by MAX_CONTENT_LENGTH. Progress is streamed back as NDJSON,
+    one line per inserted chunk, ending with a line that has "done": true.
+    """
+    if request.content_length and request.content_length > app.config['BULK_IMPORT_MAX_BYTES']:
+        return jsonify({'error': 'Archive too large'}), 413
+    filename = request.args.get('filename', '')
+    if not filename and request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+        filename = 'upload.zip'
+
+    importer = BulkImporter(
+        app,
+        ALLOWED_EXTENSIONS,
+        workers=app.config['BULK_IMPORT_WORKERS'],
+        chunk_size=app.config['BULK_IMPORT_CHUNK_SIZE'],
+        store_every=app.config['BULK_IMPORT_STORE_EVERY'],
+        require_face=request.args.get('require_face', '1') != '0',
+        on_chunk=lambda images: notify_gallery_changed(added=images, crops_stored=True)
+    )
+    entries = iter_archive(request.stream, filename, app.config['BULK_IMPORT_MAX_FILE_BYTES'],
+                           app.config['BULK_IMPORT_MAX_BYTES'])
+
+    def generate():
+        try:
+            for progress in importer.run(entries):
+                yield json.dumps(progress) + '\n'
+        except Exception as e:
+            print(f"Error importing archive: {str(e)}")
+            yield json.dumps(dict(importer.stats, error=str(e), done=True)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/person/<int:person_id>', methods=['PUT'])
 def update_person(person_id):
     person = Person.query.get_or_404(person_id)
@@ -137,6 +279,7 @@ def add_person_image(person_id):
         new_image = PersonImage(image_path=f'faceimages/{filename}', person_id=person.id)
         db.session.add(new_image)
         db.session.commit()
+        notify_gallery_changed(added=[new_image])
         
         return jsonify({'success': True}), 200
     
@@ -146,6 +289,7 @@ def add_person_image(person_id):
 def delete_person(person_id):
     try:
         person = Person.query.get_or_404(person_id)
+        removed = [(image.id, image.image_path) for image in person.images]
         
         # Delete associated image files
         for image in person.images:
@@ -155,6 +299,7 @@ def delete_person(person_id):
         
         db.session.delete(person)
         db.session.commit()
+        notify_gallery_changed(removed=removed)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -169,8 +314,9 @@ def uploaded_file(filename):
         # Get the base upload directory
         upload_dir = os.path.abspath(app.config['UPLOAD_FOLDER'])
         
-        # Check if file is in temp directory
+        # Check if file is in temp directory; it may still be being written
         if 'temp/' in filename:
+            temp_storage.wait_for(filename.split('temp/', 1)[1])
             return send_from_directory(upload_dir, filename)
         
         # For regular uploads
@@ -182,6 +328,7 @@ def uploaded_file(filename):
 
 @app.route('/recognize', methods=['POST'])
 def recognize():
+    services = warmup.services()
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -190,47 +337,62 @@ def recognize():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
 
-        # Create temp directory if it doesn't exist
-        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # Save uploaded file with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{secure_filename(file.filename)}"
-        filepath = os.path.join(temp_dir, filename)
-        file.save(filepath)
+        # Only keep a copy of the probe on disk when the client asks for its URL
+        want_image_url = request.values.get('image_url', '').lower() in ('1', 'true', 'yes')
 
         try:
-            # Process image and get prediction
-            img = cv2.imread(filepath)
+            # Decode straight from the upload stream
+            image_bytes = None
+            with upload_buffer(file) as buffer:
+                img = decode_image_buffer(buffer)
+                if img is not None and want_image_url:
+                    image_bytes = bytes(buffer)
             if img is None:
                 return jsonify({'error': 'Could not read image'}), 400
 
-            # Preprocess image
-            img = cv2.resize(img, (224, 224))
-            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            img_array = tf.keras.preprocessing.image.img_to_array(img)
-            img_array = np.expand_dims(img_array, axis=0)
-            img_array = tf.keras.applications.mobilenet_v2.preprocess_input(img_array)
+            image_url = None
+            if image_bytes is not None:
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+                filename = f"{timestamp}_{secure_filename(file.filename)}"
+                temp_storage.save_async(filename, image_bytes)
+
+                # Generate URL with forward slashes
+                image_url = url_for('uploaded_file', filename=f'temp/{filename}')
+
+            if app.config['RECOGNITION_MODE'] == 'embedding':
+                result = services.embedding_gallery.recognize(img)
+                if image_url:
+                    result['image_url'] = image_url
+                print("Recognition result:", result)
+                return jsonify(result)
+
+            # MobileNetV2 preprocessing: scale pixels to [-1, 1]
+            img_array = np.expand_dims(prepare_probe(img, probe_crops_face(services)).astype(np.float32) / 127.5 - 1.0,
+                                       axis=0)
 
             # Get prediction
-            predictions = model_trainer.model.predict(img_array)
-            predicted_class = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class])
+            if services.inference is None and services.model_registry.current() is None:
+                return jsonify({'error': 'Model not trained yet'}), 400
+            try:
+                prediction, class_names = inference_batcher.predict(
+                    img_array[0], timeout=app.config['INFERENCE_TIMEOUT'])
+            except BatcherOverloaded as e:
+                return jsonify({'error': str(e)}), 503
+            except TimeoutError:
+                return jsonify({'error': 'Inference timed out'}), 504
+            predicted_class = np.argmax(prediction)
+            confidence = float(prediction[predicted_class])
 
             # Get person name
-            person_id = model_trainer.class_names[predicted_class]
+            person_id = class_names[predicted_class]
             person = Person.query.get(int(person_id))
             
-            # Generate URL with forward slashes
-            image_url = url_for('uploaded_file', 
-                              filename=os.path.join('temp', filename).replace('\\', '/'))
-            
             result = {
                 'name': person.name if person else 'Unknown',
-                'confidence': float(confidence * 100),
-                'image_url': image_url
+                'confidence': float(confidence * 100)
             }
+            if image_url:
+                result['image_url'] = image_url
             
             print("Recognition result:", result)
             return jsonify(result)
@@ -243,43 +405,353 @@ def recognize():
         print(f"Server error: {str(e)}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
-@app.route('/retrain', methods=['POST'])
-def retrain():
+# Probe decoding for /recognize/batch runs on a small thread pool; OpenCV
+# releases the GIL while decoding. Each thread keeps its own face detector.
+probe_decode_pool = ThreadPoolExecutor(app.config['RECOGNIZE_BATCH_DECODE_THREADS'],
+                                       thread_name_prefix='probe-decode')
+_probe_local = threading.local()
+
+def probe_crops_face(services):
+    """Whether probes must be cropped to the face for the model being served.
+
+    Follows the served version's manifest rather than TRAINING_INPUT, which
+    may have changed since that version was trained; versions without an
+    input entry predate face-crop training and were trained on images.
+    """
+    if app.config['RECOGNITION_MODE'] == 'embedding':
+        return True
+    return (services.model_input() or 'images') == 'face_crops'
+
+def prepare_probe(img, crop, cascade=None):
+    """Turn a BGR probe into the 224x224 RGB model input, cropped to the face when crop is set"""
+    if crop:
+        return crop_face(img, cascade)[0]
+    img = cv2.resize(img, (224, 224))
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+def decode_probe(load, crop):
+    """Read, decode and prepare one probe on a decode thread; returns (image, error)"""
+    try:
+        data = load()
+    except Exception as e:
+        return None, str(e)
+    img = decode_image_buffer(data)
+    if img is None:
+        return None, 'Could not read image'
+    if getattr(_probe_local, 'cascade', None) is None:
+        _probe_local.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return prepare_probe(img, crop, _probe_local.cascade), None
+
+def _spool_body(stream, max_bytes):
+    """Copy a request body to a temporary file, failing once it exceeds max_bytes"""
+    spool = tempfile.TemporaryFile()
+    size = 0
+    for chunk in iter(lambda: stream.read(1 << 20), b''):
+        size += len(chunk)
+        if size > max_bytes:
+            spool.close()
+            raise Exception('Archive too large')
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+def _zip_member_loader(archive, info, max_file_bytes):
+    def load():
+        if info.file_size > max_file_bytes:
+            raise Exception('Image too large')
+        return archive.read(info)
+    return load
+
+def batch_probes(stack):
+    """Collect (filename, load) probes from files[] uploads and zip archives.
+
+    Nothing is read yet: load() returns a probe's bytes and is called batch
+    by batch on the decode threads. A zip can come as an 'archive' upload
+    or as the raw request body (Content-Type: application/zip), which is
+    not bound by MAX_CONTENT_LENGTH and is spooled to a temporary file.
+    Open archives are registered on stack.
+    """
+    archives = []
+    if request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+        max_bytes = app.config['RECOGNIZE_BATCH_MAX_BYTES']
+        if request.content_length and request.content_length > max_bytes:
+            raise Exception('Archive too large')
+        archives.append(stack.enter_context(_spool_body(request.stream, max_bytes)))
+    else:
+        archives.extend(file.stream for file in request.files.getlist('archive') if file.filename)
+
+    probes = [(file.filename, file.read) for file in request.files.getlist('files[]')
+              if file.filename and allowed_file(file.filename)]
+    max_file_bytes = app.config['RECOGNIZE_BATCH_MAX_FILE_BYTES']
+    for stream in archives:
+        archive = stack.enter_context(zipfile.ZipFile(stream))
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or '__MACOSX' in name or os.path.basename(name).startswith('.'):
+                continue
+            if allowed_file(name):
+                probes.append((name, _zip_member_loader(archive, info, max_file_bytes)))
+    return probes
+
+def recognize_probe_batch(services, probes, decoded):
+    """Recognize one batch of decoded probes; returns per-image result dicts"""
+    results = [{'filename': filename} for filename, _ in probes]
+    valid = [i for i, (img, _) in enumerate(decoded) if img is not None]
+    for result, (img, error) in zip(results, decoded):
+        if img is None:
+            result['error'] = error
+    if not valid:
+        return results
+
+    faces = np.stack([decoded[i][0] for i in valid])
+    if app.config['RECOGNITION_MODE'] == 'embedding':
+        for i, result in zip(valid, services.embedding_gallery.recognize_faces(faces)):
+            results[i].update(result)
+        return results
+
+    rows = predict_batch(faces.astype(np.float32) / 127.5 - 1.0)
+    person_ids = [int(class_names[np.argmax(prediction)]) for prediction, class_names in rows]
+    names = {person.id: person.name for person in Person.query.filter(Person.id.in_(set(person_ids)))}
+    for i, (prediction, _), person_id in zip(valid, rows, person_ids):
+        results[i].update({
+            'name': names.get(person_id, 'Unknown'),
+            'confidence': float(np.max(prediction)) * 100
+        })
+    return results
+
+def iter_batch_results(services, probes, batch_size):
+    """Yield per-image results in input order, reading and decoding the next batch while the current one runs"""
+    crop = probe_crops_face(services)
+    pending = None
+    for start in range(0, len(probes), batch_size):
+        chunk = probes[start:start + batch_size]
+        decoding = [probe_decode_pool.submit(decode_probe, load, crop) for _, load in chunk]
+        if pending is not None:
+            yield from recognize_probe_batch(services, pending[0], [f.result() for f in pending[1]])
+        pending = (chunk, decoding)
+    if pending is not None:
+        yield from recognize_probe_batch(services, pending[0], [f.result() for f in pending[1]])
+
+@app.route('/recognize/batch', methods=['POST'])
+def recognize_batch():
+    """Recognize many probes per request: files[] uploads and/or a zip archive.
+
+    Probes are decoded concurrently and recognized in forward passes of
+    RECOGNIZE_BATCH_SIZE. With ?stream=1 (or Accept: application/x-ndjson)
+    results are streamed as NDJSON lines as each batch finishes, followed
+    by a summary line; otherwise one JSON document is returned.
+    """
+    services = warmup.services()
+    # Uploaded archives stay open until the last batch has been read
+    stack = ExitStack()
+    try:
+        probes = batch_probes(stack)
+    except Exception as e:
+        stack.close()
+        return jsonify({'error': f'Could not read upload: {str(e)}'}), 400
+    error = None
+    if not probes:
+        error = 'No images uploaded'
+    elif len(probes) > app.config['RECOGNIZE_BATCH_MAX_IMAGES']:
+        error = f"At most {app.config['RECOGNIZE_BATCH_MAX_IMAGES']} images per request"
+    elif app.config['RECOGNITION_MODE'] != 'embedding' and services.inference is None \
+            and services.model_registry.current() is None:
+        error = 'Model not trained yet'
+    if error:
+        stack.close()
+        return jsonify({'error': error}), 400
+
+    batch_size = min(request.args.get('batch_size', app.config['RECOGNIZE_BATCH_SIZE'], type=int),
+                     app.config['RECOGNIZE_BATCH_SIZE'])
+    stream = request.args.get('stream', '').lower() in ('1', 'true', 'yes') or \
+        'application/x-ndjson' in request.headers.get('Accept', '')
+    started = time.perf_counter()
+
+    def summary(count, error=None):
+        line = {'done': True, 'count': count,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}
+        if error:
+            line['error'] = error
+        return line
+
+    if stream:
+        def generate():
+            count = 0
+            with stack:
+                try:
+                    for index, result in enumerate(iter_batch_results(services, probes, max(1, batch_size))):
+                        count += 1
+                        yield json.dumps(dict(result, index=index)) + '\n'
+                    yield json.dumps(summary(count)) + '\n'
+                except Exception as e:
+                    print(f"Batch recognition error: {str(e)}")
+                    yield json.dumps(summary(count, f'Recognition failed: {str(e)}')) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    with stack:
+        try:
+            results = [dict(result, index=index) for index, result
+                       in enumerate(iter_batch_results(services, probes, max(1, batch_size)))]
+        except Exception as e:
+            print(f"Batch recognition error: {str(e)}")
+            return jsonify({'error': f'Recognition failed: {str(e)}'}), 400
+    return jsonify(dict(summary(len(results)), results=results))
+
+def video_options(values=None):
+    """VideoRecognizer options from config, overridable per request"""
+    values = values if values is not None else MultiDict()
+    return {
+        'detect_every': values.get('detect_every', app.config['VIDEO_DETECT_EVERY'], type=int),
+        'classify_per_track': values.get('classify_per_track', app.config['VIDEO_CLASSIFY_PER_TRACK'], type=int),
+        'detect_width': app.config['VIDEO_DETECT_WIDTH'],
+        'frame_stride': values.get('frame_stride', app.config['VIDEO_FRAME_STRIDE'], type=int),
+        'track_threshold': app.config['VIDEO_TRACK_THRESHOLD']
+    }
+
+def _save_body(stream, path, max_bytes):
+    """Copy a request body to path; returns False once it exceeds max_bytes"""
+    size = 0
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            size += len(chunk)
+            if size > max_bytes:
+                return False
+            f.write(chunk)
+    return True
+
+@app.route('/recognize/video', methods=['POST'])
+def recognize_video():
+    """Identify the people in a video clip: one identity and time range per tracked face.
+
+    The clip is a multipart 'file' upload, bound by MAX_CONTENT_LENGTH, or
+    the raw request body (?filename=clip.mp4 or a video Content-Type),
+    bound by VIDEO_MAX_BYTES instead. It is processed before responding.
+    """
+    services = warmup.services()
+    if request.mimetype == 'multipart/form-data':
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'error': 'No file uploaded'}), 400
+        file = request.files['file']
+        extension = file.filename.rsplit('.', 1)[-1].lower()
+    else:
+        if request.content_length and request.content_length > app.config['VIDEO_MAX_BYTES']:
+            return jsonify({'error': 'Video too large'}), 413
+        file = None
+        filename = request.args.get('filename', '')
+        extension = filename.rsplit('.', 1)[-1].lower() if filename else VIDEO_MIMETYPES.get(request.mimetype, '')
+    if extension not in VIDEO_EXTENSIONS:
+        return jsonify({'error': 'Unsupported video format'}), 400
+    if services.inference is None and services.model_registry.current() is None:
+        return jsonify({'error': 'Model not trained yet'}), 400
+
+    # VideoCapture reads from a path, so the clip is kept on disk while it is processed
+    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
+    os.makedirs(temp_dir, exist_ok=True)
+    video_path = os.path.join(temp_dir, f"video_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.{extension}")
     try:
-        # Check if training_status is properly initialized
-        if not hasattr(model_trainer, 'training_status') or not isinstance(model_trainer.training_status, dict):
-            return jsonify({'error': 'Training status is unavailable'}), 500
-        # Prevent starting multiple training sessions simultaneously
-        if model_trainer.training_status.get('is_training', False):
-            return jsonify({'error': 'Training is already in progress'}), 400
+        if file is not None:
+            file.save(video_path)
+        elif not _save_body(request.stream, video_path, app.config['VIDEO_MAX_BYTES']):
+            return jsonify({'error': 'Video too large'}), 413
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # Form fields of a raw body are not read: parsing them would apply MAX_CONTENT_LENGTH
+        options = video_options(request.values if file is not None else request.args)
+        result = VideoRecognizer(cascade, predict_batch, **options).recognize(video_path)
+        return jsonify(name_tracks(result))
+    except Exception as e:
+        print(f"Video recognition error: {str(e)}")
+        return jsonify({'error': f'Recognition failed: {str(e)}'}), 400
+    finally:
+        if os.path.exists(video_path):
+            os.remove(video_path)
+
+@app.route('/inference-stats')
+def inference_stats():
+    stats = inference_batcher.stats()
+    stats['latency'] = latency_monitor.stats()
+    return jsonify(stats)
+
+@app.route('/model-registry')
+def model_registry_stats():
+    services = warmup.services()
+    if services.inference is not None:
+        return jsonify(services.inference.stats()['registry'])
+    return jsonify(services.model_registry.stats())
+
+def start_training_worker():
+    if app.config['TRAINING_WORKER_AUTOSTART']:
+        try:
+            if training_jobs.ensure_worker(app):
+                print("Started training worker process")
+        except Exception as e:
+            print(f"Error starting training worker: {str(e)}")
 
-        print("Starting model training...")
+def start_worker_for_queued_job():
+    """Start a worker for a job left queued by a worker that was exiting when it was submitted"""
+    job = training_jobs.active_job()
+    if job is not None and job.status == 'queued':
+        start_training_worker()
 
-        # Start training in a background thread
-        thread = Thread(target=lambda: model_trainer.train_model(epochs=20))
-        thread.daemon = True
-        thread.start()
+@app.route('/retrain', methods=['POST'])
+def retrain():
+    try:
+        # Nothing to do if the current model was trained on exactly this data
+        data = request.get_json(silent=True) or {}
+        force = str(data.get('force', request.values.get('force', ''))).lower() in ('1', 'true', 'yes')
+        if not force:
+            fingerprint, records = dataset_fingerprint(app, mode=app.config['TRAINING_MODE'], epochs=20,
+                                                       input=app.config['TRAINING_INPUT'])
+            published = published_dataset(app)
+            if published.get('fingerprint') == fingerprint:
+                return jsonify({'success': True, 'status': 'up_to_date', 'fingerprint': fingerprint}), 200
+            print(f"Dataset changed since the current model: "
+                  f"{dataset_changes(published.get('records', []), records)}")
+
+        # Training runs in the training worker process, never in this one
+        try:
+            job = training_jobs.submit_job(epochs=20)
+        except Exception as e:
+            start_worker_for_queued_job()
+            return jsonify({'error': str(e)}), 400
 
-        return jsonify({'success': True, 'status': 'started'}), 200
+        print(f"Queued training job {job.id}")
+        start_training_worker()
+        return jsonify({'success': True, 'status': 'started', 'job_id': job.id}), 200
 
     except Exception as e:
         print(f"Error starting training: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/retrain/cancel', methods=['POST'])
+def cancel_training():
+    try:
+        job = training_jobs.cancel_job(request.values.get('job_id', type=int))
+        return jsonify({'success': True, 'job': job.to_dict()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/retrain/resume', methods=['POST'])
+def resume_training():
+    try:
+        job = training_jobs.resume_job(request.values.get('job_id', type=int))
+    except Exception as e:
+        start_worker_for_queued_job()
+        return jsonify({'error': str(e)}), 400
+    start_training_worker()
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/training-jobs')
+def list_training_jobs():
+    jobs = TrainingJob.query.order_by(TrainingJob.id.desc()).limit(20).all()
+    return jsonify([job.to_dict() for job in jobs])
+
 @app.route('/training-progress')
 def get_training_progress():
     try:
-        training_status = model_trainer.training_status
-        return jsonify({
-            'is_training': training_status.get('is_training', False),
-            'progress': training_status.get('progress', 0),
-            'message': training_status.get('message', 'No message available'),
-            'current_epoch': training_status.get('current_epoch', 0),
-            'total_epochs': training_status.get('total_epochs', 0),
-            'current_accuracy': training_status.get('current_accuracy', 0.0),
-            'best_accuracy': training_status.get('best_accuracy', 0.0),
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        progress = training_jobs.job_progress(training_jobs.latest_job())
+        progress['timestamp'] = datetime.utcnow().isoformat()
+        return jsonify(progress)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -334,6 +806,7 @@ def add_person_images(person_id):
     try:
         person = Person.query.get_or_404(person_id)
         files = request.files.getlist('files[]')
+        new_images = []
         
         for file in files:
             if file and allowed_file(file.filename):
@@ -343,8 +816,10 @@ def add_person_images(person_id):
                 
                 new_image = PersonImage(image_path=filename, person_id=person.id)
                 db.session.add(new_image)
+                new_images.append(new_image)
         
         db.session.commit()
+        notify_gallery_changed(added=new_images)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -354,6 +829,7 @@ def add_person_images(person_id):
 def delete_image(image_id):
     try:
         image = PersonImage.query.get_or_404(image_id)
+        removed = [(image.id, image.image_path)]
         
         # Delete the file
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], image.image_path)
@@ -362,36 +838,25 @@ def delete_image(image_id):
         
         db.session.delete(image)
         db.session.commit()
+        notify_gallery_changed(removed=removed)
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
         return str(e), 400
 
-@app.route('/training-progress')
-def training_progress():
-    return jsonify(model_trainer.training_status)
-
 @app.route('/training-history')
 def training_history():
-    history = model_trainer.load_training_history()
+    history = warmup.services().model_trainer.load_training_history()
     return jsonify(history if history else {})
 
 @app.route('/cleanup-temp', methods=['POST'])
 def cleanup_temp():
     try:
-        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'temp')
-        if os.path.exists(temp_dir):
-            # Remove files older than 1 hour
-            current_time = time.time()
-            for filename in os.listdir(temp_dir):
-                filepath = os.path.join(temp_dir, filename)
-                if os.path.isfile(filepath):
-                    file_time = os.path.getmtime(filepath)
-                    if current_time - file_time > 3600:  # 1 hour
-                        try:
-                            os.remove(filepath)
-                        except Exception as e:
-                            print(f"Error removing {filepath}: {e}")
-        return jsonify({'success': True})
+        temp_storage.sweep()
+        return jsonify({'success': True, 'stats': temp_storage.stats()})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+@app.route('/temp-stats')
+def temp_stats():
+    return jsonify(temp_storage.stats())
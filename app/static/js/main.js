@@ -389,6 +389,13 @@ async function startModelTraining() {
 
         if (!response.ok) throw new Error('Training failed');
 
+        const data = await response.json();
+        if (data.status === 'up_to_date') {
+            hideTrainingOverlay();
+            showSuccess('Model is already up to date with the enrolled images');
+            return;
+        }
+
         // Start polling for training progress
         pollTrainingProgress();
     } catch (error) {
@@ -434,6 +441,10 @@ async function pollTrainingProgress() {
                 clearInterval(interval);
                 hideTrainingOverlay();
                 showError('Model training failed: ' + data.error);
+            } else if (data.status === 'cancelled') {
+                clearInterval(interval);
+                hideTrainingOverlay();
+                showError('Model training was cancelled');
             } else {
                 progress = data.progress;
                 progressBar.style.width = `${progress}%`;
@@ -647,6 +658,7 @@ async function handleRecognizeSubmission(form) {
         showLoading('Recognizing...', 'Processing image');
         
         const formData = new FormData(form);
+        const file = formData.get('file');
         const response = await fetch('/recognize', {  // Make sure this matches your route
             method: 'POST',
             body: formData
@@ -664,6 +676,11 @@ async function handleRecognizeSubmission(form) {
             throw new Error('Invalid response from server');
         }
 
+        // The server only stores the probe when asked for image_url; show the local file instead
+        if (!result.image_url && file instanceof File) {
+            result.image_url = URL.createObjectURL(file);
+        }
+
         hideLoading();
         showRecognitionResult(result);
     } catch (error) {
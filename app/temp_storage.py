@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TempStorage:
+    """Scratch directory for probe images, cleaned up off the request path.
+
+    Files are written asynchronously and tracked in memory with their age
+    and size. A background sweeper periodically rescans the directory,
+    deletes files older than ttl and evicts the oldest files whenever the
+    total size exceeds max_bytes, so requests never pay for a directory scan.
+    """
+
+    def __init__(self, directory, ttl=3600, max_bytes=512 * 1024 * 1024, sweep_interval=60):
+        self.directory = os.path.abspath(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._files = {}
+        self._total_bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='temp-writer')
+        self._thread = None
+        self._stop = threading.Event()
+        self.counters = {
+            'writes': 0,
+            'bytes_written': 0,
+            'expired': 0,
+            'evicted': 0,
+            'errors': 0,
+            'sweeps': 0,
+            'last_sweep': None
+        }
+        os.makedirs(self.directory, exist_ok=True)
+
+    def start(self):
+        """Start the background sweeper thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='temp-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping temp storage: {str(e)}")
+            if self._stop.wait(self.sweep_interval):
+                return
+
+    def path_for(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _remove(self, filename, counter):
+        """Delete one tracked file; caller holds the lock"""
+        try:
+            os.remove(self.path_for(filename))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.counters['errors'] += 1
+            print(f"Error removing temporary file {filename}: {str(e)}")
+            return
+        _, size = self._files.pop(filename, (0, 0))
+        self._total_bytes -= size
+        self.counters[counter] += 1
+
+    def _enforce_quota(self):
+        """Evict oldest files until the directory fits in max_bytes; caller holds the lock"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for filename, _ in sorted(self._files.items(), key=lambda item: item[1][0]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if filename not in self._pending:
+                self._remove(filename, 'evicted')
+
+    def _write(self, filename, data):
+        path = self.path_for(filename)
+        try:
+            tmp_path = path + '.part'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._files[filename] = (time.time(), len(data))
+                self._total_bytes += len(data)
+                self.counters['writes'] += 1
+                self.counters['bytes_written'] += len(data)
+                self._pending.pop(filename, None)
+                self._enforce_quota()
+        except Exception as e:
+            with self._lock:
+                self._pending.pop(filename, None)
+                self.counters['errors'] += 1
+            print(f"Error writing temporary file {filename}: {str(e)}")
+
+    def save_async(self, filename, data):
+        """Write data to the temp directory in the background; returns the final path"""
+        with self._lock:
+            self._pending[filename] = self._writer.submit(self._write, filename, data)
+        return self.path_for(filename)
+
+    def wait_for(self, filename, timeout=5):
+        """Block until a pending write of filename has landed on disk"""
+        with self._lock:
+            future = self._pending.get(filename)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def sweep(self):
+        """Rescan the directory, expire old files and enforce the size quota"""
+        now = time.time()
+        found = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    st = entry.stat()
+                    found[entry.name] = (st.st_mtime, st.st_size)
+
+        with self._lock:
+            # Keep files that save_async landed after the scan started; the
+            # snapshot may have missed them
+            for filename, (added, size) in self._files.items():
+                if added >= now and filename not in found:
+                    found[filename] = (added, size)
+            self._files = found
+            self._total_bytes = sum(size for _, size in found.values())
+            for filename, (mtime, _) in list(found.items()):
+                if now - mtime > self.ttl and filename not in self._pending:
+                    self._remove(filename, 'expired')
+            self._enforce_quota()
+            self.counters['sweeps'] += 1
+            self.counters['last_sweep'] = now
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats.update({
+                'files': len(self._files),
+                'bytes': self._total_bytes,
+                'pending_writes': len(self._pending),
+                'ttl': self.ttl,
+                'max_bytes': self.max_bytes,
+                'sweep_interval': self.sweep_interval
+            })
+        return stats
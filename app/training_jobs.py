@@ -0,0 +1,290 @@
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from app import db
+from app.models import TrainingJob
+
+ACTIVE_STATUSES = ('queued', 'running')
+RESUMABLE_STATUSES = ('cancelled', 'failed')
+
+
+class TrainingCancelled(Exception):
+    """Raised inside a training run when its job has been cancelled"""
+
+
+def latest_job():
+    return TrainingJob.query.order_by(TrainingJob.id.desc()).first()
+
+
+def active_job():
+    return TrainingJob.query.filter(TrainingJob.status.in_(ACTIVE_STATUSES)).order_by(TrainingJob.id).first()
+
+
+def submit_job(epochs=20, mode=None):
+    """Queue a training run; raises if one is already queued or running"""
+    if active_job() is not None:
+        raise Exception('Training is already in progress')
+    job = TrainingJob(status='queued', epochs=epochs, mode=mode)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def cancel_job(job_id=None):
+    """Cancel a queued job right away, or ask the runner to stop a running one"""
+    job = TrainingJob.query.get(job_id) if job_id else active_job()
+    if job is None or job.status not in ACTIVE_STATUSES:
+        raise Exception('No training in progress')
+    if job.status == 'queued':
+        job.status = 'cancelled'
+        job.finished_at = datetime.utcnow()
+    else:
+        job.cancel_requested = True
+    db.session.commit()
+    return job
+
+
+def resume_job(job_id=None):
+    """Queue a cancelled or failed job again; it continues from its last checkpoint"""
+    if active_job() is not None:
+        raise Exception('Training is already in progress')
+    if job_id:
+        job = TrainingJob.query.get(job_id)
+    else:
+        job = TrainingJob.query.filter(TrainingJob.status.in_(RESUMABLE_STATUSES)) \
+            .order_by(TrainingJob.id.desc()).first()
+    if job is None or job.status not in RESUMABLE_STATUSES:
+        raise Exception('No cancelled or failed training job to resume')
+    job.status = 'queued'
+    job.cancel_requested = False
+    job.error = None
+    job.finished_at = None
+    db.session.commit()
+    return job
+
+
+def job_progress(job):
+    """Training progress of a job in the shape /training-progress reports"""
+    progress = json.loads(job.progress) if job and job.progress else {}
+    if job is None:
+        message = 'No training has run yet'
+    elif job.status == 'queued':
+        message = 'Waiting for the training worker...'
+    elif job.status == 'cancelled':
+        message = 'Training cancelled'
+    else:
+        message = progress.get('message', '')
+    return {
+        'job_id': job.id if job else None,
+        'status': job.status if job else None,
+        'is_training': bool(job and job.status in ACTIVE_STATUSES),
+        'progress': progress.get('progress', 0),
+        'message': message,
+        'error': job.error if job else None,
+        'current_epoch': progress.get('current_epoch', 0),
+        'total_epochs': progress.get('total_epochs', job.epochs if job else 0),
+        'current_accuracy': progress.get('current_accuracy', 0.0),
+        'best_accuracy': progress.get('best_accuracy', 0.0),
+        'checkpoint_epoch': job.checkpoint_epoch if job else 0,
+        'cancel_requested': bool(job and job.cancel_requested)
+    }
+
+
+def _worker_lock_path(app):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'training_worker.lock')
+
+
+def worker_running(app):
+    """True if a training worker process holds the worker lock"""
+    with open(_worker_lock_path(app), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+
+def ensure_worker(app):
+    """Start a training worker process (flask training-worker) unless one is running"""
+    if worker_running(app):
+        return False
+    env = dict(os.environ, FLASK_APP='app', WARMUP_ON_START='0')
+    subprocess.Popen(
+        [sys.executable, '-m', 'flask', 'training-worker', '--exit-when-idle'],
+        cwd=os.path.dirname(app.root_path),
+        env=env,
+        start_new_session=True
+    )
+    return True
+
+
+class TrainingJobRunner:
+    """Runs queued TrainingJobs one at a time in a dedicated process.
+
+    Training never shares the web process's GIL or TensorFlow thread pools.
+    While a job runs, a reporter thread copies ModelTrainer.training_status
+    into the job row and picks up cancel requests. Weights are checkpointed
+    every epoch, so a cancelled, failed or interrupted job resumes where it
+    stopped. A file lock ensures one runner per machine; on start it
+    re-queues jobs left 'running' by a runner that died.
+    """
+
+    def __init__(self, app, poll_interval=2, progress_interval=1, idle_timeout=None):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.idle_timeout = idle_timeout
+        self.checkpoint_root = os.path.join(app.config['UPLOAD_FOLDER'], 'training_checkpoints')
+        self._trainer = None
+        self._lock_file = None
+
+    def checkpoint_path(self, job):
+        return os.path.join(self.checkpoint_root, f'job-{job.id}')
+
+    def _acquire_lock(self):
+        self._lock_file = open(_worker_lock_path(self.app), 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+        return True
+
+    def _release_lock(self):
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._lock_file.close()
+        self._lock_file = None
+
+    def requeue_orphans(self):
+        """Re-queue jobs a dead runner left 'running'; only called while holding the lock"""
+        for job in TrainingJob.query.filter_by(status='running').all():
+            print(f"Re-queueing interrupted training job {job.id} from epoch {job.checkpoint_epoch}")
+            job.status = 'queued'
+        db.session.commit()
+
+    def claim(self):
+        """Atomically move the oldest queued job to running; returns it or None"""
+        job = TrainingJob.query.filter_by(status='queued').order_by(TrainingJob.id).first()
+        if job is None:
+            return None
+        now = datetime.utcnow()
+        claimed = TrainingJob.query.filter_by(id=job.id, status='queued').update({
+            'status': 'running',
+            'worker_pid': os.getpid(),
+            'started_at': now,
+            'heartbeat_at': now
+        })
+        db.session.commit()
+        return TrainingJob.query.get(job.id) if claimed else None
+
+    def _report(self, job_id, trainer, cancel_event, stop_event):
+        """Publish training progress and watch for cancel requests until stop_event is set"""
+        with self.app.app_context():
+            while not stop_event.wait(self.progress_interval):
+                try:
+                    job = TrainingJob.query.get(job_id)
+                    job.progress = json.dumps(trainer.training_status, default=float)
+                    job.checkpoint_epoch = trainer.training_status.get('checkpoint_epoch', job.checkpoint_epoch)
+                    job.heartbeat_at = datetime.utcnow()
+                    if job.cancel_requested:
+                        cancel_event.set()
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error reporting training progress: {str(e)}")
+                finally:
+                    db.session.remove()
+
+    def run_job(self, job):
+        if self._trainer is None:
+            from app.training_utils import ModelTrainer
+            self._trainer = ModelTrainer(self.app)
+            slo_ms = self.app.config.get('RECOGNITION_LATENCY_SLO_MS')
+            if slo_ms:
+                from app.resource_scheduler import TrainingThrottle
+                self._trainer.throttle = TrainingThrottle(
+                    os.path.join(self.app.config['UPLOAD_FOLDER'], 'latency'),
+                    slo_ms,
+                    max_pause=self.app.config.get('TRAINING_MAX_PAUSE_SECONDS', 30)
+                )
+        trainer = self._trainer
+        checkpoint_path = self.checkpoint_path(job)
+
+        print(f"Running training job {job.id} ({job.epochs} epochs, resuming at epoch {job.checkpoint_epoch})")
+        cancel_event = threading.Event()
+        stop_event = threading.Event()
+        reporter = threading.Thread(target=self._report, args=(job.id, trainer, cancel_event, stop_event),
+                                    name='training-progress', daemon=True)
+        reporter.start()
+        try:
+            succeeded = trainer.train_model(
+                epochs=job.epochs,
+                mode=job.mode,
+                checkpoint_path=checkpoint_path,
+                initial_epoch=job.checkpoint_epoch,
+                cancel_event=cancel_event
+            )
+        finally:
+            stop_event.set()
+            reporter.join()
+
+        db.session.refresh(job)
+        status = trainer.training_status
+        job.progress = json.dumps(status, default=float)
+        job.checkpoint_epoch = status.get('checkpoint_epoch', job.checkpoint_epoch)
+        job.finished_at = datetime.utcnow()
+        job.cancel_requested = False
+        if succeeded:
+            job.status = 'completed'
+            shutil.rmtree(checkpoint_path, ignore_errors=True)
+        elif cancel_event.is_set():
+            job.status = 'cancelled'
+        else:
+            job.status = 'failed'
+            job.error = status.get('error')
+        db.session.commit()
+        print(f"Training job {job.id} {job.status}")
+
+    def run_forever(self):
+        if not self._acquire_lock():
+            print("Another training worker is already running")
+            return
+        from app.resource_scheduler import apply_cpu_budget
+        apply_cpu_budget(self.app, 'training')
+
+        print(f"Training worker (pid {os.getpid()}) waiting for jobs")
+        idle_since = time.monotonic()
+        with self.app.app_context():
+            self.requeue_orphans()
+            while True:
+                job = self.claim()
+                if job is not None:
+                    try:
+                        self.run_job(job)
+                    except Exception as e:
+                        db.session.rollback()
+                        print(f"Error running training job {job.id}: {str(e)}")
+                        TrainingJob.query.filter_by(id=job.id).update({'status': 'failed', 'error': str(e)})
+                        db.session.commit()
+                    idle_since = time.monotonic()
+                elif self.idle_timeout and time.monotonic() - idle_since > self.idle_timeout:
+                    # A job submitted while this worker still held the lock
+                    # found no worker to start; after releasing the lock, look
+                    # again and keep going if nobody else took over
+                    self._release_lock()
+                    db.session.remove()
+                    if TrainingJob.query.filter_by(status='queued').first() is None or not self._acquire_lock():
+                        print("Training worker idle; exiting")
+                        return
+                    idle_since = time.monotonic()
+                else:
+                    db.session.remove()
+                    time.sleep(self.poll_interval)
@@ -1,18 +1,46 @@
 import os
+import shutil
 import numpy as np
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
 import tensorflow as tf
 from datetime import datetime
 import json
-from app.models import Person, PersonImage
+from app.models import PersonImage
 from app.face_recognition_utils import FaceRecognitionSystem
+from app.feature_cache import FeatureCache
+from app.model_registry import model_registry
+from facecore.tflite_engine import export_tflite
+from app.training_jobs import TrainingCancelled
+from app.dataset_fingerprint import dataset_fingerprint, write_dataset, read_dataset, content_hashes
+from app.data_pipeline import gallery_records, split_records, make_dataset, make_crop_dataset, dataset_cache_path
+from app.face_crop_store import face_crop_store
+
+# Identifies the features create_feature_extractor produces, so cached
+# features are discarded if the backbone ever changes
+BACKBONE_NAME = 'mobilenet_v2_imagenet_gap'
+FEATURE_DIM = 1280
+
+def create_backbone():
+    """Create the frozen ImageNet MobileNetV2 backbone shared by all models"""
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=(224, 224, 3),
+        include_top=False,
+        weights='imagenet'
+    )
+    base_model.trainable = False
+    return base_model
+
+def create_feature_extractor():
+    """Create a model mapping a preprocessed face to its pooled backbone features"""
+    base_model = create_backbone()
+    inputs = tf.keras.Input(shape=(224, 224, 3))
+    x = base_model(inputs, training=False)
+    outputs = tf.keras.layers.GlobalAveragePooling2D()(x)
+    return tf.keras.Model(inputs, outputs)
 
 class ModelTrainer:
     def __init__(self, app):
         self.app = app
-        self.model = None
-        self.class_names = []
         self.training_status = {
             'is_training': False,
             'progress': 0,
@@ -20,78 +48,115 @@ class ModelTrainer:
             'current_epoch': 0,
             'total_epochs': 0
         }
+        self.feature_cache = None
+        # Set per run by train_model
+        self.checkpoint_path = None
+        self.initial_epoch = 0
+        self.cancel_event = None
+        # Optional TrainingThrottle that yields to recognition between batches
+        self.throttle = None
         # Try to load model at initialization
         self.load_model()
 
-    def prepare_data(self, use_augmentation=True):
-        """Prepare training data"""
-        try:
-            data_dir = os.path.join(self.app.config['UPLOAD_FOLDER'], 'training_data')
-            os.makedirs(data_dir, exist_ok=True)
-
-            # Organize images by person
-            persons = Person.query.all()
-            for person in persons:
-                person_dir = os.path.join(data_dir, str(person.id))
-                os.makedirs(person_dir, exist_ok=True)
-                
-                for image in person.images:
-                    src_path = os.path.join(self.app.config['UPLOAD_FOLDER'], image.image_path)
-                    if os.path.exists(src_path):
-                        import shutil
-                        dest_path = os.path.join(person_dir, os.path.basename(image.image_path))
-                        shutil.copy2(src_path, dest_path)
-
-            # Create data generator
-            datagen = ImageDataGenerator(
-                rescale=1./255,
-                validation_split=0.2
-            )
+    @property
+    def model(self):
+        loaded = model_registry.current()
+        return loaded.model if loaded else None
 
-            if use_augmentation:
-                datagen = ImageDataGenerator(
-                    rescale=1./255,
-                    rotation_range=20,
-                    width_shift_range=0.2,
-                    height_shift_range=0.2,
-                    horizontal_flip=True,
-                    validation_split=0.2
-                )
+    @property
+    def class_names(self):
+        loaded = model_registry.current()
+        return loaded.class_names if loaded else []
 
-            # Create generators
-            train_generator = datagen.flow_from_directory(
-                data_dir,
-                target_size=(224, 224),
-                batch_size=32,
-                class_mode='categorical',
-                subset='training'
-            )
+    def dataset_cache(self, paths, labels, tag):
+        """Return the tf.data cache argument for a record list according to DATASET_CACHE"""
+        setting = self.app.config.get('DATASET_CACHE', 'file')
+        if setting == 'memory':
+            return ''
+        if setting == 'file':
+            cache_dir = os.path.join(self.app.config['UPLOAD_FOLDER'], 'dataset_cache')
+            return dataset_cache_path(cache_dir, paths, labels, tag)
+        return None
 
-            validation_generator = datagen.flow_from_directory(
-                data_dir,
-                target_size=(224, 224),
-                batch_size=32,
-                class_mode='categorical',
-                subset='validation'
+    def prepare_data(self, use_augmentation=True, preprocess=None, batch_size=32):
+        """Prepare training and validation datasets straight from the PersonImage rows.
+
+        preprocess defaults to rescaling pixels to [0, 1].
+        """
+        try:
+            paths, labels, class_names = gallery_records(self.app.config['UPLOAD_FOLDER'])
+            if not class_names:
+                raise Exception("No images found for training")
+            if preprocess is None:
+                preprocess = lambda images: images / 255.0
+
+            (train_paths, train_labels), (val_paths, val_labels) = split_records(paths, labels)
+            if self.uses_face_crops:
+                return self.prepare_crop_data(train_paths, train_labels, val_paths, val_labels, class_names,
+                                              use_augmentation, preprocess, batch_size)
+            train_dataset = make_dataset(
+                train_paths, train_labels, len(class_names),
+                preprocess=preprocess,
+                batch_size=batch_size,
+                training=True,
+                augment=use_augmentation,
+                cache=self.dataset_cache(train_paths, train_labels, 'train')
             )
+            validation_dataset = None
+            if val_paths:
+                validation_dataset = make_dataset(
+                    val_paths, val_labels, len(class_names),
+                    preprocess=preprocess,
+                    batch_size=batch_size,
+                    cache=self.dataset_cache(val_paths, val_labels, 'validation')
+                )
 
-            return train_generator, validation_generator
+            return train_dataset, validation_dataset, class_names
 
         except Exception as e:
             raise Exception(f"Error preparing data: {str(e)}")
 
+    @property
+    def uses_face_crops(self):
+        """True when models train on the face crops stored at upload time instead of whole images"""
+        return self.app.config.get('TRAINING_INPUT', 'images') == 'face_crops'
+
+    def crop_rows(self, paths):
+        """Stored face crops for gallery image paths, cropping any the store is missing"""
+        upload_folder = self.app.config['UPLOAD_FOLDER']
+        by_path = {os.path.join(upload_folder, image.image_path): image for image in PersonImage.query.all()}
+        images = [by_path[path] for path in paths]
+        face_crop_store.ensure(images)
+        rows = [face_crop_store.row(image.id) for image in images]
+        missing = [image.image_path for image, row in zip(images, rows) if row is None]
+        if missing:
+            raise Exception(f"No face crop for {len(missing)} images, e.g. {missing[0]}")
+        return rows
+
+    def prepare_crop_data(self, train_paths, train_labels, val_paths, val_labels, class_names,
+                          use_augmentation, preprocess, batch_size):
+        """Training and validation datasets read from the face crop store"""
+        train_dataset = make_crop_dataset(
+            self.crop_rows(train_paths), train_labels, len(class_names),
+            preprocess=preprocess,
+            batch_size=batch_size,
+            training=True,
+            augment=use_augmentation
+        )
+        validation_dataset = None
+        if val_paths:
+            validation_dataset = make_crop_dataset(
+                self.crop_rows(val_paths), val_labels, len(class_names),
+                preprocess=preprocess,
+                batch_size=batch_size
+            )
+        return train_dataset, validation_dataset, class_names
+
     def create_model(self, num_classes):
         """Create and compile the model with compatible optimizer settings"""
         try:
-            # Load the pre-trained MobileNetV2 model
-            base_model = tf.keras.applications.MobileNetV2(
-                input_shape=(224, 224, 3),
-                include_top=False,
-                weights='imagenet'
-            )
-            
-            # Freeze the base model layers
-            base_model.trainable = False
+            # Load the pre-trained, frozen MobileNetV2 model
+            base_model = create_backbone()
 
             # Create the new model
             inputs = tf.keras.Input(shape=(224, 224, 3))
@@ -118,104 +183,374 @@ class ModelTrainer:
             print(f"Error creating model: {str(e)}")
             raise
 
-    def train_model(self, epochs=20):
-        """Train the model"""
+    def restore_checkpoint(self, model, class_names):
+        """Load the weights saved by an interrupted run of the same job, if they still fit"""
+        if not self.checkpoint_path or not self.initial_epoch:
+            return 0
         try:
-            print("Starting model training...")
-            self.training_status.update({
-                'is_training': True,
-                'progress': 0,
-                'message': 'Preparing data...',
-                'current_epoch': 0,
-                'total_epochs': epochs
-            })
+            with open(os.path.join(self.checkpoint_path, 'class_names.json'), 'r') as f:
+                if json.load(f) != list(class_names):
+                    raise Exception("the enrolled persons changed")
+            model.load_weights(os.path.join(self.checkpoint_path, 'weights'))
+        except Exception as e:
+            print(f"Not resuming from checkpoint: {str(e)}")
+            shutil.rmtree(self.checkpoint_path, ignore_errors=True)
+            self.training_status['checkpoint_epoch'] = 0
+            return 0
+        print(f"Resuming training at epoch {self.initial_epoch + 1}")
+        return self.initial_epoch
 
-            # Create training directory structure
-            upload_folder = self.app.config['UPLOAD_FOLDER']
-            train_dir = os.path.join(upload_folder, 'train')
-            os.makedirs(train_dir, exist_ok=True)
-
-            # Prepare training data from persons
-            from app.models import Person
-            for person in Person.query.all():
-                person_dir = os.path.join(train_dir, str(person.id))
-                os.makedirs(person_dir, exist_ok=True)
-                
-                # Copy person's images to training directory
-                for image in person.images:
-                    src_path = os.path.join(upload_folder, image.image_path)
-                    if os.path.exists(src_path):
-                        import shutil
-                        dst_path = os.path.join(person_dir, os.path.basename(image.image_path))
-                        shutil.copy2(src_path, dst_path)
-
-            # Setup data generator
-            train_datagen = ImageDataGenerator(
-                preprocessing_function=preprocess_input,
-                rotation_range=20,
-                width_shift_range=0.2,
-                height_shift_range=0.2,
-                shear_range=0.2,
-                zoom_range=0.2,
-                horizontal_flip=True,
-                fill_mode='nearest',
-                validation_split=0.2
-            )
+    def create_progress_callback(self, epochs, class_names=None):
+        """Create a Keras callback that reports epoch progress into training_status.
 
-            # Create generators
-            train_generator = train_datagen.flow_from_directory(
-                train_dir,
-                target_size=(224, 224),
-                batch_size=32,
-                class_mode='categorical',
-                subset='training'
-            )
+        It also stops the run when cancel_event is set and, when a
+        checkpoint_path is set, saves the weights after every epoch.
+        """
+        trainer = self
+
+        class TrainingCallback(tf.keras.callbacks.Callback):
+            def on_train_batch_end(self, batch, logs=None):
+                if trainer.throttle is not None:
+                    trainer.throttle.wait(trainer.training_status, trainer.cancel_event)
+                if trainer.cancel_event is not None and trainer.cancel_event.is_set():
+                    raise TrainingCancelled("Training cancelled")
+
+            def on_epoch_begin(self, epoch, logs=None):
+                trainer.training_status.update({
+                    'current_epoch': epoch + 1,
+                    'progress': int((epoch / epochs) * 100),
+                    'message': f'Training epoch {epoch + 1}/{epochs}'
+                })
+
+            def on_epoch_end(self, epoch, logs=None):
+                current_accuracy = logs.get('accuracy', 0)
+                trainer.training_status.update({
+                    'current_accuracy': current_accuracy,
+                    'best_accuracy': max(
+                        trainer.training_status.get('best_accuracy', 0),
+                        current_accuracy
+                    )
+                })
+                if trainer.checkpoint_path:
+                    os.makedirs(trainer.checkpoint_path, exist_ok=True)
+                    self.model.save_weights(os.path.join(trainer.checkpoint_path, 'weights'))
+                    with open(os.path.join(trainer.checkpoint_path, 'class_names.json'), 'w') as f:
+                        json.dump(list(class_names or []), f)
+                    trainer.training_status['checkpoint_epoch'] = epoch + 1
+
+        return TrainingCallback()
+
+    def load_image_batch(self, paths):
+        """Load and preprocess a list of image paths into one model input batch"""
+        if self.uses_face_crops:
+            return preprocess_input(np.stack(self.crop_rows(paths)).astype(np.float32))
+        batch = np.zeros((len(paths), 224, 224, 3), dtype=np.float32)
+        for i, path in enumerate(paths):
+            img = tf.keras.preprocessing.image.load_img(path, target_size=(224, 224))
+            batch[i] = tf.keras.preprocessing.image.img_to_array(img)
+        return preprocess_input(batch)
+
+    def get_feature_cache(self):
+        if self.feature_cache is None:
+            # Features of face crops and of whole images must never mix
+            name = 'feature_cache_face_crops' if self.uses_face_crops else 'feature_cache'
+            cache_dir = os.path.join(self.app.config['UPLOAD_FOLDER'], name)
+            self.feature_cache = FeatureCache(cache_dir, FEATURE_DIM, BACKBONE_NAME)
+        return self.feature_cache
+
+    def backbone_features(self, paths):
+        """Pooled backbone features for image paths, computed once per image content"""
+        extractor = None
+
+        def featurize(batch_paths):
+            nonlocal extractor
+            if extractor is None:
+                extractor = create_feature_extractor()
+            return extractor.predict(self.load_image_batch(batch_paths), verbose=0)
+
+        return self.get_feature_cache().get(paths, featurize)
+
+    def create_head(self, num_classes, learning_rate=0.001):
+        """Create the classification head (the layers after pooling) as a model on features"""
+        inputs = tf.keras.Input(shape=(FEATURE_DIM,))
+        x = tf.keras.layers.Dropout(0.2)(inputs)
+        outputs = tf.keras.layers.Dense(num_classes, activation='softmax')(x)
+        head = tf.keras.Model(inputs, outputs)
+        head.compile(
+            optimizer=tf.keras.optimizers.legacy.Adam(learning_rate=learning_rate),
+            loss='categorical_crossentropy',
+            metrics=['accuracy']
+        )
+        return head
+
+    def train_on_features(self, epochs=20):
+        """Train only the classification head on cached backbone features.
+
+        The backbone is frozen, so its pooled output for an image never
+        changes; features are computed once per image content hash and the
+        head trains on them directly. No augmentation is applied in this mode.
+        """
+        self.training_status['message'] = 'Extracting features...'
+        paths, labels, class_names = gallery_records(self.app.config['UPLOAD_FOLDER'])
+
+        if len(class_names) < 2:
+            raise Exception("Need at least 2 persons with images to train the model")
+
+        features = self.backbone_features(paths)
+        targets = tf.keras.utils.to_categorical(labels, num_classes=len(class_names))
+
+        head = self.create_head(len(class_names))
+        history = head.fit(
+            features, targets,
+            epochs=epochs,
+            initial_epoch=self.restore_checkpoint(head, class_names),
+            batch_size=32,
+            shuffle=True,
+            callbacks=[self.create_progress_callback(epochs, class_names)],
+            verbose=1
+        )
+
+        # Graft the trained head onto the full model so serving is unchanged
+        model = self.create_model(len(class_names))
+        model.layers[-1].set_weights(head.layers[-1].get_weights())
+        return model, class_names, history
+
+    def train_on_images(self, epochs=20):
+        """Fit the full model on augmented images streamed through a tf.data pipeline"""
+        train_dataset, validation_dataset, class_names = self.prepare_data(
+            use_augmentation=True,
+            preprocess=preprocess_input
+        )
 
-            # Create and compile model
-            num_classes = len(train_generator.class_indices)
-            self.model = self.create_model(num_classes)
-            self.class_names = list(train_generator.class_indices.keys())
-
-            # Save class names
-            model_dir = os.path.join(upload_folder, 'face_recognition_model')
-            os.makedirs(model_dir, exist_ok=True)
-            with open(os.path.join(model_dir, 'class_names.json'), 'w') as f:
-                json.dump(self.class_names, f)
-
-            # Training callback
-            class TrainingCallback(tf.keras.callbacks.Callback):
-                def on_epoch_begin(self_, epoch, logs=None):
-                    self.training_status.update({
-                        'current_epoch': epoch + 1,
-                        'progress': int((epoch / epochs) * 100),
-                        'message': f'Training epoch {epoch + 1}/{epochs}'
-                    })
-
-                def on_epoch_end(self_, epoch, logs=None):
-                    current_accuracy = logs.get('accuracy', 0)
-                    self.training_status.update({
-                        'current_accuracy': current_accuracy,
-                        'best_accuracy': max(
-                            self.training_status.get('best_accuracy', 0), 
-                            current_accuracy
-                        )
-                    })
-
-            # Train the model
-            history = self.model.fit(
-                train_generator,
+        # Create and compile model
+        model = self.create_model(len(class_names))
+
+        # Train the model
+        history = model.fit(
+            train_dataset,
+            validation_data=validation_dataset,
+            epochs=epochs,
+            initial_epoch=self.restore_checkpoint(model, class_names),
+            callbacks=[self.create_progress_callback(epochs, class_names)],
+            verbose=1
+        )
+
+        return model, class_names, history
+
+    @staticmethod
+    def warm_start_weights(current, class_names):
+        """Resize the current model's final Dense layer to class_names.
+
+        Returns [kernel, bias] where surviving classes keep their trained
+        columns, removed classes are dropped and new classes get fresh
+        Glorot-initialised columns, or None if the current model's head
+        does not have the expected shape.
+        """
+        dense = current.model.layers[-1]
+        if not isinstance(dense, tf.keras.layers.Dense):
+            return None
+        kernel, bias = dense.get_weights()
+        if kernel.shape[0] != FEATURE_DIM:
+            return None
+
+        new_kernel = tf.keras.initializers.GlorotUniform(seed=0)((FEATURE_DIM, len(class_names))).numpy()
+        new_bias = np.zeros(len(class_names), dtype=bias.dtype)
+        old_index = {name: i for i, name in enumerate(current.class_names)}
+        for i, name in enumerate(class_names):
+            if name in old_index:
+                new_kernel[:, i] = kernel[:, old_index[name]]
+                new_bias[i] = bias[old_index[name]]
+        return [new_kernel, new_bias]
+
+    def train_incremental(self, epochs=20):
+        """Warm-start from the current model after persons were added or removed.
+
+        The final Dense layer is grown or shrunk to the new class set (see
+        warm_start_weights) and fine-tuned on cached features of all new
+        images plus a replay sample of INCREMENTAL_REPLAY_PER_CLASS images
+        from every surviving class, for at most INCREMENTAL_EPOCHS epochs.
+        A per-class split of that set is held out for validation.
+        Falls back to a full train_on_images run when there is no usable
+        current model.
+        """
+        current = model_registry.current()
+        paths, labels, class_names = gallery_records(self.app.config['UPLOAD_FOLDER'])
+        if len(class_names) < 2:
+            raise Exception("Need at least 2 persons with images to train the model")
+        weights = self.warm_start_weights(current, class_names) if current is not None else None
+        if weights is None:
+            print("No compatible current model to warm-start from; running a full training")
+            return self.train_on_images(epochs)
+
+        # Images the current model has not seen: those of new persons, plus
+        # new content for existing persons when the published dataset is known
+        old_classes = set(current.class_names)
+        published = read_dataset(current.path).get('records')
+        seen = {tuple(record) for record in published} if published else None
+        hashes = content_hashes(self.app)
+        rng = np.random.default_rng(0)
+        replay_per_class = self.app.config.get('INCREMENTAL_REPLAY_PER_CLASS', 5)
+
+        new_idx = []
+        old_idx = {}
+        for i, (path, label) in enumerate(zip(paths, labels)):
+            name = class_names[label]
+            if name not in old_classes or (seen is not None and (name, hashes.get(path)) not in seen):
+                new_idx.append(i)
+            else:
+                old_idx.setdefault(label, []).append(i)
+        replay_idx = []
+        for idx in old_idx.values():
+            replay_idx.extend(rng.choice(idx, min(len(idx), replay_per_class), replace=False).tolist())
+        selected = sorted(new_idx + replay_idx)
+        print(f"Incremental training on {len(new_idx)} new and {len(replay_idx)} replayed images "
+              f"({len(class_names)} classes, previously {len(current.class_names)})")
+
+        # Hold out part of the new and replayed images so publish_model can
+        # apply the MIN_VALIDATION_ACCURACY gate to the fine-tuned model
+        (train_paths, train_labels), (val_paths, val_labels) = split_records(
+            [paths[i] for i in selected], [labels[i] for i in selected])
+
+        self.training_status['message'] = 'Extracting features...'
+        features = self.backbone_features(train_paths)
+        targets = tf.keras.utils.to_categorical(train_labels, num_classes=len(class_names))
+        validation_data = None
+        if val_paths:
+            validation_data = (self.backbone_features(val_paths),
+                               tf.keras.utils.to_categorical(val_labels, num_classes=len(class_names)))
+
+        epochs = min(epochs, self.app.config.get('INCREMENTAL_EPOCHS', 5))
+        self.training_status['total_epochs'] = epochs
+        head = self.create_head(len(class_names))
+        head.layers[-1].set_weights(weights)
+        initial_epoch = self.restore_checkpoint(head, class_names)
+        if initial_epoch >= epochs:
+            # The checkpoint already covers every epoch, e.g. after
+            # INCREMENTAL_EPOCHS was lowered; publish the restored weights
+            print(f"Checkpoint at epoch {initial_epoch} covers all {epochs} epochs; skipping training")
+            history = tf.keras.callbacks.History()
+            metrics = head.evaluate(features, targets, batch_size=32, verbose=0, return_dict=True)
+            history.history = {key: [value] for key, value in metrics.items()}
+            if validation_data is not None:
+                metrics = head.evaluate(*validation_data, batch_size=32, verbose=0, return_dict=True)
+                history.history.update({f'val_{key}': [value] for key, value in metrics.items()})
+        else:
+            history = head.fit(
+                features, targets,
+                validation_data=validation_data,
                 epochs=epochs,
-                callbacks=[TrainingCallback()],
+                initial_epoch=initial_epoch,
+                batch_size=32,
+                shuffle=True,
+                callbacks=[self.create_progress_callback(epochs, class_names)],
                 verbose=1
             )
 
-            # Save model and history
-            self.save_training_history(history.history)
-            self.model.save(model_dir)
+        model = self.create_model(len(class_names))
+        model.layers[-1].set_weights(head.layers[-1].get_weights())
+        return model, class_names, history
+
+    def calibration_batch(self, limit=None):
+        """Sample enrolled images as preprocessed model inputs for int8 calibration.
+
+        Goes through load_image_batch, so with TRAINING_INPUT=face_crops the
+        samples are the stored face crops, like the inputs served to the model.
+        """
+        limit = limit or self.app.config.get('TFLITE_CALIBRATION_IMAGES', 200)
+        paths, _, _ = gallery_records(self.app.config['UPLOAD_FOLDER'])
+        if len(paths) > limit:
+            picks = np.random.default_rng(0).choice(len(paths), limit, replace=False)
+            paths = [paths[i] for i in sorted(picks)]
+        return self.load_image_batch(paths)
+
+    def export_tflite_models(self, model, output_dir):
+        """Write the TFLite variants listed in TFLITE_EXPORT next to the SavedModel"""
+        quantizations = [q.strip() for q in self.app.config.get('TFLITE_EXPORT', '').split(',') if q.strip()]
+        calibration = None
+        for quantization in quantizations:
+            self.training_status['message'] = f'Exporting TFLite model ({quantization})...'
+            try:
+                if quantization == 'int8' and calibration is None:
+                    calibration = self.calibration_batch()
+                export_tflite(model, output_dir, quantization, calibration_images=calibration)
+            except Exception as e:
+                print(f"Error exporting {quantization} TFLite model: {str(e)}")
+
+    def publish_model(self, model, class_names, history, dataset=None, **manifest):
+        """Save a trained model as a new version and hot-swap it in once validated.
+
+        dataset is the (fingerprint, records) pair the model was trained on.
+        """
+        val_accuracy = history.get('val_accuracy', [None])[-1]
+        min_accuracy = self.app.config.get('MIN_VALIDATION_ACCURACY', 0.0)
+        if val_accuracy is not None and val_accuracy < min_accuracy:
+            raise Exception(f"Validation accuracy {val_accuracy:.3f} is below {min_accuracy:.3f}; "
+                            "keeping the current model")
+
+        version, staging_path = model_registry.create_version()
+        try:
+            model.save(staging_path)
+            self.export_tflite_models(model, staging_path)
+            if dataset is not None:
+                write_dataset(staging_path, *dataset)
+                manifest['dataset_fingerprint'] = dataset[0]
+            manifest.update({
+                'accuracy': float(history['accuracy'][-1]),
+                'val_accuracy': None if val_accuracy is None else float(val_accuracy),
+                'total_images': PersonImage.query.count()
+            })
+            loaded = model_registry.publish(version, staging_path, class_names, model=model, manifest=manifest)
+        except Exception:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            raise
 
-            # Cleanup training directory
-            import shutil
-            shutil.rmtree(train_dir)
+        self.save_training_history(history)
+        print(f"Published model version {version}")
+        return loaded
+
+    def train_model(self, epochs=20, mode=None, checkpoint_path=None, initial_epoch=0, cancel_event=None):
+        """Train the model.
+
+        mode is 'images' (fit the full model on augmented images),
+        'features' (fit only the head on cached backbone features) or
+        'incremental' (warm-start the head from the current model); it
+        defaults to the TRAINING_MODE setting. With a checkpoint_path,
+        weights are saved every epoch and a run with initial_epoch > 0
+        continues from them. Setting cancel_event stops the run after the
+        current batch without publishing anything.
+        """
+        mode = mode or self.app.config.get('TRAINING_MODE', 'images')
+        self.checkpoint_path = checkpoint_path
+        self.initial_epoch = initial_epoch
+        self.cancel_event = cancel_event
+        try:
+            print("Starting model training...")
+            self.training_status = {
+                'is_training': True,
+                'progress': int(initial_epoch / epochs * 100) if epochs else 0,
+                'message': 'Preparing data...',
+                'current_epoch': initial_epoch,
+                'total_epochs': epochs,
+                'checkpoint_epoch': initial_epoch
+            }
+
+            # Fingerprint the data before training, so changes made during the
+            # run make the next /retrain train again
+            training_input = self.app.config.get('TRAINING_INPUT', 'images')
+            dataset = dataset_fingerprint(self.app, mode=mode, epochs=epochs, input=training_input)
+
+            # Training builds its own model; /recognize keeps serving the current
+            # version until the new one is validated and swapped in
+            if mode == 'features':
+                model, class_names, history = self.train_on_features(epochs)
+            elif mode == 'incremental':
+                model, class_names, history = self.train_incremental(epochs)
+            else:
+                model, class_names, history = self.train_on_images(epochs)
+
+            self.training_status['message'] = 'Validating and publishing model...'
+            self.publish_model(model, class_names, history.history, dataset=dataset, mode=mode, epochs=epochs,
+                               input=training_input)
 
             self.training_status.update({
                 'is_training': False,
@@ -226,6 +561,14 @@ class ModelTrainer:
             })
             return True
 
+        except TrainingCancelled:
+            print("Training cancelled")
+            self.training_status.update({
+                'is_training': False,
+                'message': 'Training cancelled'
+            })
+            return False
+
         except Exception as e:
             print(f"Training error: {str(e)}")
             self.training_status.update({
@@ -267,28 +610,13 @@ class ModelTrainer:
                 }, f)
 
     def load_model(self):
-        """Load the trained model"""
+        """Load the trained model through the shared model registry"""
         try:
-            model_dir = os.path.join(self.app.config['UPLOAD_FOLDER'], 'face_recognition_model')
-            class_names_path = os.path.join(model_dir, 'class_names.json')
-            
-            if os.path.exists(model_dir) and os.path.exists(class_names_path):
-                print("Loading existing model...")
-                self.model = tf.keras.models.load_model(
-                    model_dir,
-                    custom_objects={
-                        'Adam': tf.keras.optimizers.legacy.Adam
-                    }
-                )
-                
-                with open(class_names_path, 'r') as f:
-                    self.class_names = json.load(f)
-                    
-                print(f"Model loaded successfully with {len(self.class_names)} classes")
-                return True
-            else:
+            loaded = model_registry.current()
+            if loaded is None:
                 print("No existing model found")
                 return False
+            return True
         except Exception as e:
             print(f"Error loading model: {str(e)}")
-            return False
\ No newline at end of file
+            return False
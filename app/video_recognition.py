@@ -0,0 +1,238 @@
+import time
+import cv2
+import numpy as np
+
+# Tracking matches faces at this size, whatever their size in the frame
+TEMPLATE_SIZE = 48
+
+
+def _iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_w = min(ax + aw, bx + bw) - max(ax, bx)
+    overlap_h = min(ay + ah, by + bh) - max(ay, by)
+    if overlap_w <= 0 or overlap_h <= 0:
+        return 0.0
+    overlap = overlap_w * overlap_h
+    return overlap / float(aw * ah + bw * bh - overlap)
+
+
+class FaceTrack:
+    """One face followed across frames by template matching.
+
+    The template is the face as last seen by the detector, scaled to
+    TEMPLATE_SIZE; between detections it is searched for in a window around
+    the previous position. Votes collect the label of every classification
+    of the track.
+    """
+
+    def __init__(self, track_id, box, gray, frame_index):
+        self.id = track_id
+        self.start_frame = frame_index
+        self.end_frame = frame_index
+        self.misses = 0
+        self.detections = 0
+        self.last_classified = None
+        self.votes = {}
+        self.confidence_sums = {}
+        self.reanchor(box, gray, frame_index)
+
+    def reanchor(self, box, gray, frame_index):
+        """Reset the track to a fresh detection"""
+        x, y, w, h = box
+        self.box = box
+        self.scale = min(1.0, TEMPLATE_SIZE / float(max(w, h)))
+        self.template = cv2.resize(gray[y:y+h, x:x+w],
+                                   (max(1, round(w * self.scale)), max(1, round(h * self.scale))))
+        self.end_frame = frame_index
+        self.misses = 0
+        self.detections += 1
+
+    def update(self, gray, frame_index, threshold):
+        """Follow the face into a new frame; returns False if it was lost"""
+        x, y, w, h = self.box
+        height, width = gray.shape
+        x0, y0 = max(0, x - w // 2), max(0, y - h // 2)
+        x1, y1 = min(width, x + w + w // 2), min(height, y + h + h // 2)
+        region_w, region_h = round((x1 - x0) * self.scale), round((y1 - y0) * self.scale)
+        if region_w < self.template.shape[1] or region_h < self.template.shape[0]:
+            return False
+        region = cv2.resize(gray[y0:y1, x0:x1], (region_w, region_h))
+        _, score, _, (best_x, best_y) = cv2.minMaxLoc(cv2.matchTemplate(region, self.template, cv2.TM_CCOEFF_NORMED))
+        if score < threshold:
+            return False
+        self.box = (x0 + round(best_x / self.scale), y0 + round(best_y / self.scale), w, h)
+        self.end_frame = frame_index
+        return True
+
+    def vote(self, label, confidence, frame_index):
+        self.votes[label] = self.votes.get(label, 0) + 1
+        self.confidence_sums[label] = self.confidence_sums.get(label, 0.0) + confidence
+        self.last_classified = frame_index
+
+    @property
+    def classifications(self):
+        return sum(self.votes.values())
+
+    def identity(self):
+        """The label with the most votes, ties broken by total confidence; (label, mean confidence)"""
+        label = max(self.votes, key=lambda key: (self.votes[key], self.confidence_sums[key]))
+        return label, self.confidence_sums[label] / self.votes[label]
+
+
+class VideoRecognizer:
+    """Identifies the people in a video file on CPU.
+
+    Frames are read with cv2.VideoCapture. The Haar detector runs on a
+    downscaled frame, and only every detect_every processed frames or when
+    a track loses its face; in between, faces are followed by cheap
+    template matching. Each track is classified at most classify_per_track
+    times, at least detect_every frames apart, and all faces due in a
+    frame share one forward pass. The votes of a track decide its
+    identity. predict(batch) takes [-1, 1] scaled 224x224 RGB faces and
+    returns (prediction, class_names) rows, like routes.predict_batch.
+    """
+
+    def __init__(self, face_cascade, predict, detect_every=5, classify_per_track=3, detect_width=640,
+                 frame_stride=1, track_threshold=0.5, max_misses=2, min_face_size=24):
+        self.face_cascade = face_cascade
+        self.predict = predict
+        self.detect_every = max(1, detect_every)
+        self.classify_per_track = max(1, classify_per_track)
+        self.detect_width = detect_width
+        self.frame_stride = max(1, frame_stride)
+        self.track_threshold = track_threshold
+        self.max_misses = max_misses
+        self.min_face_size = min_face_size
+
+    def detect(self, gray):
+        scale = min(1.0, self.detect_width / float(gray.shape[1]))
+        small = cv2.resize(gray, None, fx=scale, fy=scale) if scale < 1.0 else gray
+        min_size = max(1, round(self.min_face_size * scale))
+        faces = self.face_cascade.detectMultiScale(small, 1.1, 4, minSize=(min_size, min_size))
+        return [tuple(int(round(v / scale)) for v in face) for face in faces]
+
+    def _associate(self, tracks, boxes, gray, frame_index):
+        """Re-anchor tracks to overlapping detections; returns detections that start new tracks"""
+        pairs = sorted(((_iou(track.box, box), t, b) for t, track in enumerate(tracks)
+                        for b, box in enumerate(boxes)), reverse=True)
+        matched_tracks, matched_boxes = set(), set()
+        for iou, t, b in pairs:
+            if iou < 0.3:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            tracks[t].reanchor(boxes[b], gray, frame_index)
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+        for t, track in enumerate(tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+        return [box for b, box in enumerate(boxes) if b not in matched_boxes]
+
+    def _classify(self, frame, tracks, frame_index):
+        due = [track for track in tracks if track.classifications < self.classify_per_track and
+               (track.last_classified is None or
+                frame_index - track.last_classified >= self.detect_every * self.frame_stride)]
+        if not due:
+            return 0
+        batch = np.empty((len(due), 224, 224, 3), dtype=np.float32)
+        for i, track in enumerate(due):
+            x, y, w, h = track.box
+            face = cv2.resize(frame[y:y+h, x:x+w], (224, 224))
+            batch[i] = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+        # MobileNetV2 preprocessing: scale pixels to [-1, 1]
+        rows = self.predict(batch / 127.5 - 1.0)
+        for track, (prediction, class_names) in zip(due, rows):
+            predicted_class = int(np.argmax(prediction))
+            track.vote(class_names[predicted_class], float(prediction[predicted_class]) * 100, frame_index)
+        return len(due)
+
+    def recognize(self, video_path):
+        """Return the identified tracks of a video with their time ranges, plus run statistics"""
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise Exception("Could not open video")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+
+        tracks = []
+        finished = []
+        next_id = 1
+        frame_index = -1
+        processed = 0
+        detector_runs = 0
+        classified = 0
+        started = time.perf_counter()
+        try:
+            while capture.grab():
+                frame_index += 1
+                if frame_index % self.frame_stride:
+                    continue
+                ok, frame = capture.retrieve()
+                if not ok:
+                    break
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+                lost = [track for track in tracks if not track.update(gray, frame_index, self.track_threshold)]
+                tracks = [track for track in tracks if track not in lost]
+
+                if lost or processed % self.detect_every == 0:
+                    detector_runs += 1
+                    # A lost track the detector finds again keeps its identity and votes
+                    new_boxes = self._associate(tracks + lost, self.detect(gray), gray, frame_index)
+                    tracks.extend(track for track in lost if track.end_frame == frame_index)
+                    finished.extend(track for track in lost if track.end_frame != frame_index)
+                    for box in new_boxes:
+                        tracks.append(FaceTrack(next_id, box, gray, frame_index))
+                        next_id += 1
+                    finished.extend(track for track in tracks if track.misses > self.max_misses)
+                    tracks = [track for track in tracks if track.misses <= self.max_misses]
+
+                classified += self._classify(frame, tracks, frame_index)
+                processed += 1
+        finally:
+            capture.release()
+        finished.extend(tracks)
+
+        elapsed = time.perf_counter() - started
+        duration = (frame_index + 1) / fps
+        results = []
+        for track in sorted(finished, key=lambda track: track.id):
+            if not track.votes:
+                continue
+            label, confidence = track.identity()
+            results.append({
+                'track_id': track.id,
+                'label': label,
+                'confidence': confidence,
+                'votes': dict(track.votes),
+                'detections': track.detections,
+                'start_frame': track.start_frame,
+                'end_frame': track.end_frame,
+                'start_time': round(track.start_frame / fps, 3),
+                'end_time': round(track.end_frame / fps, 3),
+                'last_bbox': [int(v) for v in track.box]
+            })
+        return {
+            'tracks': results,
+            'frames': frame_index + 1,
+            'processed_frames': processed,
+            'detector_runs': detector_runs,
+            'classified_faces': classified,
+            'fps': fps,
+            'duration_seconds': round(duration, 3),
+            'elapsed_seconds': round(elapsed, 3),
+            'realtime_factor': round(duration / elapsed, 2) if elapsed else None
+        }
+
+
+def name_tracks(result):
+    """Add person names to recognize() tracks; classifier labels are person ids"""
+    from app.models import Person
+    ids = {int(track['label']) for track in result['tracks'] if str(track['label']).isdigit()}
+    names = {str(person.id): person.name for person in Person.query.filter(Person.id.in_(ids))} if ids else {}
+    for track in result['tracks']:
+        track['name'] = names.get(track['label'], track['label'])
+        # Votes stay keyed by label: two persons can share a name
+        track['vote_names'] = {label: names.get(label, label) for label in track['votes']}
+    return result
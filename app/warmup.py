@@ -0,0 +1,163 @@
+import threading
+import time
+from functools import cached_property
+from app.resource_scheduler import apply_cpu_budget
+
+
+class WarmupNotReady(Exception):
+    """Raised when a request needs the models before warm-up has finished"""
+
+
+class Services:
+    """TF-backed objects shared by the routes, each created on first use.
+
+    When an inference server is configured, inference is its client and
+    recognition never needs TensorFlow in this process.
+    """
+
+    def __init__(self, app, inference=None):
+        self.app = app
+        self.inference = inference
+
+    @cached_property
+    def model_registry(self):
+        from app.model_registry import model_registry
+        return model_registry
+
+    @cached_property
+    def model_trainer(self):
+        from app.training_utils import ModelTrainer
+        return ModelTrainer(self.app)
+
+    @cached_property
+    def face_recognition(self):
+        from app.face_recognition_utils import FaceRecognitionSystem
+        return FaceRecognitionSystem(self.app)
+
+    @cached_property
+    def embedding_gallery(self):
+        from app.embedding_gallery import embedding_gallery
+        return embedding_gallery
+
+    def model_version(self):
+        if self.inference is not None:
+            return self.inference.ping().get('model_version')
+        loaded = self.model_registry.current()
+        return (loaded.version or loaded.path) if loaded else None
+
+    def model_input(self):
+        """The input the served model was trained on ('images' or 'face_crops'), from its manifest"""
+        if self.inference is not None:
+            return self.inference.ping().get('model_input')
+        loaded = self.model_registry.current()
+        return loaded.manifest.get('input') if loaded else None
+
+
+class Warmup:
+    """Imports TensorFlow and loads the recognition models off the startup path.
+
+    The Flask app itself never imports TensorFlow, so a worker answers
+    lightweight routes as soon as it starts. A background thread imports
+    the TF-backed modules, builds the shared services and loads (and
+    traces) the current model; routes that need them call services(),
+    and /ready reports when they are available. A failed warm-up is
+    retried with exponential backoff until it succeeds.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._services = None
+        self._thread = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self.state = {
+            'status': 'pending',
+            'step': None,
+            'error': None,
+            'attempts': 0,
+            'retry_at': None,
+            'started_at': None,
+            'ready_at': None
+        }
+
+    def start(self):
+        """Start warming up in the background; later calls are no-ops"""
+        with self._lock:
+            if self._thread is None:
+                self.state.update(status='warming', started_at=time.time())
+                self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+                self._thread.start()
+
+    def _step(self, message):
+        self.state['step'] = message
+        print(f"Warm-up: {message}...")
+
+    def _load(self):
+        socket_path = self.app.config.get('INFERENCE_SERVER_SOCKET')
+        if socket_path and self.app.config['RECOGNITION_MODE'] != 'embedding':
+            # The inference server owns TensorFlow and the model
+            self._step('connecting to inference server')
+            from app.inference_server import InferenceClient
+            inference = InferenceClient(socket_path, max_batch_size=self.app.config['INFERENCE_MAX_BATCH_SIZE'])
+            inference.wait_until_ready(self.app.config.get('INFERENCE_SERVER_CONNECT_TIMEOUT', 300))
+            return Services(self.app, inference=inference)
+
+        self._step('importing TensorFlow')
+        apply_cpu_budget(self.app, 'inference')
+
+        self._step('loading models')
+        services = Services(self.app)
+        services.face_recognition.load_model()
+        services.model_trainer
+
+        if self.app.config['RECOGNITION_MODE'] == 'embedding':
+            self._step('loading embedding gallery')
+            services.embedding_gallery.matcher()
+            services.embedding_gallery._get_extractor()
+        return services
+
+    def _run(self):
+        delay = self.app.config.get('WARMUP_RETRY_DELAY', 5)
+        while True:
+            self.state['attempts'] += 1
+            try:
+                with self.app.app_context():
+                    self._services = self._load()
+                self.state.update(status='ready', step=None, error=None, retry_at=None, ready_at=time.time())
+                print(f"Warm-up finished in {self.state['ready_at'] - self.state['started_at']:.1f}s")
+                # Only a successful warm-up wakes waiters early; during retries
+                # services() keeps waiting up to WARMUP_WAIT_TIMEOUT
+                self._done.set()
+                return
+            except Exception as e:
+                # A missing model file or an inference server that is still
+                # starting can recover, so keep retrying with backoff
+                self.state.update(status='failed', error=str(e), retry_at=time.time() + delay)
+                print(f"Error during warm-up (attempt {self.state['attempts']}, retrying in {delay}s): {str(e)}")
+            time.sleep(delay)
+            delay = min(delay * 2, self.app.config.get('WARMUP_RETRY_MAX_DELAY', 300))
+            self.state.update(status='warming', retry_at=None)
+
+    @property
+    def is_ready(self):
+        return self._services is not None
+
+    def services(self, timeout=None):
+        """Return the TF-backed services, waiting up to timeout seconds for warm-up"""
+        self.start()
+        if timeout is None:
+            timeout = self.app.config.get('WARMUP_WAIT_TIMEOUT', 30)
+        self._done.wait(timeout)
+        if self._services is None:
+            raise WarmupNotReady(f"Models are not loaded yet ({self.state['status']})")
+        return self._services
+
+    def status(self):
+        status = dict(self.state)
+        status['ready'] = self.is_ready
+        if self.is_ready:
+            try:
+                status['model_version'] = self._services.model_version()
+            except Exception as e:
+                status.update(ready=False, error=str(e))
+        return status
@@ -0,0 +1,76 @@
+"""Recall vs latency of IVFIndex against exact GalleryMatcher search.
+
+Usage: python benchmarks/ann_benchmark.py [--size 100000] [--dim 1280]
+
+Uses synthetic clustered embeddings (one cluster per identity) so it runs
+without a populated database.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ann_index import IVFIndex
+from app.matcher import GalleryMatcher
+
+
+def make_gallery(size, dim, identities, rng):
+    centers = rng.normal(size=(identities, dim)).astype(np.float32)
+    labels = rng.integers(0, identities, size)
+    vectors = centers[labels] + 0.5 * rng.normal(size=(size, dim)).astype(np.float32)
+    return vectors, labels
+
+
+def recall_at_k(approx, exact):
+    hits = 0
+    total = 0
+    for approx_hits, exact_hits in zip(approx, exact):
+        expected = {round(h['distance'], 4) for h in exact_hits}
+        hits += len(expected & {round(h['distance'], 4) for h in approx_hits})
+        total += len(expected)
+    return hits / max(total, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=1280)
+    parser.add_argument('--identities', type=int, default=5000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--n-lists', type=int, default=256)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, labels = make_gallery(args.size, args.dim, args.identities, rng)
+    picks = rng.integers(0, args.size, args.queries)
+    queries = vectors[picks] + 0.3 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    exact = GalleryMatcher.from_arrays(vectors, labels, metric='cosine')
+    start = time.perf_counter()
+    expected = [exact.search(query, k=args.k) for query in queries]
+    exact_ms = (time.perf_counter() - start) / args.queries * 1000
+
+    start = time.perf_counter()
+    index = IVFIndex(args.dim, n_lists=args.n_lists, metric='cosine')
+    index.add(vectors, np.arange(args.size), labels)
+    if not index.is_trained:
+        index.train()
+    build_s = time.perf_counter() - start
+
+    print(f"gallery={args.size} dim={args.dim} k={args.k} n_lists={args.n_lists} build={build_s:.1f}s")
+    print(f"{'search':>10} {'recall@k':>10} {'ms/query':>10} {'speedup':>10}")
+    print(f"{'exact':>10} {1.0:>10.3f} {exact_ms:>10.2f} {1.0:>10.1f}")
+    for nprobe in (1, 2, 4, 8, 16, 32):
+        start = time.perf_counter()
+        approx = [index.search(query, k=args.k, nprobe=nprobe) for query in queries]
+        ivf_ms = (time.perf_counter() - start) / args.queries * 1000
+        print(f"{'nprobe=' + str(nprobe):>10} {recall_at_k(approx, expected):>10.3f} "
+              f"{ivf_ms:>10.2f} {exact_ms / ivf_ms:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
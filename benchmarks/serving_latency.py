@@ -0,0 +1,59 @@
+"""Per-call latency of Model.predict against the compiled serving function.
+
+Usage: python benchmarks/serving_latency.py [--runs 100] [--batch-sizes 1,4,16]
+
+Uses the current model version, or an untrained model with --classes
+outputs when none has been trained yet.
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from app.model_registry import model_registry
+from facecore.serving import serving_function
+from app.training_utils import ModelTrainer
+
+
+def timings_ms(fn, batch, runs):
+    fn(batch)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--batch-sizes', default='1,4,16')
+    parser.add_argument('--classes', type=int, default=10)
+    args = parser.parse_args()
+
+    loaded = model_registry.current()
+    model = loaded.model if loaded is not None else ModelTrainer(app).create_model(args.classes)
+
+    start = time.perf_counter()
+    serve = serving_function(model)
+    print(f"trace + warm-up: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = np.random.default_rng(0)
+    print(f"{'batch':>6} {'predict p50':>12} {'predict p95':>12} {'serve p50':>10} {'serve p95':>10} {'speedup':>8}")
+    for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+        batch = rng.uniform(-1, 1, (batch_size,) + tuple(model.input_shape[1:])).astype(np.float32)
+        if not np.allclose(serve(batch), model.predict(batch, verbose=0), atol=1e-5):
+            sys.exit("Serving function output differs from Model.predict")
+        predict_p50, predict_p95 = timings_ms(lambda b: model.predict(b, verbose=0), batch, args.runs)
+        serve_p50, serve_p95 = timings_ms(serve, batch, args.runs)
+        print(f"{batch_size:>6} {predict_p50:>12.2f} {predict_p95:>12.2f} {serve_p50:>10.2f} {serve_p95:>10.2f} "
+              f"{predict_p50 / serve_p50:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Latency, size and top-1 agreement of the TFLite backends against Keras.
+
+Usage: python benchmarks/tflite_benchmark.py [--images 200] [--runs 50] [--threads 4]
+
+Benchmarks the current model version on enrolled images. TFLite variants
+the version was not exported with are converted into a temporary
+directory; published version directories are never written to.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from app.data_pipeline import gallery_records
+from app.model_registry import model_registry
+from facecore.tflite_engine import TFLiteEngine, TFLITE_FILES, export_tflite
+from app.training_utils import ModelTrainer
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names
+               if not name.endswith('.tflite'))
+
+
+def latency_ms(predict, sample, runs):
+    predict(sample)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict(sample)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.percentile(timings, 50), np.percentile(timings, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    loaded = model_registry.current()
+    if loaded is None:
+        sys.exit("No trained model; train one first")
+
+    trainer = ModelTrainer(app)
+    paths, _, _ = gallery_records(app.config['UPLOAD_FOLDER'])
+    rng = np.random.default_rng(0)
+    if len(paths) > args.images:
+        paths = [paths[i] for i in sorted(rng.choice(len(paths), args.images, replace=False))]
+    images = trainer.load_image_batch(paths)
+
+    keras_predict = lambda batch: loaded.model.predict(batch, verbose=0)
+    reference = np.argmax(keras_predict(images), axis=1)
+    p50, p95 = latency_ms(keras_predict, images[:1], args.runs)
+    print(f"{'backend':>8} {'size MB':>8} {'p50 ms':>8} {'p95 ms':>8} {'top-1 agree':>12}")
+    print(f"{'keras':>8} {directory_size(loaded.path) / 1e6:>8.2f} {p50:>8.2f} {p95:>8.2f} {1.0:>12.4f}")
+
+    export_dir = tempfile.mkdtemp(prefix='tflite-benchmark-')
+    try:
+        for quantization, filename in TFLITE_FILES.items():
+            path = os.path.join(loaded.path, filename)
+            if not os.path.exists(path):
+                path = export_tflite(loaded.model, export_dir, quantization,
+                                     calibration_images=trainer.calibration_batch())
+            engine = TFLiteEngine(path, num_threads=args.threads, pool_size=1)
+            agreement = np.mean(np.argmax(engine.predict(images), axis=1) == reference)
+            p50, p95 = latency_ms(engine.predict, images[:1], args.runs)
+            print(f"{quantization:>8} {engine.size_bytes / 1e6:>8.2f} {p50:>8.2f} {p95:>8.2f} {agreement:>12.4f}")
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
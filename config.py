@@ -9,6 +9,109 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
 
+    # 'classifier' uses the trained softmax model, 'embedding' matches backbone
+    # embeddings against the enrolled gallery and needs no retraining
+    RECOGNITION_MODE = os.environ.get('RECOGNITION_MODE', 'classifier')
+    EMBEDDING_MATCH_THRESHOLD = 0.35  # max cosine distance for a gallery match
+
+    # Trained models are kept as versions under uploads/models
+    MODEL_VERSIONS_TO_KEEP = 3
+    MIN_VALIDATION_ACCURACY = 0.0  # models below this are not published
+
+    # The backend recognition serves with: 'keras', 'tflite_dynamic' or 'tflite_int8',
+    # and the quantized TFLite variants exported with each version ('dynamic',
+    # 'int8'); by default only the variant INFERENCE_BACKEND serves, if any
+    INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+    TFLITE_EXPORT = os.environ.get(
+        'TFLITE_EXPORT', INFERENCE_BACKEND[len('tflite_'):] if INFERENCE_BACKEND.startswith('tflite_') else '')
+    TFLITE_CALIBRATION_IMAGES = 200
+    TFLITE_NUM_THREADS = None  # None lets TFLite pick
+
+    # 'images' fits the full model on augmented images; 'features' trains only
+    # the classification head on cached backbone features (much faster);
+    # 'incremental' warm-starts the head from the current model and fine-tunes
+    # it on new images plus a replay sample of old ones
+    TRAINING_MODE = os.environ.get('TRAINING_MODE', 'images')
+    INCREMENTAL_EPOCHS = 5
+    INCREMENTAL_REPLAY_PER_CLASS = 5
+    # 'images' trains on whole resized images; 'face_crops' trains on the face
+    # crops stored at upload time (uploads/face_crops) and crops probes to match
+    TRAINING_INPUT = os.environ.get('TRAINING_INPUT', 'images')
+    # Where the training pipeline caches decoded images: 'file', 'memory' or 'none'
+    DATASET_CACHE = 'file'
+
+    # TensorFlow and the models load in a background warm-up; /ready reports when done
+    WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') != '0'
+    WARMUP_WAIT_TIMEOUT = 30  # seconds a model-backed request waits before a 503
+    WARMUP_RETRY_DELAY = 5  # seconds before retrying a failed warm-up, doubled per attempt
+    WARMUP_RETRY_MAX_DELAY = 300
+
+    # Optional shared inference process (flask inference-server): when set, web
+    # workers send /recognize batches to it over this Unix socket instead of
+    # loading TensorFlow themselves
+    INFERENCE_SERVER_SOCKET = os.environ.get('INFERENCE_SERVER_SOCKET', '')
+    INFERENCE_SERVER_CONNECT_TIMEOUT = 300
+
+    # Training runs in a separate worker process (flask training-worker) fed
+    # from the TrainingJob table; /retrain starts one if none is running
+    TRAINING_WORKER_AUTOSTART = True
+    TRAINING_WORKER_IDLE_TIMEOUT = 300  # seconds an autostarted worker waits for more jobs
+    TRAINING_POLL_INTERVAL = 2
+
+    # CPU budgets: TF intra-op threads and optional core lists (e.g. '0-3') for
+    # the process serving recognition and for the training worker
+    INFERENCE_THREADS = int(os.environ.get('INFERENCE_THREADS', 0)) or None
+    INFERENCE_CPUS = os.environ.get('INFERENCE_CPUS', '')
+    TRAINING_THREADS = int(os.environ.get('TRAINING_THREADS', 0)) or None
+    TRAINING_CPUS = os.environ.get('TRAINING_CPUS', '')
+    TRAINING_NICE = 10
+    # Training pauses between batches while /recognize p95 exceeds this (0 disables)
+    RECOGNITION_LATENCY_SLO_MS = float(os.environ.get('RECOGNITION_LATENCY_SLO_MS', 0))
+    TRAINING_MAX_PAUSE_SECONDS = 30
+
+    # Dynamic micro-batching of concurrent /recognize forward passes
+    INFERENCE_MAX_BATCH_SIZE = 16
+    INFERENCE_MAX_WAIT_MS = 5
+    INFERENCE_MAX_QUEUE_SIZE = 256  # further requests are rejected with 503
+    INFERENCE_TIMEOUT = 30  # seconds a request waits for its batch
+
+    # Bulk enrollment (flask import-faces, POST /persons/import): worker
+    # processes (default: one per CPU), rows per insert transaction, and size limits
+    BULK_IMPORT_WORKERS = int(os.environ.get('BULK_IMPORT_WORKERS', 0)) or None
+    BULK_IMPORT_CHUNK_SIZE = 500
+    BULK_IMPORT_STORE_EVERY = 2000  # images whose crops and encodings are stored at once
+    BULK_IMPORT_MAX_BYTES = 4 * 1024 * 1024 * 1024  # archive posted to /persons/import
+    BULK_IMPORT_MAX_FILE_BYTES = 16 * 1024 * 1024  # larger images in an archive are skipped
+
+    # /recognize/batch: images per forward pass (also the per-request maximum),
+    # decode threads, and limits per request
+    RECOGNIZE_BATCH_SIZE = 32
+    RECOGNIZE_BATCH_DECODE_THREADS = 4
+    RECOGNIZE_BATCH_MAX_IMAGES = 10000
+    RECOGNIZE_BATCH_MAX_BYTES = 1024 * 1024 * 1024  # zip sent as the raw request body
+    RECOGNIZE_BATCH_MAX_FILE_BYTES = 16 * 1024 * 1024  # larger images in a zip are rejected
+
+    # Video recognition: Haar detection every N processed frames (or when a
+    # track is lost), classifications per tracked face, detection frame width,
+    # frames to step per processed frame, and template match score to keep a track
+    VIDEO_DETECT_EVERY = 5
+    VIDEO_CLASSIFY_PER_TRACK = 3
+    VIDEO_DETECT_WIDTH = 640
+    VIDEO_FRAME_STRIDE = 1
+    VIDEO_TRACK_THRESHOLD = 0.5
+    VIDEO_MAX_BYTES = 512 * 1024 * 1024  # clip sent as the raw request body
+
+    # Temporary probe images (uploads/temp), cleaned by a background sweeper
+    TEMP_TTL_SECONDS = 3600
+    TEMP_MAX_BYTES = 512 * 1024 * 1024  # oldest files are evicted beyond this
+    TEMP_SWEEP_INTERVAL = 60
+
+    # Approximate nearest-neighbour search for large embedding galleries
+    ANN_MIN_GALLERY_SIZE = 20000  # below this, search is exact brute force
+    ANN_N_LISTS = 256
+    ANN_NPROBE = 8
+    ANN_SAVE_EVERY = 100  # persist the index after this many inserts/deletes
+
     @staticmethod
     def init_app(app):
         # Create necessary directories
@@ -0,0 +1,6 @@
+"""Image and model code that does not depend on the Flask app.
+
+Worker processes of the bulk importer and the directory recognizer import
+their tasks from here, so starting one never imports the app package and
+its routes, background threads and database setup.
+"""
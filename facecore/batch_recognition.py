@@ -0,0 +1,77 @@
+"""Tasks the directory recognizer (app/batch_recognition.py) runs in its worker processes"""
+import os
+import cv2
+import numpy as np
+from facecore.serving import configure_tensorflow, load_keras_model, serving_function
+from facecore.tflite_engine import TFLiteEngine
+
+# Set in each pool process by init_worker: (cascade, predict, model, {label: person name})
+_worker = None
+
+
+def init_worker(threads, model, names):
+    """Load TensorFlow and the model once per pool process.
+
+    model is ModelRegistry.current_files() of the parent process, so every
+    worker serves the same version with the same backend.
+    """
+    global _worker
+    configure_tensorflow(threads)
+    cv2.setNumThreads(1)
+    if model['tflite_path']:
+        predict = TFLiteEngine(model['tflite_path'], num_threads=threads, pool_size=1).predict
+    else:
+        predict = serving_function(load_keras_model(model['path']))
+    cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    _worker = (cascade, predict, model, names)
+
+
+def _detect_faces(cascade, path):
+    img = cv2.imread(path)
+    if img is None:
+        raise Exception("Error detecting faces: Could not read image")
+    return cascade.detectMultiScale(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY), 1.1, 4), img
+
+
+def _preprocess_faces(img, faces):
+    """Crop every face into one model batch, scaled to [-1, 1] as MobileNetV2 expects"""
+    batch = np.empty((len(faces), 224, 224, 3), dtype=np.float32)
+    for i, (x, y, w, h) in enumerate(faces):
+        batch[i] = cv2.cvtColor(cv2.resize(img[y:y+h, x:x+w], (224, 224)), cv2.COLOR_BGR2RGB)
+    return batch / 127.5 - 1.0
+
+
+def recognize_files(paths, root):
+    """Recognize every face in a chunk of files with one forward pass; returns JSONL records"""
+    cascade, predict, model, names = _worker
+
+    records = []
+    batches = []
+    owners = []
+    for path in paths:
+        relative_path = os.path.relpath(path, root)
+        try:
+            faces, img = _detect_faces(cascade, path)
+        except Exception as e:
+            records.append({'path': relative_path, 'error': str(e)})
+            continue
+        record = {'path': relative_path, 'faces': []}
+        records.append(record)
+        if len(faces):
+            batches.append(_preprocess_faces(img, faces))
+            owners.append((record, faces))
+
+    if batches:
+        predictions = iter(predict(np.concatenate(batches)))
+        for record, faces in owners:
+            record['model_version'] = model['version']
+            for (x, y, w, h), prediction in zip(faces, predictions):
+                predicted_class = int(np.argmax(prediction))
+                label = model['class_names'][predicted_class]
+                record['faces'].append({
+                    'name': names.get(label, label),
+                    'label': label,
+                    'confidence': float(prediction[predicted_class]) * 100,
+                    'bbox': [int(x), int(y), int(w), int(h)]
+                })
+    return records
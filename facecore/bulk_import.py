@@ -0,0 +1,64 @@
+"""Tasks the bulk importer (app/bulk_import.py) runs in its worker processes"""
+import hashlib
+import os
+import cv2
+from werkzeug.utils import secure_filename
+from facecore.image_utils import decode_image_buffer, file_signature, crop_face
+
+
+def init_worker():
+    # Each worker decodes one image at a time; parallelism comes from the pool
+    cv2.setNumThreads(1)
+
+
+def face_encoding(img):
+    """Return the first face_recognition encoding of a BGR image, or None if there is no face"""
+    import face_recognition
+    encodings = face_recognition.face_encodings(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    return encodings[0] if encodings else None
+
+
+def prepare_image(person, filename, source, upload_folder, require_face, encode_faces):
+    """Validate, decode and face-check one image, and save it under faceimages/.
+
+    Runs in a pool process. The saved file is named after the person and
+    the content hash, so importing the same archive twice finds the first
+    copy as a duplicate. With encode_faces, the face_recognition encoding
+    is computed here as well, so the web process does not have to.
+    """
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            source = f.read()
+    img = decode_image_buffer(source)
+    if img is None:
+        return {'status': 'invalid', 'person': person, 'filename': filename}
+    crop, face_found = crop_face(img)
+    if require_face and not face_found:
+        return {'status': 'no_face', 'person': person, 'filename': filename}
+
+    sha1 = hashlib.sha1(source).hexdigest()
+    extension = filename.rsplit('.', 1)[1].lower()
+    image_path = f"faceimages/{secure_filename(person) or 'person'}_{sha1[:16]}.{extension}"
+    full_path = os.path.join(upload_folder, image_path)
+    if not os.path.exists(full_path):
+        tmp_path = f'{full_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(source)
+        os.replace(tmp_path, full_path)
+    result = {
+        'status': 'ok',
+        'person': person,
+        'filename': filename,
+        'image_path': image_path,
+        'sha1': sha1,
+        'crop': crop,
+        'face_found': face_found,
+        'signature': file_signature(full_path)
+    }
+    if encode_faces:
+        try:
+            result['encoding'] = face_encoding(img)
+        except Exception as e:
+            # Left out; the encoding cache encodes the image itself when it needs it
+            print(f"Error encoding image {image_path}: {str(e)}")
+    return result
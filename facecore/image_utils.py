@@ -0,0 +1,69 @@
+import hashlib
+import os
+from contextlib import contextmanager
+import cv2
+import numpy as np
+
+CROP_SIZE = 224
+
+_cascade = None
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """Return the hex SHA-1 digest of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(path):
+    """Return (mtime, size) for a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+@contextmanager
+def upload_buffer(file_storage):
+    """Yield an uploaded file's bytes without copying them when possible.
+
+    Werkzeug keeps small uploads in a BytesIO, whose buffer is exposed
+    directly; larger uploads are spooled to disk and read once. The buffer
+    is only valid inside the with block.
+    """
+    stream = file_storage.stream
+    if hasattr(stream, 'getbuffer'):
+        with stream.getbuffer() as buffer:
+            yield buffer
+    else:
+        stream.seek(0)
+        yield stream.read()
+
+
+def decode_image_buffer(buffer, flags=cv2.IMREAD_COLOR):
+    """Decode an encoded image held in memory; returns None if it is not a valid image"""
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), flags)
+
+def crop_face(img, cascade=None, size=CROP_SIZE):
+    """Return the largest detected face of a BGR image as a size x size RGB crop.
+
+    Falls back to the whole image when no face is found. Returns
+    (crop, face_found).
+    """
+    global _cascade
+    if cascade is None:
+        if _cascade is None:
+            _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        cascade = _cascade
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    faces = cascade.detectMultiScale(gray, 1.1, 4)
+    face_found = len(faces) > 0
+    if face_found:
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        img = img[y:y+h, x:x+w]
+    img = cv2.resize(img, (size, size))
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB), face_found
@@ -0,0 +1,44 @@
+"""TensorFlow setup and model loading shared by the app and its worker processes"""
+import logging
+import tensorflow as tf
+
+
+def configure_tensorflow(threads=None):
+    """Apply the process-wide TensorFlow setup; returns the tensorflow module"""
+    tf.get_logger().setLevel(logging.ERROR)
+    tf.config.set_visible_devices([], 'GPU')
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+    return tf
+
+
+def load_keras_model(path):
+    """Load a SavedModel written by model.save, including ones compiled with the legacy Adam"""
+    return tf.keras.models.load_model(
+        path,
+        custom_objects={
+            'Adam': tf.keras.optimizers.legacy.Adam
+        }
+    )
+
+
+def serving_function(model):
+    """Compile a model's forward pass into a tf.function for low-latency serving.
+
+    Model.predict builds a data adapter and runs the full predict loop on
+    every call. The returned function has a fixed float32 input signature
+    with a variable batch dimension, so it is traced exactly once here and
+    warmed up on a dummy batch; later calls go straight to the graph.
+    """
+    input_shape = [None] + list(model.input_shape[1:])
+
+    @tf.function(input_signature=[tf.TensorSpec(input_shape, tf.float32)])
+    def serve(batch):
+        return model(batch, training=False)
+
+    serve(tf.zeros([1] + input_shape[1:], tf.float32))
+
+    def predict(batch):
+        return serve(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+    return predict
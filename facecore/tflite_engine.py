@@ -0,0 +1,98 @@
+import os
+import queue
+import numpy as np
+import tensorflow as tf
+
+# File names of the exported TFLite variants inside a model version directory
+TFLITE_FILES = {
+    'dynamic': 'model_dynamic.tflite',
+    'int8': 'model_int8.tflite'
+}
+
+
+def export_tflite(model, output_dir, quantization='dynamic', calibration_images=None):
+    """Convert a Keras model to a quantized TFLite flatbuffer in output_dir.
+
+    'dynamic' quantizes weights to int8 and keeps float activations.
+    'int8' quantizes weights and activations, calibrated on
+    calibration_images (preprocessed float32 model inputs); its input and
+    output tensors are int8 as well.
+    """
+    if quantization not in TFLITE_FILES:
+        raise ValueError(f"Unsupported quantization: {quantization}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'int8':
+        if calibration_images is None or len(calibration_images) == 0:
+            raise ValueError("int8 quantization needs calibration images")
+
+        def representative_dataset():
+            for image in calibration_images:
+                yield [np.expand_dims(image, 0).astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+
+    path = os.path.join(output_dir, TFLITE_FILES[quantization])
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+    return path
+
+
+class TFLiteEngine:
+    """Thread-safe CPU inference on a TFLite model.
+
+    A TFLite interpreter can only run one invocation at a time, so the
+    engine keeps a small pool of interpreters, each using num_threads
+    threads. Quantized int8 inputs and outputs are converted to and from
+    float32 transparently.
+    """
+
+    def __init__(self, model_path, num_threads=None, pool_size=2):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+            interpreter.allocate_tensors()
+            self._pool.put({'interpreter': interpreter, 'batch_size': None})
+
+    @property
+    def size_bytes(self):
+        return os.path.getsize(self.model_path)
+
+    def _run(self, slot, batch):
+        interpreter = slot['interpreter']
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+
+        if slot['batch_size'] != len(batch):
+            interpreter.resize_tensor_input(input_details['index'], [len(batch)] + list(batch.shape[1:]))
+            interpreter.allocate_tensors()
+            slot['batch_size'] = len(batch)
+            input_details = interpreter.get_input_details()[0]
+            output_details = interpreter.get_output_details()[0]
+
+        if input_details['dtype'] == np.int8:
+            scale, zero_point = input_details['quantization']
+            batch = np.clip(np.round(batch / scale + zero_point), -128, 127).astype(np.int8)
+        interpreter.set_tensor(input_details['index'], batch.astype(input_details['dtype'], copy=False))
+        interpreter.invoke()
+
+        output = interpreter.get_tensor(output_details['index'])
+        if output_details['dtype'] == np.int8:
+            scale, zero_point = output_details['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return np.array(output, dtype=np.float32)
+
+    def predict(self, batch):
+        """Return model outputs for a float32 batch of preprocessed inputs"""
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        slot = self._pool.get()
+        try:
+            return self._run(slot, batch)
+        finally:
+            self._pool.put(slot)
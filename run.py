@@ -1,6 +1,7 @@
-from app import app, db
-
+# Worker processes are spawned and re-import this module as __mp_main__;
+# they must not import the app
 if __name__ == '__main__':
+    from app import app, db
     try:
         with app.app_context():
             db.create_all()